@@ -0,0 +1,273 @@
+#!/usr/bin/env python3
+"""
+Benchmark de la GRC API y del CTI fetcher con stand-ins locales de Ollama y Qdrant
+
+Reproduce alertas Wazuh grabadas (mismo cuerpo que envía el flujo n8n) a una tasa
+configurable y reporta p50/p95/p99 y peticiones/s por endpoint, más docs/s de un
+ciclo del fetcher. Los resultados se guardan en JSON para comparar regresiones.
+
+Uso:
+    python bench/run_bench.py --rate 5 --duration 20
+    python bench/run_bench.py --compare bench/results/baseline.json
+"""
+
+import argparse
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import requests
+
+from stubs import OllamaStub, QdrantStub, seed_grc_controls, serve
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+GRC_SCRIPTS = os.path.join(REPO_DIR, "grc", "scripts")
+CTI_DIR = os.path.join(REPO_DIR, "cti_fetcher")
+DEFAULT_ALERTS = os.path.join(BENCH_DIR, "alerts.jsonl")
+DEFAULT_RESULTS = os.path.join(BENCH_DIR, "results")
+ENDPOINTS = ("map-alert", "map-alerts", "search", "gap-analysis")
+
+
+def percentile(values: list, pct: float) -> float:
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def load_alerts(path: str) -> list:
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def request_for(endpoint: str, alerts: list, i: int, batch_size: int) -> tuple:
+    """(ruta, cuerpo) de la i-ésima petición de cada endpoint"""
+    alert = alerts[i % len(alerts)]
+    if endpoint == "map-alert":
+        return "/api/grc/map-alert", alert
+    if endpoint == "map-alerts":
+        batch = [alerts[(i * batch_size + j) % len(alerts)] for j in range(batch_size)]
+        return "/api/grc/map-alerts", {"alerts": batch}
+    if endpoint == "search":
+        return "/api/grc/search", {"query": alert["rule_description"], "limit": 5}
+    return "/api/grc/gap-analysis", {"implemented_controls": ["ISO-A.5.1", "ISO-A.8.5", "NIST-AC-2"]}
+
+
+def run_endpoint(api_url: str, endpoint: str, alerts: list, rate: float, duration: float,
+                 concurrency: int, batch_size: int) -> dict:
+    """
+    Carga en lazo abierto: la petición i se agenda en t0 + i/rate y su latencia se mide
+    desde ese instante (incluye la espera si el servidor se atrasa)
+    """
+    total = max(1, int(rate * duration))
+    latencies = []
+    errors = []
+    lock = threading.Lock()
+    local = threading.local()
+
+    def fire(i: int, scheduled: float):
+        delay = scheduled - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        if not hasattr(local, "session"):
+            local.session = requests.Session()
+        path, body = request_for(endpoint, alerts, i, batch_size)
+        try:
+            response = local.session.post(f"{api_url}{path}", json=body, timeout=300)
+            ok = response.status_code < 500
+        except Exception:
+            ok = False
+        elapsed = time.perf_counter() - scheduled
+        with lock:
+            (latencies if ok else errors).append(elapsed)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for i in range(total):
+            executor.submit(fire, i, start + i / rate)
+    wall = time.perf_counter() - start
+
+    return {
+        "requests": total,
+        "errors": len(errors),
+        "rps": round(len(latencies) / wall, 2) if wall else 0.0,
+        "alerts_per_s": round(len(latencies) * (batch_size if endpoint == "map-alerts" else 1) / wall, 2),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 2)
+    }
+
+
+def run_fetcher_cycle(qdrant_port: int, ollama_port: int, docs: int) -> dict:
+    """Mide docs/s de process_and_store (embedding + upsert) con documentos sintéticos"""
+    sys.path.insert(0, CTI_DIR)
+    import cti_fetcher
+
+    qdrant = cti_fetcher.QdrantClient("127.0.0.1", qdrant_port)
+    ollama = cti_fetcher.OllamaClient("127.0.0.1", ollama_port)
+    qdrant.create_collection(cti_fetcher.COLLECTION_NAME, cti_fetcher.VECTOR_SIZE)
+    documents = [
+        {
+            "id": f"{i:032x}",
+            "source": "bench",
+            "title": f"Synthetic technique {i}",
+            "content": f"MITRE ATT&CK T{1000 + i % 600}: synthetic technique {i} for throughput testing",
+            "metadata": {"n": i}
+        }
+        for i in range(docs)
+    ]
+    start = time.perf_counter()
+    stored = cti_fetcher.process_and_store(qdrant, ollama, documents)
+    elapsed = time.perf_counter() - start
+    return {"documents": docs, "stored": stored, "seconds": round(elapsed, 3),
+            "docs_per_s": round(stored / elapsed, 2) if elapsed else 0.0}
+
+
+# Estado de la API (SQLite, logs, tabla, snapshot): todo dentro del workdir del benchmark
+STATE_PATHS = {
+    "GRC_JOBS_DB": "grc_jobs.db",
+    "GRC_INVENTORY_DB": "grc_inventory.db",
+    "GRC_SEEN_RULES_DB": "grc_seen_rules.db",
+    "GRC_MAPPING_TABLE_PATH": "grc_mappings.json",
+    "GRC_TRIAGE_DB": "grc_triage.db",
+    "GRC_TRIAGE_LOG": "grc_triage.jsonl",
+    "GRC_INCIDENTS_DB": "grc_incidents.db",
+    "GRC_INGEST_LOG_DIR": "grc_ingest_log",
+    "GRC_NOTIFY_LOG_DIR": "grc_notify_log",
+    "GRC_SNAPSHOT_PATH": "grc_catalog.snap",
+}
+
+
+def start_api(qdrant_url: str, ollama_url: str, port: int, workdir: str) -> subprocess.Popen:
+    """API local con cwd en workdir: ninguna ruta relativa toca el estado de grc/scripts"""
+    env = dict(os.environ, QDRANT_URL=qdrant_url, OLLAMA_URL=ollama_url,
+               PYTHONPATH=os.pathsep.join(filter(None, [GRC_SCRIPTS, os.environ.get("PYTHONPATH")])),
+               **{name: os.path.join(workdir, filename) for name, filename in STATE_PATHS.items()})
+    process = subprocess.Popen(
+        [sys.executable, "-c",
+         f"import grc_api; grc_api.app.run(host='127.0.0.1', port={port}, threaded=True)"],
+        cwd=workdir, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    for _ in range(100):
+        try:
+            if requests.get(f"http://127.0.0.1:{port}/health", timeout=1).ok:
+                return process
+        except requests.RequestException:
+            time.sleep(0.2)
+    process.kill()
+    raise RuntimeError("La GRC API no respondió a /health")
+
+
+def compare(current: dict, baseline: dict, threshold: float) -> list:
+    """Regresiones: p95 que empeora o rps que cae más que el umbral relativo"""
+    regressions = []
+    for endpoint, result in current["endpoints"].items():
+        base = baseline.get("endpoints", {}).get(endpoint)
+        if not base:
+            continue
+        if base["p95_ms"] and result["p95_ms"] > base["p95_ms"] * (1 + threshold):
+            regressions.append(f"{endpoint}: p95 {base['p95_ms']}ms → {result['p95_ms']}ms")
+        if base["rps"] and result["rps"] < base["rps"] * (1 - threshold):
+            regressions.append(f"{endpoint}: rps {base['rps']} → {result['rps']}")
+    base_fetcher = baseline.get("fetcher", {}).get("docs_per_s")
+    fetcher = current.get("fetcher", {}).get("docs_per_s")
+    if base_fetcher and fetcher is not None and fetcher < base_fetcher * (1 - threshold):
+        regressions.append(f"fetcher: docs/s {base_fetcher} → {fetcher}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark GRC API / CTI fetcher con stand-ins locales")
+    parser.add_argument("--api-url", help="API ya desplegada (por defecto se lanza una local)")
+    parser.add_argument("--endpoints", default=",".join(ENDPOINTS))
+    parser.add_argument("--alerts", default=DEFAULT_ALERTS, help="Alertas grabadas (JSONL)")
+    parser.add_argument("--rate", type=float, default=5.0, help="peticiones/s por endpoint")
+    parser.add_argument("--duration", type=float, default=10.0, help="segundos por endpoint")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--batch-size", type=int, default=16, help="alertas por petición en map-alerts")
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--embed-latency", type=float, default=0.01)
+    parser.add_argument("--generate-latency", type=float, default=0.5)
+    parser.add_argument("--search-latency", type=float, default=0.0)
+    parser.add_argument("--fetcher-docs", type=int, default=200, help="0 desactiva el ciclo del fetcher")
+    parser.add_argument("--results-dir", default=DEFAULT_RESULTS)
+    parser.add_argument("--compare", help="JSON de resultados previo para detectar regresiones")
+    parser.add_argument("--threshold", type=float, default=0.2, help="tolerancia relativa de regresión")
+    args = parser.parse_args()
+
+    alerts = load_alerts(args.alerts)
+    ollama = OllamaStub(args.dim, args.embed_latency, args.generate_latency)
+    qdrant = QdrantStub(args.search_latency)
+    seed_grc_controls(qdrant, args.dim)
+    ollama_port = serve(ollama.handler(), 0).server_address[1]
+    qdrant_port = serve(qdrant.handler(), 0).server_address[1]
+
+    api_process = None
+    workdir = tempfile.mkdtemp(prefix="grc-bench-")
+    api_url = args.api_url
+    if not api_url:
+        port = free_port()
+        api_process = start_api(f"http://127.0.0.1:{qdrant_port}", f"http://127.0.0.1:{ollama_port}",
+                                port, workdir)
+        api_url = f"http://127.0.0.1:{port}"
+
+    print("=" * 60)
+    print(f"⏱️  GRC Benchmark - {args.rate} req/s × {args.duration}s por endpoint")
+    print("=" * 60)
+
+    results = {
+        "timestamp": datetime.now().isoformat(),
+        "config": {k: v for k, v in vars(args).items() if k not in ("compare", "results_dir")},
+        "endpoints": {},
+        "fetcher": {}
+    }
+    try:
+        for endpoint in [e for e in args.endpoints.split(",") if e]:
+            result = run_endpoint(api_url, endpoint, alerts, args.rate, args.duration,
+                                  args.concurrency, args.batch_size)
+            results["endpoints"][endpoint] = result
+            print(f"  {endpoint:14s} rps={result['rps']:7.2f}  p50={result['p50_ms']:8.1f}ms  "
+                  f"p95={result['p95_ms']:8.1f}ms  p99={result['p99_ms']:8.1f}ms  errors={result['errors']}")
+    finally:
+        if api_process:
+            api_process.terminate()
+
+    if args.fetcher_docs:
+        results["fetcher"] = run_fetcher_cycle(qdrant_port, ollama_port, args.fetcher_docs)
+        print(f"  {'fetcher':14s} docs/s={results['fetcher']['docs_per_s']:.2f} "
+              f"({results['fetcher']['stored']} docs en {results['fetcher']['seconds']}s)")
+
+    os.makedirs(args.results_dir, exist_ok=True)
+    path = os.path.join(args.results_dir, f"bench-{datetime.now().strftime('%Y%m%d-%H%M%S')}.json")
+    with open(path, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"\n💾 Resultados: {path}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(results, json.load(f), args.threshold)
+        if regressions:
+            print("❌ Regresiones detectadas:")
+            for r in regressions:
+                print(f"   - {r}")
+            sys.exit(1)
+        print("✅ Sin regresiones respecto a la línea base")
+
+
+if __name__ == "__main__":
+    main()
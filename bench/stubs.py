@@ -0,0 +1,321 @@
+#!/usr/bin/env python3
+"""
+Stand-ins locales de Ollama y Qdrant para benchmarks
+- Ollama: embeddings deterministas (hash de tokens) y generación con latencia configurable
+- Qdrant: colecciones en memoria con search, search/batch, scroll, retrieve y upsert
+- Telegram: sendMessage con límite por chat (429 + retry_after como la Bot API)
+"""
+
+import argparse
+import hashlib
+import json
+import math
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List
+
+GRC_SCRIPTS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "grc", "scripts")
+
+
+def deterministic_vector(text: str, dim: int) -> List[float]:
+    """Bag-of-words con hashing: textos parecidos → vectores parecidos, siempre iguales"""
+    vector = [0.0] * dim
+    for token in text.lower().split():
+        digest = int(hashlib.md5(token.encode()).hexdigest(), 16)
+        vector[digest % dim] += 1.0 if (digest >> 64) & 1 else -1.0
+    norm = math.sqrt(sum(x * x for x in vector)) or 1.0
+    return [x / norm for x in vector]
+
+
+class JSONHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def read_json(self) -> dict:
+        length = int(self.headers.get("Content-Length", 0))
+        return json.loads(self.rfile.read(length) or b"{}") if length else {}
+
+    def send_json(self, obj, status: int = 200):
+        body = json.dumps(obj).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class OllamaStub:
+    """Ollama falso: /api/embed, /api/embeddings, /api/generate"""
+
+    def __init__(self, dim: int = 768, embed_latency: float = 0.01, generate_latency: float = 0.5):
+        self.dim = dim
+        self.embed_latency = embed_latency
+        self.generate_latency = generate_latency
+        self.calls: Dict[str, int] = {}
+
+    def handler(self):
+        stub = self
+
+        class Handler(JSONHandler):
+            def do_GET(self):
+                self.send_json({"status": "Ollama is running"})
+
+            def do_POST(self):
+                body = self.read_json()
+                stub.calls[self.path] = stub.calls.get(self.path, 0) + 1
+                if self.path == "/api/embed":
+                    inputs = body.get("input", "")
+                    inputs = [inputs] if isinstance(inputs, str) else inputs
+                    time.sleep(stub.embed_latency)
+                    return self.send_json({
+                        "model": body.get("model"),
+                        "embeddings": [deterministic_vector(t, stub.dim) for t in inputs],
+                        "load_duration": 0
+                    })
+                if self.path == "/api/embeddings":
+                    time.sleep(stub.embed_latency)
+                    return self.send_json({"embedding": deterministic_vector(body.get("prompt", ""), stub.dim)})
+                if self.path in ("/api/generate", "/api/chat"):
+                    prompt = body.get("prompt") or json.dumps(body.get("messages", []))
+                    num_predict = body.get("options", {}).get("num_predict", 256)
+                    # Latencia proporcional a los tokens pedidos (CPU inference)
+                    latency = stub.generate_latency * min(1.0, num_predict / 256) if prompt else 0
+                    time.sleep(latency)
+                    text = "Reporte de cumplimiento (stand-in)."
+                    if body.get("format") == "json":
+                        text = json.dumps({"soc_analysis": text, "compliance_report": text})
+                    result = {
+                        "model": body.get("model"),
+                        "done": True,
+                        "load_duration": 0,
+                        "prompt_eval_count": len(prompt) // 4,
+                        "eval_count": min(num_predict, 200),
+                        "eval_duration": int(latency * 1e9)
+                    }
+                    if self.path == "/api/chat":
+                        result["message"] = {"role": "assistant", "content": text}
+                    else:
+                        result["response"] = text
+                    return self.send_json(result)
+                self.send_json({"error": "not found"}, 404)
+
+        return Handler
+
+
+class QdrantStub:
+    """Qdrant falso en memoria (distancia coseno, filtros 'must' por igualdad)"""
+
+    def __init__(self, search_latency: float = 0.0):
+        self.search_latency = search_latency
+        self.collections: Dict[str, Dict] = {}
+        self.lock = threading.Lock()
+
+    def upsert(self, collection: str, points: List[Dict]):
+        with self.lock:
+            store = self.collections.setdefault(collection, {})
+            for point in points:
+                store[str(point["id"])] = point
+
+    @staticmethod
+    def _matches(payload: dict, flt: dict) -> bool:
+        for cond in (flt or {}).get("must", []):
+            value = payload.get(cond["key"])
+            match = cond.get("match", {})
+            if "value" in match and value != match["value"]:
+                return False
+            if "any" in match and value not in match["any"]:
+                return False
+        return True
+
+    def search(self, collection: str, body: dict) -> List[Dict]:
+        time.sleep(self.search_latency)
+        query = body["vector"]
+        if isinstance(query, dict):
+            query = query.get("vector", [])
+        points = [p for p in self.collections.get(collection, {}).values()
+                  if self._matches(p.get("payload", {}), body.get("filter"))]
+        scored = [
+            {"id": p["id"], "version": 0,
+             "score": sum(a * b for a, b in zip(query, p["vector"])),
+             "payload": p.get("payload") if body.get("with_payload") else None}
+            for p in points
+        ]
+        scored.sort(key=lambda r: -r["score"])
+        return scored[:body.get("limit", 10)]
+
+    def handler(self):
+        stub = self
+
+        class Handler(JSONHandler):
+            def do_GET(self):
+                parts = self.path.strip("/").split("/")
+                if len(parts) == 2 and parts[0] == "collections":
+                    if parts[1] in stub.collections:
+                        return self.send_json({"result": {"points_count": len(stub.collections[parts[1]])}})
+                    return self.send_json({"status": {"error": "Not found"}}, 404)
+                if len(parts) == 4 and parts[2] == "points":
+                    point = stub.collections.get(parts[1], {}).get(parts[3])
+                    if point:
+                        return self.send_json({"result": {"id": point["id"], "payload": point.get("payload")}})
+                    return self.send_json({"status": {"error": "Not found"}}, 404)
+                self.send_json({"title": "qdrant stand-in"})
+
+            def do_PUT(self):
+                body = self.read_json()
+                parts = self.path.split("?")[0].strip("/").split("/")
+                if len(parts) == 2:
+                    stub.collections.setdefault(parts[1], {})
+                    return self.send_json({"result": True})
+                if parts[-1] == "points":
+                    stub.upsert(parts[1], body.get("points", []))
+                    return self.send_json({"result": {"status": "completed"}})
+                self.send_json({"result": True})
+
+            def do_DELETE(self):
+                parts = self.path.strip("/").split("/")
+                stub.collections.pop(parts[-1], None)
+                self.send_json({"result": True})
+
+            def do_POST(self):
+                body = self.read_json()
+                parts = self.path.split("?")[0].strip("/").split("/")
+                collection = parts[1] if len(parts) > 1 else ""
+                action = "/".join(parts[2:])
+                if action == "points/search":
+                    return self.send_json({"result": stub.search(collection, body)})
+                if action == "points/search/batch":
+                    return self.send_json({"result": [stub.search(collection, s) for s in body["searches"]]})
+                if action == "points/scroll":
+                    points = sorted(stub.collections.get(collection, {}).values(), key=lambda p: str(p["id"]))
+                    points = [p for p in points if stub._matches(p.get("payload", {}), body.get("filter"))]
+                    offset = int(body.get("offset") or 0)
+                    limit = body.get("limit", 10)
+                    page = points[offset:offset + limit]
+                    next_offset = offset + limit if offset + limit < len(points) else None
+                    return self.send_json({"result": {
+                        "points": [
+                            {"id": p["id"], "payload": p.get("payload"),
+                             **({"vector": p["vector"]} if body.get("with_vector") else {})}
+                            for p in page
+                        ],
+                        "next_page_offset": next_offset
+                    }})
+                if action == "points":
+                    store = stub.collections.get(collection, {})
+                    found = [store[str(i)] for i in body.get("ids", []) if str(i) in store]
+                    return self.send_json({"result": [
+                        {"id": p["id"], "payload": p.get("payload"),
+                         **({"vector": p["vector"]} if body.get("with_vector") else {})}
+                        for p in found
+                    ]})
+                self.send_json({"status": {"error": "Not found"}}, 404)
+
+        return Handler
+
+
+class TelegramStub:
+    """
+    Bot API falsa: /bot<token>/sendMessage. Más de per_chat_per_second mensajes a un
+    chat en el último segundo → 429 con retry_after. GET /messages lista lo recibido.
+    """
+
+    def __init__(self, per_chat_per_second: int = 1, retry_after: int = 1):
+        self.per_chat_per_second = per_chat_per_second
+        self.retry_after = retry_after
+        self.messages: List[Dict] = []
+        self.rejected = 0
+        self.recent: Dict[str, List[float]] = {}
+        self.lock = threading.Lock()
+
+    def send_message(self, body: dict):
+        chat_id = str(body.get("chat_id"))
+        now = time.monotonic()
+        with self.lock:
+            recent = [t for t in self.recent.get(chat_id, []) if now - t < 1.0]
+            if len(recent) >= self.per_chat_per_second:
+                self.rejected += 1
+                self.recent[chat_id] = recent
+                return 429, {"ok": False, "error_code": 429,
+                             "description": f"Too Many Requests: retry after {self.retry_after}",
+                             "parameters": {"retry_after": self.retry_after}}
+            recent.append(now)
+            self.recent[chat_id] = recent
+            message = {"message_id": len(self.messages) + 1, "chat": {"id": chat_id},
+                       "date": int(time.time()), "text": body.get("text", "")}
+            self.messages.append(message)
+        return 200, {"ok": True, "result": message}
+
+    def handler(self):
+        stub = self
+
+        class Handler(JSONHandler):
+            def do_GET(self):
+                if self.path == "/messages":
+                    with stub.lock:
+                        return self.send_json({"messages": stub.messages, "rejected": stub.rejected})
+                self.send_json({"ok": True, "result": {"username": "grc_stand_in_bot"}})
+
+            def do_POST(self):
+                body = self.read_json()
+                if self.path.startswith("/bot") and self.path.endswith("/sendMessage"):
+                    status, result = stub.send_message(body)
+                    return self.send_json(result, status)
+                self.send_json({"ok": False, "error_code": 404, "description": "Not Found"}, 404)
+
+        return Handler
+
+
+def seed_grc_controls(qdrant: QdrantStub, dim: int, collection: str = "grc_controls"):
+    """Indexa el catálogo real con los mismos embeddings deterministas del stand-in"""
+    sys.path.insert(0, GRC_SCRIPTS)
+    from index_grc_controls import ISO_27001_CONTROLS, NIST_800_53_CONTROLS
+
+    points = []
+    for i, control in enumerate(ISO_27001_CONTROLS + NIST_800_53_CONTROLS):
+        text = f"{control['id']} {control['name']} {control['description']} {control['implementation_guidance']}"
+        points.append({"id": i, "vector": deterministic_vector(text, dim), "payload": control})
+    qdrant.upsert(collection, points)
+    return len(points)
+
+
+def serve(handler, port: int) -> ThreadingHTTPServer:
+    server = ThreadingHTTPServer(("127.0.0.1", port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stand-ins locales de Ollama, Qdrant y Telegram")
+    parser.add_argument("--ollama-port", type=int, default=11434)
+    parser.add_argument("--qdrant-port", type=int, default=6333)
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--embed-latency", type=float, default=0.01, help="segundos por llamada de embedding")
+    parser.add_argument("--generate-latency", type=float, default=0.5, help="segundos por generación (256 tokens)")
+    parser.add_argument("--search-latency", type=float, default=0.0)
+    parser.add_argument("--telegram-port", type=int, default=8081,
+                        help="Bot API falsa (GRC_TELEGRAM_API_URL=http://127.0.0.1:<puerto>)")
+    args = parser.parse_args()
+
+    ollama = OllamaStub(args.dim, args.embed_latency, args.generate_latency)
+    qdrant = QdrantStub(args.search_latency)
+    seeded = seed_grc_controls(qdrant, args.dim)
+    serve(ollama.handler(), args.ollama_port)
+    serve(qdrant.handler(), args.qdrant_port)
+    serve(TelegramStub().handler(), args.telegram_port)
+    print(f"[OK] Ollama stand-in :{args.ollama_port} | Qdrant stand-in :{args.qdrant_port} ({seeded} controles)"
+          f" | Telegram stand-in :{args.telegram_port}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,217 @@
+#!/usr/bin/env python3
+"""
+=============================================================================
+CTI API - Consultas exactas sobre los feeds descargados
+=============================================================================
+Servidor HTTP mínimo (stdlib) que arranca junto al fetcher:
+
+  GET  /health
+  GET  /api/ioc/sha256/<hash>          → {"sha256", "known", "signature"}
+  POST /api/ioc/sha256 {"hashes": [...]} → resultados en el mismo orden
+  GET  /api/ioc/stats
+  GET  /api/cve/<CVE-ID>
+  GET  /api/cve?severity=&min_score=&max_score=&published_from=&published_to=
+              &modified_from=&modified_to=&cwe=&order_by=&limit=&offset=
+  POST /api/cve/lookup {"ids": [...]}
+  GET  /api/cve/stats
+
+El índice IOC se abre con mmap y se recarga cuando el fetcher publica uno nuevo;
+el almacén de CVEs es el SQLite (WAL) que rellena la sincronización del NVD.
+=============================================================================
+"""
+
+import json
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+from urllib.parse import parse_qs, urlsplit
+
+from cve_store import CveStore
+from ioc_index import IocIndexHolder, parse_sha256
+
+CTI_DATA_DIR = os.getenv('CTI_DATA_DIR', 'data')
+IOC_INDEX_PATH = os.getenv('IOC_INDEX_PATH', os.path.join(CTI_DATA_DIR, 'ioc_sha256.idx'))
+IOC_BULK_MAX = int(os.getenv('IOC_BULK_MAX', 10000))
+CVE_DB_PATH = os.getenv('CVE_DB_PATH', os.path.join(CTI_DATA_DIR, 'cves.db'))
+CVE_BULK_MAX = int(os.getenv('CVE_BULK_MAX', 1000))
+
+ioc_holder = IocIndexHolder(IOC_INDEX_PATH)
+_cve_store: Optional[CveStore] = None
+_cve_store_lock = threading.Lock()
+
+
+def get_cve_store() -> CveStore:
+    global _cve_store
+    with _cve_store_lock:
+        if _cve_store is None:
+            os.makedirs(os.path.dirname(CVE_DB_PATH) or '.', exist_ok=True)
+            _cve_store = CveStore(CVE_DB_PATH)
+        return _cve_store
+
+
+def cve_query(params: Dict[str, List[str]]) -> Dict:
+    """Query string → filtros de CveStore.query (ValueError/OverflowError si un número no es válido)"""
+    def first(name: str) -> Optional[str]:
+        return params.get(name, [None])[0] or None
+
+    def number(name: str) -> Optional[float]:
+        value = first(name)
+        return float(value) if value is not None else None
+
+    def integer(name: str, default: int) -> int:
+        # limit=0 es válido (sólo total): se compara con None, no por falsedad
+        value = number(name)
+        return int(value) if value is not None else default
+
+    severity = [s for v in params.get('severity', []) for s in v.split(',') if s.strip()]
+    return get_cve_store().query(
+        severity=[s.strip() for s in severity] or None,
+        min_score=number('min_score'),
+        max_score=number('max_score'),
+        published_from=first('published_from'),
+        published_to=first('published_to'),
+        modified_from=first('modified_from'),
+        modified_to=first('modified_to'),
+        cwe=first('cwe'),
+        order_by=first('order_by') or 'published',
+        limit=integer('limit', 100),
+        offset=integer('offset', 0)
+    )
+
+
+def lookup_hashes(hashes: List[str]) -> List[Dict]:
+    index = ioc_holder.get()
+    results = []
+    for value in hashes:
+        digest = parse_sha256(value)
+        if digest is None:
+            results.append({"sha256": value, "known": False, "error": "invalid sha256"})
+            continue
+        known, signature = index.lookup(digest) if index is not None else (False, None)
+        results.append({"sha256": value.strip().lower(), "known": known, "signature": signature})
+    return results
+
+
+class CtiApiHandler(BaseHTTPRequestHandler):
+    server_version = "CTI-API/1.0"
+
+    def log_message(self, format, *args):
+        pass  # Sin log por petición: el endpoint de IOC es de alto volumen
+
+    def _send_json(self, status: int, body: Dict):
+        payload = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        path = url.path.rstrip("/")
+        if path == "/health":
+            index = ioc_holder.get()
+            self._send_json(200, {"status": "healthy", "ioc_index": index is not None})
+        elif path == "/api/ioc/stats":
+            self._send_json(200, ioc_stats())
+        elif path.startswith("/api/ioc/sha256/"):
+            started = time.perf_counter()
+            result = lookup_hashes([path.rsplit("/", 1)[1]])[0]
+            result["elapsed_us"] = round((time.perf_counter() - started) * 1e6, 1)
+            self._send_json(400 if "error" in result else 200, result)
+        elif path == "/api/cve/stats":
+            self._send_json(200, get_cve_store().stats())
+        elif path == "/api/cve":
+            try:
+                self._send_json(200, cve_query(parse_qs(url.query)))
+            except (ValueError, OverflowError) as e:
+                # limit=inf → OverflowError en int()
+                self._send_json(400, {"error": f"Invalid parameter: {e}"})
+        elif path.startswith("/api/cve/"):
+            record = get_cve_store().get(path.rsplit("/", 1)[1])
+            if record is None:
+                self._send_json(404, {"error": "CVE not found"})
+            else:
+                self._send_json(200, record)
+        else:
+            self._send_json(404, {"error": "Not found"})
+
+    def _read_json(self) -> Optional[Dict]:
+        try:
+            length = int(self.headers.get("Content-Length") or 0)
+            body = json.loads(self.rfile.read(length) or b"{}")
+        except ValueError:
+            return None
+        return body if isinstance(body, dict) else None
+
+    def do_POST(self):
+        path = urlsplit(self.path).path.rstrip("/")
+        if path == "/api/cve/lookup":
+            self._cve_lookup()
+            return
+        if path != "/api/ioc/sha256":
+            self._send_json(404, {"error": "Not found"})
+            return
+        hashes = (self._read_json() or {}).get("hashes")
+        if not isinstance(hashes, list):
+            self._send_json(400, {"error": "hashes (list) required"})
+            return
+        if len(hashes) > IOC_BULK_MAX:
+            self._send_json(400, {"error": f"max {IOC_BULK_MAX} hashes per request"})
+            return
+        started = time.perf_counter()
+        results = lookup_hashes(hashes)
+        self._send_json(200, {
+            "results": results,
+            "known": sum(1 for r in results if r["known"]),
+            "elapsed_us": round((time.perf_counter() - started) * 1e6, 1)
+        })
+
+    def _cve_lookup(self):
+        ids = (self._read_json() or {}).get("ids")
+        if not isinstance(ids, list) or not all(isinstance(i, str) for i in ids):
+            self._send_json(400, {"error": "ids (list of strings) required"})
+            return
+        if len(ids) > CVE_BULK_MAX:
+            self._send_json(400, {"error": f"max {CVE_BULK_MAX} ids per request"})
+            return
+        found = get_cve_store().get_many(ids)
+        self._send_json(200, {
+            "results": {i: found.get(i.upper()) for i in ids},
+            "found": len(found),
+            "missing": [i for i in ids if i.upper() not in found]
+        })
+
+
+def ioc_stats() -> Dict:
+    index = ioc_holder.get()
+    if index is None:
+        return {"path": IOC_INDEX_PATH, "loaded": False}
+    return {
+        "path": IOC_INDEX_PATH,
+        "loaded": True,
+        "hashes": index.count,
+        "signatures": len(index.signatures),
+        "bloom_bits": index.bloom_bits,
+        "bloom_k": index.bloom_k,
+        "built_at": index.built_at
+    }
+
+
+def start_api_server(port: int, host: str = "0.0.0.0") -> ThreadingHTTPServer:
+    """Arranca la API en un hilo daemon"""
+    server = ThreadingHTTPServer((host, port), CtiApiHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="cti-api", daemon=True).start()
+    print(f"[INFO] CTI API listening on {host}:{port}")
+    return server
+
+
+if __name__ == "__main__":
+    port = int(os.getenv('CTI_API_PORT', 8090))
+    print(f"🔎 CTI API (IOC index: {IOC_INDEX_PATH}, CVE store: {CVE_DB_PATH})")
+    server = ThreadingHTTPServer(("0.0.0.0", port), CtiApiHandler)
+    server.daemon_threads = True
+    server.serve_forever()
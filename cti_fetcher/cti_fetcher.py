@@ -20,10 +20,15 @@ import os
 import json
 import time
 import hashlib
+import heapq
 import requests
 from datetime import datetime, timedelta
 from typing import List, Dict, Any, Optional
 
+from cti_api import start_api_server
+from cve_store import CveStore, parse_nvd_cve
+from ioc_index import update_index
+
 # Configuración
 QDRANT_HOST = os.getenv('QDRANT_HOST', 'localhost')
 QDRANT_PORT = int(os.getenv('QDRANT_PORT', 6333))
@@ -33,6 +38,23 @@ UPDATE_INTERVAL = int(os.getenv('UPDATE_INTERVAL_HOURS', 6)) * 3600
 EMBEDDING_MODEL = 'nomic-embed-text'
 COLLECTION_NAME = 'threat_intelligence'
 VECTOR_SIZE = 768
+CTI_DATA_DIR = os.getenv('CTI_DATA_DIR', 'data')
+IOC_INDEX_PATH = os.getenv('IOC_INDEX_PATH', os.path.join(CTI_DATA_DIR, 'ioc_sha256.idx'))
+# Muestras de Abuse.ch que además se embeben en Qdrant (0 = todas); el índice IOC recibe el export completo
+ABUSE_CH_EMBED_LIMIT = int(os.getenv('ABUSE_CH_EMBED_LIMIT', 30))
+CTI_API_PORT = int(os.getenv('CTI_API_PORT', 8090))
+CVE_DB_PATH = os.getenv('CVE_DB_PATH', os.path.join(CTI_DATA_DIR, 'cves.db'))
+NVD_API_URL = os.getenv('NVD_API_URL', 'https://services.nvd.nist.gov/rest/json/cves/2.0')
+NVD_API_KEY = os.getenv('NVD_API_KEY', '')
+# Sin almacén local sólo se consultan los CVEs modificados en los últimos días
+NVD_INITIAL_DAYS = int(os.getenv('NVD_INITIAL_DAYS', 7))
+NVD_PAGE_SIZE = int(os.getenv('NVD_PAGE_SIZE', 2000))
+# Límite público del NVD: 5 peticiones / 30 s sin API key, 50 con ella
+NVD_PAGE_DELAY = float(os.getenv('NVD_PAGE_DELAY_SECONDS', 0.6 if NVD_API_KEY else 6))
+NVD_MAX_RANGE_DAYS = 120
+NVD_DATE_FORMAT = '%Y-%m-%dT%H:%M:%S.000'
+# CVEs (los más recientes) que además se embeben en Qdrant (0 = todos)
+NVD_EMBED_LIMIT = int(os.getenv('NVD_EMBED_LIMIT', 50))
 
 print("=" * 60)
 print("CTI FETCHER - SOAR-AI Platform")
@@ -189,53 +211,124 @@ def fetch_mitre_atlas() -> List[Dict]:
         print(f"[ERROR] Fetching MITRE ATLAS: {e}")
     return docs
 
-def fetch_nvd_cves() -> List[Dict]:
+def cve_document(record: Dict) -> Dict:
+    """Fila del almacén de CVEs → documento para Qdrant"""
+    cvss_score = record['score'] if record['score'] is not None else 'N/A'
+    content = f"CVE Vulnerability {record['cve_id']}. CVSS: {cvss_score} ({record['severity']}). {record['description'][:500]}"
+    return {
+        'id': hashlib.md5(f"cve_{record['cve_id']}".encode()).hexdigest(),
+        'source': 'nvd',
+        'title': f"{record['cve_id']} - {record['severity']}",
+        'content': content,
+        'metadata': {'cve_id': record['cve_id'], 'cvss': cvss_score, 'severity': record['severity']}
+    }
+
+def nvd_get(params: Dict) -> Dict:
+    """Una página de la API 2.0; reintenta ante límites de tasa (403/429) y 5xx"""
+    headers = {'apiKey': NVD_API_KEY} if NVD_API_KEY else {}
+    for attempt in range(5):
+        response = requests.get(NVD_API_URL, params=params, headers=headers, timeout=120)
+        if response.status_code in (403, 429) or response.status_code >= 500:
+            wait = NVD_PAGE_DELAY * (attempt + 2)
+            print(f"[INFO] NVD returned {response.status_code}, retrying in {wait:.0f}s...")
+            time.sleep(wait)
+            continue
+        response.raise_for_status()
+        return response.json()
+    raise RuntimeError(f"NVD unavailable (HTTP {response.status_code})")
+
+class NewestCves:
+    """Los limit CVEs más recientes (por published) de la sincronización, sin acumularla (0 = todos)"""
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.records: Dict[str, Dict] = {}
+        self.seen = 0
+        self._heap: List[tuple] = []
+
+    def add(self, record: Dict):
+        self.seen += 1
+        cve_id = record['cve_id']
+        if cve_id in self.records or self.limit <= 0:
+            # Un CVE modificado en el borde de dos ventanas llega dos veces: vale la última versión
+            self.records[cve_id] = record
+            return
+        key = (record['published'] or '', cve_id)
+        if len(self._heap) < self.limit:
+            heapq.heappush(self._heap, key)
+        elif key > self._heap[0]:
+            del self.records[heapq.heapreplace(self._heap, key)[1]]
+        else:
+            return
+        self.records[cve_id] = record
+
+    def documents(self) -> List[Dict]:
+        records = sorted(self.records.values(), key=lambda r: r['published'] or '', reverse=True)
+        return [cve_document(r) for r in records]
+
+def nvd_pages(params: Dict, start_index: int = 0):
+    """Recorre una consulta paginada → (CVEs de la página, siguiente startIndex)"""
+    while True:
+        data = nvd_get({**params, 'resultsPerPage': NVD_PAGE_SIZE, 'startIndex': start_index})
+        vulnerabilities = data.get('vulnerabilities', [])
+        start_index += len(vulnerabilities)
+        total = data.get('totalResults', 0)
+        print(f"[INFO] NVD: {start_index}/{total} CVEs")
+        yield [r for r in (parse_nvd_cve(v.get('cve', {})) for v in vulnerabilities) if r], start_index
+        if not vulnerabilities or start_index >= total:
+            return
+        time.sleep(NVD_PAGE_DELAY)
+
+def fetch_nvd_cves(store: Optional[CveStore] = None) -> List[Dict]:
+    """
+    Sincroniza el almacén local con el NVD: la primera vez descarga el catálogo completo
+    (reanudable por página), después sólo los CVEs modificados desde la última ejecución
+    (ventanas de 120 días como exige la API). Devuelve los más recientes como documentos
+    para Qdrant.
+    """
+    newest = NewestCves(NVD_EMBED_LIMIT)
+
+    def keep(page: List[Dict]):
+        if store:
+            store.upsert_many(page)
+        for record in page:
+            newest.add(record)
 
-    """Descarga CVEs recientes del NVD"""
-    docs = []
     try:
-        print("[INFO] Fetching NVD CVEs (last 7 days)...")
         end_date = datetime.utcnow()
-        start_date = end_date - timedelta(days=7)
-        
-        url = f"https://services.nvd.nist.gov/rest/json/cves/2.0?pubStartDate={start_date.strftime('%Y-%m-%dT00:00:00.000')}&pubEndDate={end_date.strftime('%Y-%m-%dT23:59:59.999')}"
-        
-        response = requests.get(url, timeout=120)
-        data = response.json()
-        
-        for vuln in data.get('vulnerabilities', [])[:50]:
-            cve = vuln.get('cve', {})
-            cve_id = cve.get('id', '')
-            
-            description = ''
-            for desc in cve.get('descriptions', []):
-                if desc.get('lang') == 'en':
-                    description = desc.get('value', '')[:500]
-                    break
-            
-            cvss_score = 'N/A'
-            severity = 'UNKNOWN'
-            metrics = cve.get('metrics', {})
-            if 'cvssMetricV31' in metrics:
-                cvss_data = metrics['cvssMetricV31'][0].get('cvssData', {})
-                cvss_score = cvss_data.get('baseScore', 'N/A')
-                severity = cvss_data.get('baseSeverity', 'UNKNOWN')
-            
-            content = f"CVE Vulnerability {cve_id}. CVSS: {cvss_score} ({severity}). {description}"
-            
-            docs.append({
-                'id': hashlib.md5(f"cve_{cve_id}".encode()).hexdigest(),
-                'source': 'nvd',
-                'title': f"{cve_id} - {severity}",
-                'content': content,
-                'metadata': {'cve_id': cve_id, 'cvss': cvss_score, 'severity': severity}
-            })
-        
-        print(f"[OK] Fetched {len(docs)} CVEs")
+        watermark = store.get_watermark('nvd_last_modified') if store else None
+        if store and not watermark:
+            # Almacén nuevo: todo el NVD sin filtro lastMod. El progreso se guarda por página
+            # y lo modificado durante el bootstrap entra en la siguiente sincronización
+            bootstrap = store.get_watermark('nvd_bootstrap')
+            state = json.loads(bootstrap) if bootstrap else {"started": end_date.strftime(NVD_DATE_FORMAT),
+                                                             "index": 0}
+            print(f"[INFO] Bootstrapping NVD CVE store (full catalog, from index {state['index']})...")
+            for page, next_index in nvd_pages({}, state['index']):
+                keep(page)
+                state['index'] = next_index
+                store.set_watermark('nvd_bootstrap', json.dumps(state))
+            end_date = datetime.strptime(state['started'], NVD_DATE_FORMAT)
+        else:
+            start_date = (datetime.strptime(watermark, NVD_DATE_FORMAT) if watermark
+                          else end_date - timedelta(days=NVD_INITIAL_DAYS))
+            print(f"[INFO] Fetching NVD CVEs modified since {start_date.strftime(NVD_DATE_FORMAT)}...")
+            window_start = start_date
+            while window_start < end_date:
+                window_end = min(window_start + timedelta(days=NVD_MAX_RANGE_DAYS), end_date)
+                for page, _ in nvd_pages({'lastModStartDate': window_start.strftime(NVD_DATE_FORMAT),
+                                          'lastModEndDate': window_end.strftime(NVD_DATE_FORMAT)}):
+                    keep(page)
+                window_start = window_end
+
+        # La marca sólo avanza si todas las páginas se guardaron: un fallo se reanuda en el próximo ciclo
+        if store:
+            store.set_watermark('nvd_last_modified', end_date.strftime(NVD_DATE_FORMAT))
+        print(f"[OK] Fetched {newest.seen} CVEs")
     except Exception as e:
         print(f"[ERROR] Fetching NVD CVEs: {e}")
-    return docs
 
+    return newest.documents()
 
 def fetch_abuse_ch() -> List[Dict]:
     """Descarga malware samples de Abuse.ch"""
@@ -246,9 +339,8 @@ def fetch_abuse_ch() -> List[Dict]:
         response = requests.get(url, timeout=60)
         data = response.json()
         
-        count = 0
         for sample in data.values():
-            if isinstance(sample, dict) and count < 30:
+            if isinstance(sample, dict):
                 sha256 = sample.get('sha256_hash', '')
                 signature = sample.get('signature', 'Unknown')
                 file_type = sample.get('file_type', 'Unknown')
@@ -263,13 +355,25 @@ def fetch_abuse_ch() -> List[Dict]:
                     'content': content,
                     'metadata': {'sha256': sha256, 'signature': signature, 'file_type': file_type}
                 })
-                count += 1
         
         print(f"[OK] Fetched {len(docs)} malware samples")
     except Exception as e:
         print(f"[ERROR] Fetching Abuse.ch: {e}")
     return docs
 
+
+def update_ioc_index(malware_docs: List[Dict]):
+    """Fusiona los hashes del export con el índice IOC exacto (persistente, mmap)"""
+    try:
+        os.makedirs(os.path.dirname(IOC_INDEX_PATH) or '.', exist_ok=True)
+        total, added = update_index(
+            IOC_INDEX_PATH,
+            ((d['metadata']['sha256'], d['metadata']['signature']) for d in malware_docs)
+        )
+        print(f"[OK] IOC index: {total} hashes ({added} new) at {IOC_INDEX_PATH}")
+    except Exception as e:
+        print(f"[ERROR] Updating IOC index: {e}")
+
 def process_and_store(qdrant: QdrantClient, ollama: OllamaClient, documents: List[Dict]) -> int:
 
     """Procesa documentos y los almacena en Qdrant"""
@@ -306,7 +410,7 @@ def process_and_store(qdrant: QdrantClient, ollama: OllamaClient, documents: Lis
     return stored
 
 
-def run_update_cycle(qdrant: QdrantClient, ollama: OllamaClient):
+def run_update_cycle(qdrant: QdrantClient, ollama: OllamaClient, cve_store: Optional[CveStore] = None):
     """Ejecuta un ciclo de actualización"""
     print("\n" + "=" * 60)
     print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] Starting CTI update cycle")
@@ -315,8 +419,10 @@ def run_update_cycle(qdrant: QdrantClient, ollama: OllamaClient):
     all_docs = []
     all_docs.extend(fetch_mitre_attack())
     all_docs.extend(fetch_mitre_atlas())
-    all_docs.extend(fetch_nvd_cves())
-    all_docs.extend(fetch_abuse_ch())
+    all_docs.extend(fetch_nvd_cves(cve_store))
+    malware_docs = fetch_abuse_ch()
+    update_ioc_index(malware_docs)
+    all_docs.extend(malware_docs[:ABUSE_CH_EMBED_LIMIT] if ABUSE_CH_EMBED_LIMIT > 0 else malware_docs)
     
     print(f"\n[INFO] Total documents to process: {len(all_docs)}")
     
@@ -331,6 +437,9 @@ def main():
     print(f"[INFO] Connecting to Qdrant at {QDRANT_HOST}:{QDRANT_PORT}")
     print(f"[INFO] Connecting to Ollama at {OLLAMA_HOST}:{OLLAMA_PORT}")
     
+    # API de consulta (índice IOC y CVEs) en segundo plano
+    start_api_server(CTI_API_PORT)
+    
     qdrant = QdrantClient(QDRANT_HOST, QDRANT_PORT)
     ollama = OllamaClient(OLLAMA_HOST, OLLAMA_PORT)
     
@@ -348,14 +457,17 @@ def main():
     # Crear colección
     qdrant.create_collection(COLLECTION_NAME, VECTOR_SIZE)
     
+    os.makedirs(os.path.dirname(CVE_DB_PATH) or '.', exist_ok=True)
+    cve_store = CveStore(CVE_DB_PATH)
+    
     # Primer ciclo
-    run_update_cycle(qdrant, ollama)
+    run_update_cycle(qdrant, ollama, cve_store)
     
     # Loop de actualización
     while True:
         print(f"\n[INFO] Next update in {UPDATE_INTERVAL // 3600} hours...")
         time.sleep(UPDATE_INTERVAL)
-        run_update_cycle(qdrant, ollama)
+        run_update_cycle(qdrant, ollama, cve_store)
 
 
 if __name__ == "__main__":
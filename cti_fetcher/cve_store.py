@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+"""
+=============================================================================
+CVE STORE - Almacén local de CVEs del NVD (SQLite)
+=============================================================================
+Consultar un CVE por ID o filtrar por CVSS no debe pasar por Qdrant. Cada
+sincronización con el NVD guarda aquí el registro completo:
+
+  cves      cve_id (PK), fechas de publicación/modificación, severidad,
+            score, vector CVSS, descripción, CWEs y referencias
+  índices   published, last_modified, (severity, score), score
+  sync      marcas de agua de la sincronización (lastModified)
+
+Las fechas se guardan en ISO 8601 (UTC, formato del NVD): el orden
+lexicográfico coincide con el cronológico y los rangos usan los índices.
+=============================================================================
+"""
+
+import json
+import sqlite3
+import threading
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional
+
+SEVERITIES = ('CRITICAL', 'HIGH', 'MEDIUM', 'LOW', 'NONE', 'UNKNOWN')
+CVSS_METRICS = ('cvssMetricV40', 'cvssMetricV31', 'cvssMetricV30', 'cvssMetricV2')
+QUERY_MAX_LIMIT = 1000
+
+
+def parse_nvd_cve(cve: Dict) -> Optional[Dict]:
+    """Objeto 'cve' de la API 2.0 del NVD → fila del almacén"""
+    cve_id = cve.get('id')
+    if not cve_id:
+        return None
+    description = next((d.get('value', '') for d in cve.get('descriptions', []) if d.get('lang') == 'en'), '')
+
+    score, severity, vector, version = None, 'UNKNOWN', None, None
+    metrics = cve.get('metrics', {})
+    for name in CVSS_METRICS:
+        if metrics.get(name):
+            # Preferencia por la métrica primaria (NVD) sobre la del CNA
+            entry = next((m for m in metrics[name] if m.get('type') == 'Primary'), metrics[name][0])
+            cvss = entry.get('cvssData', {})
+            score = cvss.get('baseScore')
+            severity = (cvss.get('baseSeverity') or entry.get('baseSeverity') or 'UNKNOWN').upper()
+            vector = cvss.get('vectorString')
+            version = cvss.get('version')
+            break
+
+    cwes = sorted({
+        d.get('value') for w in cve.get('weaknesses', []) for d in w.get('description', [])
+        if d.get('value', '').startswith('CWE-')
+    })
+    return {
+        'cve_id': cve_id.upper(),
+        'published': cve.get('published'),
+        'last_modified': cve.get('lastModified'),
+        'status': cve.get('vulnStatus'),
+        'severity': severity,
+        'score': score,
+        'cvss_version': version,
+        'vector': vector,
+        'description': description,
+        'cwes': cwes,
+        'references': [r.get('url') for r in cve.get('references', []) if r.get('url')][:20]
+    }
+
+
+class CveStore:
+    """SQLite en modo WAL: el fetcher escribe mientras la API lee"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.row_factory = sqlite3.Row
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS cves (
+                    cve_id TEXT PRIMARY KEY,
+                    published TEXT,
+                    last_modified TEXT,
+                    status TEXT,
+                    severity TEXT NOT NULL,
+                    score REAL,
+                    cvss_version TEXT,
+                    vector TEXT,
+                    description TEXT,
+                    cwes TEXT,
+                    refs TEXT
+                )
+            """)
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_cves_published ON cves (published)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_cves_modified ON cves (last_modified)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_cves_severity_score ON cves (severity, score)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_cves_score ON cves (score)")
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS sync (
+                    name TEXT PRIMARY KEY,
+                    value TEXT NOT NULL,
+                    updated_at TEXT NOT NULL
+                )
+            """)
+
+    def upsert_many(self, records: Iterable[Dict]) -> int:
+        rows = [
+            (r['cve_id'], r['published'], r['last_modified'], r['status'], r['severity'], r['score'],
+             r['cvss_version'], r['vector'], r['description'], json.dumps(r['cwes']), json.dumps(r['references']))
+            for r in records
+        ]
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO cves (cve_id, published, last_modified, status, severity, score, "
+                "cvss_version, vector, description, cwes, refs) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                rows
+            )
+        return len(rows)
+
+    @staticmethod
+    def _row(row: sqlite3.Row) -> Dict:
+        record = dict(row)
+        record['cwes'] = json.loads(record['cwes'] or '[]')
+        record['references'] = json.loads(record.pop('refs') or '[]')
+        return record
+
+    def get(self, cve_id: str) -> Optional[Dict]:
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM cves WHERE cve_id = ?", (cve_id.upper(),)).fetchone()
+        return self._row(row) if row else None
+
+    def get_many(self, cve_ids: List[str]) -> Dict[str, Dict]:
+        ids = [c.upper() for c in cve_ids]
+        found = {}
+        with self._lock:
+            for i in range(0, len(ids), 500):
+                chunk = ids[i:i + 500]
+                rows = self._conn.execute(
+                    f"SELECT * FROM cves WHERE cve_id IN ({','.join('?' * len(chunk))})", chunk
+                ).fetchall()
+                found.update((row['cve_id'], self._row(row)) for row in rows)
+        return found
+
+    def query(self, severity: Optional[List[str]] = None, min_score: Optional[float] = None,
+              max_score: Optional[float] = None, published_from: Optional[str] = None,
+              published_to: Optional[str] = None, modified_from: Optional[str] = None,
+              modified_to: Optional[str] = None, cwe: Optional[str] = None,
+              order_by: str = 'published', limit: int = 100, offset: int = 0) -> Dict:
+        """
+        Filtros combinables (AND); devuelve {"total", "results"} ordenado de más reciente a
+        más antiguo. limit=0 devuelve sólo el total
+        """
+        clauses, params = [], []
+        if severity:
+            clauses.append(f"severity IN ({','.join('?' * len(severity))})")
+            params.extend(s.upper() for s in severity)
+        for column, op, value in (('score', '>=', min_score), ('score', '<=', max_score),
+                                  ('published', '>=', published_from), ('published', '<=', published_to),
+                                  ('last_modified', '>=', modified_from), ('last_modified', '<=', modified_to)):
+            if value is not None:
+                clauses.append(f"{column} {op} ?")
+                params.append(value)
+        if cwe:
+            clauses.append("cwes LIKE ?")
+            params.append(f'%"{cwe.upper()}"%')
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        order = {'published': 'published DESC', 'modified': 'last_modified DESC',
+                 'score': 'score DESC, published DESC'}.get(order_by, 'published DESC')
+        limit = max(0, min(int(limit), QUERY_MAX_LIMIT))
+        offset = max(0, int(offset))
+        with self._lock:
+            total = self._conn.execute(f"SELECT COUNT(*) FROM cves {where}", params).fetchone()[0]
+            rows = self._conn.execute(
+                f"SELECT * FROM cves {where} ORDER BY {order} LIMIT ? OFFSET ?", params + [limit, offset]
+            ).fetchall()
+        return {"total": total, "results": [self._row(r) for r in rows]}
+
+    def get_watermark(self, name: str) -> Optional[str]:
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM sync WHERE name = ?", (name,)).fetchone()
+        return row['value'] if row else None
+
+    def set_watermark(self, name: str, value: str):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO sync (name, value, updated_at) VALUES (?, ?, ?)",
+                (name, value, datetime.now().isoformat())
+            )
+
+    def stats(self) -> Dict:
+        with self._lock:
+            total = self._conn.execute("SELECT COUNT(*) FROM cves").fetchone()[0]
+            by_severity = dict(self._conn.execute(
+                "SELECT severity, COUNT(*) FROM cves GROUP BY severity"
+            ).fetchall())
+            bounds = self._conn.execute(
+                "SELECT MIN(published), MAX(published), MAX(last_modified) FROM cves"
+            ).fetchone()
+            watermarks = {row['name']: row['value'] for row in self._conn.execute("SELECT name, value FROM sync")}
+        return {
+            "path": self.path,
+            "cves": total,
+            "by_severity": by_severity,
+            "published_range": [bounds[0], bounds[1]],
+            "last_modified": bounds[2],
+            "sync": watermarks
+        }
@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+"""
+=============================================================================
+IOC INDEX - Índice exacto de hashes SHA256 (abuse.ch)
+=============================================================================
+Saber si un hash es malware conocido no debe pasar por una búsqueda vectorial.
+Archivo binario mapeado en memoria:
+
+  cabecera   MAGIC, nº de registros, bits y funciones del Bloom, offsets
+  bloom      m bits; las posiciones salen del propio SHA256 (ya es uniforme)
+  registros  ordenados, 36 bytes: digest (32) + id de firma (uint32)
+  firmas     JSON con la tabla de nombres de familia
+
+Un hash ausente casi siempre se descarta en el Bloom (k lecturas de bit); los
+presentes se confirman con búsqueda binaria sobre los registros del mmap.
+El archivo se sustituye atómicamente y el holder lo recarga al cambiar.
+=============================================================================
+"""
+
+import bisect
+import json
+import math
+import mmap
+import os
+import re
+import struct
+import threading
+import time
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+
+MAGIC = b"IOCIDX01"
+HEADER = struct.Struct("<8sQQIQQ")  # magic, count, bloom_bits, bloom_k, records_offset, signatures_offset
+RECORD = struct.Struct("<32sI")
+BLOOM_BITS_PER_ENTRY = 10  # ~1% de falsos positivos con k=7
+SHA256_PATTERN = re.compile(r"^[0-9a-fA-F]{64}$")
+
+
+def parse_sha256(value: str) -> Optional[bytes]:
+    """Hex → 32 bytes; None si no es un SHA256 válido"""
+    if not isinstance(value, str) or not SHA256_PATTERN.match(value.strip()):
+        return None
+    return bytes.fromhex(value.strip())
+
+
+def _bloom_positions(digest: bytes, bits: int, k: int) -> List[int]:
+    # Doble hashing con dos fragmentos de 64 bits del propio digest
+    h1, h2 = struct.unpack_from("<QQ", digest)
+    h2 |= 1
+    return [(h1 + i * h2) % bits for i in range(k)]
+
+
+def write_index(path: str, entries: Dict[bytes, str]):
+    """entries: {digest: firma}. Escritura atómica (tmp + rename)"""
+    count = len(entries)
+    bits = max(64, count * BLOOM_BITS_PER_ENTRY)
+    bits += (-bits) % 8
+    k = max(1, round(BLOOM_BITS_PER_ENTRY * math.log(2)))
+    bloom = bytearray(bits // 8)
+    signatures: List[str] = []
+    signature_ids: Dict[str, int] = {}
+    records = bytearray()
+    for digest in sorted(entries):
+        for position in _bloom_positions(digest, bits, k):
+            bloom[position >> 3] |= 1 << (position & 7)
+        signature = entries[digest] or ""
+        if signature not in signature_ids:
+            signature_ids[signature] = len(signatures)
+            signatures.append(signature)
+        records += RECORD.pack(digest, signature_ids[signature])
+
+    records_offset = HEADER.size + len(bloom)
+    signatures_offset = records_offset + len(records)
+    tmp_path = f"{path}.tmp-{os.getpid()}"
+    with open(tmp_path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, count, bits, k, records_offset, signatures_offset))
+        f.write(bloom)
+        f.write(records)
+        f.write(json.dumps(signatures).encode())
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+class _Digests:
+    """Vista de los digests del mmap como secuencia ordenada (para bisect, sin copia)"""
+
+    def __init__(self, mm: mmap.mmap, offset: int, count: int):
+        self.mm = mm
+        self.offset = offset
+        self.count = count
+
+    def __len__(self) -> int:
+        return self.count
+
+    def __getitem__(self, i: int) -> bytes:
+        start = self.offset + i * RECORD.size
+        return self.mm[start:start + 32]
+
+
+class IocIndex:
+    """Índice abierto en solo lectura sobre un mmap"""
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as f:
+            stat = os.fstat(f.fileno())
+            self.identity = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.count, self.bloom_bits, self.bloom_k, self.records_offset, signatures_offset = \
+            HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{path}: no es un índice IOC")
+        self._digests = _Digests(self._mm, self.records_offset, self.count)
+        self.signatures = json.loads(self._mm[signatures_offset:])
+        self.built_at = datetime.fromtimestamp(stat.st_mtime).isoformat()
+
+    def _maybe_contains(self, digest: bytes) -> bool:
+        mm = self._mm
+        return all(mm[HEADER.size + (p >> 3)] & (1 << (p & 7))
+                   for p in _bloom_positions(digest, self.bloom_bits, self.bloom_k))
+
+    def lookup(self, digest: bytes) -> Tuple[bool, Optional[str]]:
+        """(conocido, firma)"""
+        if not self.count or not self._maybe_contains(digest):
+            return False, None
+        i = bisect.bisect_left(self._digests, digest)
+        if i < self.count and self._digests[i] == digest:
+            _, signature_id = RECORD.unpack_from(self._mm, self.records_offset + i * RECORD.size)
+            return True, self.signatures[signature_id] or None
+        return False, None
+
+    def entries(self) -> Dict[bytes, str]:
+        """Todo el contenido (para fusionar con un export nuevo)"""
+        result = {}
+        for i in range(self.count):
+            digest, signature_id = RECORD.unpack_from(self._mm, self.records_offset + i * RECORD.size)
+            result[digest] = self.signatures[signature_id]
+        return result
+
+
+class IocIndexHolder:
+    """Índice vigente; se reabre cuando el fetcher publica un archivo nuevo"""
+
+    def __init__(self, path: str, check_interval: float = 5.0):
+        self.path = path
+        self.check_interval = check_interval
+        self.index: Optional[IocIndex] = None
+        self._last_check = 0.0
+        self._lock = threading.Lock()
+
+    def get(self) -> Optional[IocIndex]:
+        now = time.monotonic()
+        if now - self._last_check >= self.check_interval:
+            self._last_check = now
+            self._maybe_reload()
+        return self.index
+
+    def _maybe_reload(self):
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return
+        identity = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+        if self.index is not None and self.index.identity == identity:
+            return
+        with self._lock:
+            try:
+                self.index = IocIndex(self.path)
+                print(f"[INFO] IOC index loaded: {self.index.count} hashes")
+            except (OSError, ValueError, struct.error) as e:
+                print(f"[ERROR] Loading IOC index {self.path}: {e}")
+
+
+def update_index(path: str, samples: Iterable[Tuple[str, str]]) -> Tuple[int, int]:
+    """
+    Fusiona (sha256, firma) con el índice existente y lo reescribe.
+    Devuelve (total, nuevos)
+    """
+    try:
+        entries = IocIndex(path).entries()
+    except (OSError, ValueError, struct.error):
+        entries = {}
+    before = len(entries)
+    for sha256, signature in samples:
+        digest = parse_sha256(sha256)
+        if digest is not None:
+            entries[digest] = signature or entries.get(digest, "")
+    write_index(path, entries)
+    return len(entries), len(entries) - before
@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""
+GRC Search Evaluation - Calidad y latencia de /api/grc/search por modo
+Calcula recall@k sobre un golden set y p50/p95 de latencia (vector, lexical, hybrid)
+"""
+
+import argparse
+import json
+import os
+import time
+
+import requests
+
+DEFAULT_GOLDEN = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "eval", "search_golden.json")
+MODES = ("vector", "lexical", "hybrid")
+
+
+def percentile(values: list, pct: float) -> float:
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def evaluate_mode(api_url: str, golden: list, mode: str, k: int) -> dict:
+    """Ejecuta el golden set en un modo y devuelve recall@k y latencias"""
+    recalls = []
+    latencies = []
+    
+    for case in golden:
+        start = time.perf_counter()
+        response = requests.post(
+            f"{api_url}/api/grc/search",
+            json={"query": case["query"], "limit": k, "mode": mode},
+            timeout=120
+        )
+        latencies.append((time.perf_counter() - start) * 1000)
+        
+        found = {c["id"] for c in response.json().get("controls", [])}
+        expected = set(case["expected"])
+        recalls.append(len(found & expected) / len(expected))
+    
+    return {
+        "mode": mode,
+        f"recall@{k}": round(sum(recalls) / len(recalls), 3),
+        "p50_ms": round(percentile(latencies, 50), 2),
+        "p95_ms": round(percentile(latencies, 95), 2)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Evalúa recall@k y latencia de /api/grc/search")
+    parser.add_argument("--api", default="http://localhost:5000", help="URL base de la GRC API")
+    parser.add_argument("--golden", default=DEFAULT_GOLDEN, help="Golden set JSON")
+    parser.add_argument("-k", type=int, default=5, help="Top-k evaluado")
+    args = parser.parse_args()
+    
+    with open(args.golden) as f:
+        golden = json.load(f)
+    
+    print("=" * 60)
+    print(f"🔍 Evaluación de búsqueda GRC - {len(golden)} consultas, k={args.k}")
+    print("=" * 60)
+    
+    for mode in MODES:
+        result = evaluate_mode(args.api, golden, mode, args.k)
+        print(f"  {mode:8s} recall@{args.k}={result[f'recall@{args.k}']:.3f}  "
+              f"p50={result['p50_ms']:.1f}ms  p95={result['p95_ms']:.1f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,266 @@
+#!/usr/bin/env python3
+"""
+GRC Admission - Cola de trabajo LLM con prioridad por severidad
+Concurrencia acotada hacia Ollama, deadline por petición y descarte de ruido bajo sobrecarga
+"""
+
+import contextvars
+import heapq
+import itertools
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from typing import Callable, Optional
+
+
+class LLMOverloadedError(Exception):
+    """La petición fue descartada (shed) por sobrecarga"""
+
+
+class LLMDeadlineExceeded(Exception):
+    """
+    El deadline expiró antes de obtener respuesta del LLM. queued=True si el trabajo
+    no llegó a ejecutarse (espera en cola: no es un fallo de Ollama)
+    """
+
+    def __init__(self, message: str, queued: bool = False):
+        super().__init__(message)
+        self.queued = queued
+
+
+# Deadline (time.monotonic) del trabajo en curso; acota las llamadas salientes
+_current_deadline: contextvars.ContextVar = contextvars.ContextVar("grc_deadline", default=None)
+MIN_CALL_TIMEOUT = 0.1
+
+
+def start_deadline(seconds: Optional[float]) -> contextvars.Token:
+    """Fija el deadline de la petición en curso (None = sin deadline)"""
+    return _current_deadline.set(time.monotonic() + seconds if seconds else None)
+
+
+def end_deadline(token: contextvars.Token):
+    _current_deadline.reset(token)
+
+
+def bounded_deadline(timeout: Optional[float]) -> Optional[float]:
+    """Deadline absoluto now + timeout recortado al de la petición en curso"""
+    deadline = time.monotonic() + timeout if timeout else None
+    outer = _current_deadline.get()
+    if outer is None:
+        return deadline
+    return outer if deadline is None else min(deadline, outer)
+
+
+def call_timeout(cap: float) -> float:
+    """Timeout de una llamada saliente: cap, o lo que queda del deadline vigente si es menor"""
+    deadline = _current_deadline.get()
+    if deadline is None:
+        return cap
+    return max(MIN_CALL_TIMEOUT, min(cap, deadline - time.monotonic()))
+
+
+def alert_priority(alert_data: dict) -> int:
+    """Prioridad = rule_level de Wazuh (0-15)"""
+    try:
+        return int(alert_data.get('rule_level') or 0)
+    except (TypeError, ValueError):
+        return 0
+
+
+class _WorkItem:
+    __slots__ = ("level", "seq", "deadline", "fn", "args", "sheddable", "future")
+
+    def __init__(self, level, seq, deadline, fn, args, sheddable):
+        self.level = level
+        self.seq = seq
+        self.deadline = deadline
+        self.fn = fn
+        self.args = args
+        self.sheddable = sheddable
+        self.future = Future()
+
+    def __lt__(self, other):
+        # Mayor severidad primero; a igual severidad, FIFO
+        return (-self.level, self.seq) < (-other.level, other.seq)
+
+
+class LLMWorkQueue:
+    """
+    Cola acotada con prioridad por rule_level delante de Ollama.
+    - max_concurrency: generaciones simultáneas
+    - max_queue: trabajos en espera; si está llena, un trabajo más severo desplaza al menos severo
+    - shed_depth / shed_below_level: con shed_depth trabajos descartables en espera, las
+      alertas por debajo de shed_below_level se descartan de inmediato (sólo mapeo vectorial)
+    Los trabajos no descartables (jobs asíncronos, incidentes) nunca se desplazan ni se
+    rechazan por capacidad, ni cuentan para max_queue/shed_depth: ya los acota su propio
+    pool de workers.
+    """
+
+    def __init__(self, max_concurrency: int = 1, max_queue: int = 20,
+                 shed_depth: Optional[int] = None, shed_below_level: int = 12,
+                 running_grace: float = 1.0):
+        self.max_queue = max_queue
+        self.running_grace = running_grace
+        self.shed_depth = shed_depth if shed_depth is not None else max(1, max_queue // 2)
+        self.shed_below_level = shed_below_level
+        self._heap = []
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self.stats = {"submitted": 0, "completed": 0, "shed": 0, "evicted": 0, "expired": 0}
+        for i in range(max_concurrency):
+            threading.Thread(target=self._worker, name=f"grc-llm-{i}", daemon=True).start()
+
+    def depth(self) -> int:
+        return len(self._heap)
+
+    def submit(self, level: int, fn: Callable, *args, deadline: Optional[float] = None,
+               sheddable: bool = True) -> Future:
+        """Encola fn(*args); deadline es un timestamp absoluto (time.monotonic)"""
+        with self._cond:
+            if len(self._heap) >= self.shed_depth:
+                # Purga trabajos cuyo solicitante ya abandonó (deadline/cancelados)
+                self._heap = [i for i in self._heap if not i.future.done()]
+                heapq.heapify(self._heap)
+
+            # Los umbrales cuentan sólo trabajos descartables: una ráfaga de jobs o incidentes
+            # en segundo plano no debe hacer que se descarten las alertas síncronas
+            evictable = [i for i in self._heap if i.sheddable] if sheddable else []
+            if sheddable and level < self.shed_below_level and len(evictable) >= self.shed_depth:
+                self.stats["shed"] += 1
+                raise LLMOverloadedError(f"cola LLM con {len(evictable)} trabajos, nivel {level}")
+
+            if sheddable and len(evictable) >= self.max_queue:
+                lowest = max(evictable)
+                if lowest.level >= level:
+                    self.stats["shed"] += 1
+                    raise LLMOverloadedError(f"cola LLM llena ({self.max_queue})")
+                self._heap.remove(lowest)
+                heapq.heapify(self._heap)
+                self.stats["evicted"] += 1
+                if not lowest.future.done():
+                    lowest.future.set_exception(LLMOverloadedError("desplazado por una alerta más severa"))
+
+            item = _WorkItem(level, next(self._seq), deadline, fn, args, sheddable)
+            heapq.heappush(self._heap, item)
+            self.stats["submitted"] += 1
+            self._cond.notify()
+        return item.future
+
+    def run(self, level: int, fn: Callable, *args, timeout: Optional[float] = None,
+            sheddable: bool = True):
+        """
+        Encola y espera el resultado respetando el deadline. Si el trabajo ya se está
+        ejecutando, su generación está acotada por el mismo deadline: se espera
+        running_grace para recoger el resultado o el error de Ollama
+        """
+        deadline = bounded_deadline(timeout)
+        timeout = max(0.0, deadline - time.monotonic()) if deadline is not None else None
+        future = self.submit(level, fn, *args, deadline=deadline, sheddable=sheddable)
+        try:
+            return future.result(timeout=timeout)
+        except FutureTimeoutError:
+            if future.cancel():
+                raise LLMDeadlineExceeded(f"sin turno en la cola del LLM en {timeout:.1f}s", queued=True)
+        try:
+            return future.result(timeout=self.running_grace)
+        except FutureTimeoutError:
+            raise LLMDeadlineExceeded(f"sin respuesta del LLM en {timeout:.1f}s")
+
+    def _worker(self):
+        while True:
+            with self._cond:
+                while not self._heap:
+                    self._cond.wait()
+                item = heapq.heappop(self._heap)
+
+            if not item.future.set_running_or_notify_cancel():
+                continue
+            if item.deadline is not None and time.monotonic() >= item.deadline:
+                self._count("expired")
+                item.future.set_exception(LLMDeadlineExceeded("deadline expirado en cola", queued=True))
+                continue
+            token = _current_deadline.set(item.deadline)
+            try:
+                item.future.set_result(item.fn(*item.args))
+                self._count("completed")
+            except Exception as e:
+                item.future.set_exception(e)
+            finally:
+                _current_deadline.reset(token)
+
+    def _count(self, key: str):
+        with self._cond:
+            self.stats[key] += 1
+
+    def status(self) -> dict:
+        with self._cond:
+            return {
+                "depth": len(self._heap),
+                "max_queue": self.max_queue,
+                "shed_depth": self.shed_depth,
+                "shed_below_level": self.shed_below_level,
+                **self.stats
+            }
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker para el LLM: tras failure_threshold fallos consecutivos se abre
+    durante reset_timeout segundos; luego deja pasar una petición de prueba (half-open)
+    """
+
+    def __init__(self, failure_threshold: int = 3, reset_timeout: float = 30):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+        self.stats = {"opened": 0, "rejected": 0, "failures": 0, "successes": 0}
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == "open" and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = "half_open"
+                self._trial_in_flight = False
+            if self.state == "closed":
+                return True
+            if self.state == "half_open" and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return True
+            self.stats["rejected"] += 1
+            return False
+
+    def release(self):
+        """La petición admitida no llegó al LLM (p. ej. descartada en cola)"""
+        with self._lock:
+            self._trial_in_flight = False
+
+    def record_success(self):
+        with self._lock:
+            self.stats["successes"] += 1
+            self.state = "closed"
+            self.failures = 0
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.stats["failures"] += 1
+            self.failures += 1
+            self._trial_in_flight = False
+            if self.state == "half_open" or self.failures >= self.failure_threshold:
+                if self.state != "open":
+                    self.stats["opened"] += 1
+                self.state = "open"
+                self.opened_at = time.monotonic()
+
+    def status(self) -> dict:
+        with self._lock:
+            return {
+                "state": self.state,
+                "consecutive_failures": self.failures,
+                "failure_threshold": self.failure_threshold,
+                "reset_timeout_s": self.reset_timeout,
+                **self.stats
+            }
@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+"""
+GRC Aggregation - Agrupación de alertas por ventana deslizante antes del análisis
+Wazuh emite un webhook por evento: un brute force SSH contra un agente son cientos de
+alertas casi idénticas. Los eventos con la misma (rule_id, agente, MITRE ID) se acumulan
+en un grupo que se cierra tras WINDOW segundos sin eventos nuevos (o al alcanzar la
+antigüedad máxima, para que una campaña continua también se notifique). Cada grupo
+cerrado es un incidente: un análisis LLM y una notificación, no uno por evento.
+
+El estado vive en memoria de un solo proceso: la API escribe los eventos en el log de
+ingesta y sólo el dueño del consumidor (grc_ingest_log.LogConsumer) los agrega, así
+los grupos reúnen los eventos de todos los workers de gunicorn (que leen incidentes y
+grupos abiertos de grc_incidents.IncidentStore). Cada grupo recuerda el
+offset de su primer evento y el incidente lo conserva hasta que done() confirma su
+análisis: low_watermark() es hasta dónde puede confirmar el consumidor sin perder
+eventos si el proceso cae (al reiniciar se reconstruyen desde el log). El rango
+[offset, last_offset] de cada incidente analizado permite no reanalizar sus eventos.
+"""
+
+import hashlib
+import threading
+import time
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+
+from grc_admission import alert_priority
+from grc_catalog import parse_mitre_ids
+
+MAX_DISTINCT_SOURCES = 20
+
+
+def aggregation_key(alert_data: dict) -> tuple:
+    """(rule_id, agente, técnicas MITRE normalizadas)"""
+    techniques = ",".join(sorted(parse_mitre_ids(alert_data.get('mitre_id'))))
+    return (str(alert_data.get('rule_id') or alert_data.get('rule_description') or ''),
+            str(alert_data.get('agent_name') or ''), techniques)
+
+
+def _iso(timestamp: float) -> str:
+    return datetime.fromtimestamp(timestamp).isoformat()
+
+
+class AlertAggregator:
+    """
+    Grupos abiertos por clave. Cierre por inactividad (window_seconds), por antigüedad
+    (max_open_seconds) o por capacidad (max_groups: se cierra el grupo más antiguo).
+    Los incidentes cerrados se entregan a on_flush desde el hilo de fondo (start) o
+    se recogen por polling con flush_due().
+    """
+
+    def __init__(self, window_seconds: float = 60, max_open_seconds: float = 600,
+                 max_samples: int = 5, max_groups: int = 10000,
+                 on_flush: Optional[Callable[[Dict], None]] = None,
+                 poll_interval: float = 1.0, clock: Callable[[], float] = time.time):
+        self.window_seconds = window_seconds
+        self.max_open_seconds = max_open_seconds
+        self.max_samples = max_samples
+        self.max_groups = max_groups
+        self.on_flush = on_flush
+        self.poll_interval = poll_interval
+        self.clock = clock
+        self.groups: Dict[tuple, Dict] = {}
+        self._evicted: List[Dict] = []
+        self._pending: Dict[str, int] = {}
+        self.stats = {"events": 0, "incidents": 0, "capacity_flushes": 0}
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    def add(self, alert_data: dict, event: Optional[dict] = None, at: Optional[float] = None,
+            offset: Optional[int] = None) -> Dict:
+        """
+        Acumula un evento; devuelve la clave del grupo y su contador actual.
+        at: instante del evento (replays desde el log de ingesta); por defecto, ahora
+        offset: posición del evento en el log de ingesta (retiene el checkpoint)
+        """
+        now = self.clock() if at is None else at
+        key = aggregation_key(alert_data)
+        evicted = []
+        with self._lock:
+            self.stats["events"] += 1
+            group = self.groups.get(key)
+            if group is None:
+                if len(self.groups) >= self.max_groups:
+                    oldest = min(self.groups, key=lambda k: self.groups[k]["first_seen"])
+                    evicted.append(self._close(oldest, "capacity"))
+                    self.stats["capacity_flushes"] += 1
+                group = self.groups[key] = {
+                    "alert": dict(alert_data),
+                    "count": 0,
+                    "first_seen": now,
+                    "last_seen": now,
+                    "max_level": 0,
+                    "sources": [],
+                    "samples": [],
+                    "offset": offset,
+                    "last_offset": offset
+                }
+            if group["offset"] is None:
+                group["offset"] = offset
+            if offset is not None:
+                group["last_offset"] = offset
+            group["count"] += 1
+            group["last_seen"] = now
+            group["max_level"] = max(group["max_level"], alert_priority(alert_data))
+            source = alert_data.get('srcip')
+            if source and source not in group["sources"] and len(group["sources"]) < MAX_DISTINCT_SOURCES:
+                group["sources"].append(source)
+            sample = event if event is not None else alert_data
+            if len(group["samples"]) < self.max_samples:
+                group["samples"].append(sample)
+            else:
+                # Primeros eventos + el más reciente
+                group["samples"][-1] = sample
+            count = group["count"]
+
+        for incident in evicted:
+            self._emit(incident)
+        return {"key": list(key), "count": count, "new": count == 1}
+
+    def flush_due(self, now: Optional[float] = None) -> List[Dict]:
+        """Cierra y devuelve los grupos inactivos o demasiado antiguos"""
+        now = self.clock() if now is None else now
+        with self._lock:
+            due = []
+            for key, group in self.groups.items():
+                if now - group["last_seen"] >= self.window_seconds:
+                    due.append((key, "window"))
+                elif now - group["first_seen"] >= self.max_open_seconds:
+                    due.append((key, "max_age"))
+            closed, self._evicted = self._evicted, []
+            return closed + [self._close(key, reason) for key, reason in due]
+
+    def flush_all(self, reason: str = "shutdown") -> List[Dict]:
+        with self._lock:
+            return [self._close(key, reason) for key in list(self.groups)]
+
+    def _close(self, key: tuple, reason: str) -> Dict:
+        group = self.groups.pop(key)
+        self.stats["incidents"] += 1
+        alert = dict(group["alert"], rule_level=group["max_level"] or group["alert"].get('rule_level'))
+        incident_id = hashlib.md5(f"{key}|{group['first_seen']}".encode()).hexdigest()[:16]
+        if group["offset"] is not None:
+            self._pending[incident_id] = group["offset"]
+        return {
+            "incident_id": incident_id,
+            "key": {"rule_id": key[0], "agent_name": key[1], "mitre_id": key[2] or None},
+            "alert": alert,
+            "count": group["count"],
+            "first_seen": _iso(group["first_seen"]),
+            "last_seen": _iso(group["last_seen"]),
+            "sources": group["sources"],
+            "samples": group["samples"],
+            "flush_reason": reason,
+            "offset": group["offset"],
+            "last_offset": group["last_offset"]
+        }
+
+    def done(self, incident_id: str):
+        """El incidente ya se analizó: deja de retener el checkpoint del log"""
+        with self._lock:
+            self._pending.pop(incident_id, None)
+
+    def low_watermark(self) -> Optional[int]:
+        """Menor offset de un grupo abierto o de un incidente sin analizar (None: ninguno)"""
+        with self._lock:
+            offsets = [g["offset"] for g in self.groups.values() if g["offset"] is not None]
+            offsets.extend(self._pending.values())
+            return min(offsets) if offsets else None
+
+    def open_groups(self) -> List[Dict]:
+        with self._lock:
+            return [
+                {"key": list(key), "count": g["count"], "first_seen": _iso(g["first_seen"]),
+                 "last_seen": _iso(g["last_seen"]), "max_level": g["max_level"]}
+                for key, g in sorted(self.groups.items(), key=lambda item: item[1]["first_seen"])
+            ]
+
+    def start(self):
+        """Hilo de fondo que cierra grupos vencidos y los entrega a on_flush"""
+        if self._thread or self.on_flush is None:
+            return
+        self._thread = threading.Thread(target=self._loop, name="grc-aggregator", daemon=True)
+        self._thread.start()
+
+    def _loop(self):
+        while True:
+            time.sleep(self.poll_interval)
+            for incident in self.flush_due():
+                self._emit(incident)
+
+    def _emit(self, incident: Dict):
+        if self.on_flush is None:
+            # Modo polling: el incidente sale en el próximo flush_due()
+            with self._lock:
+                self._evicted.append(incident)
+            return
+        try:
+            self.on_flush(incident)
+        except Exception as e:
+            print(f"[ERROR] Entregando incidente {incident['incident_id']}: {e}")
+
+    def status(self) -> Dict:
+        with self._lock:
+            return {
+                "window_seconds": self.window_seconds,
+                "max_open_seconds": self.max_open_seconds,
+                "open_groups": len(self.groups),
+                "open_events": sum(g["count"] for g in self.groups.values()),
+                "pending_incidents": len(self._pending),
+                **self.stats
+            }
@@ -4,85 +4,600 @@ GRC API - Endpoint para consultas de cumplimiento
 Integra con el flujo SOAR existente
 """
 
-from flask import Flask, request, jsonify
+import os
+import hashlib
+import json
+import uuid
+import threading
+import time
+import contextvars
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from flask import Flask, request, jsonify, g, Response
 import requests
 from datetime import datetime
 
+from grc_catalog import (
+    load_controls, MitreIndex, LexicalIndex, GapIndex, CrosswalkIndex,
+    reciprocal_rank_fusion, is_identifier_query, parse_mitre_ids, parse_cve_ids, frameworks_short, fill_by_framework
+)
+from grc_retrieval import build_alert_query, framework_search_request, group_framework_results, map_alerts
+from grc_models import ModelWarmer
+from grc_admission import (
+    LLMWorkQueue, LLMOverloadedError, LLMDeadlineExceeded, CircuitBreaker, alert_priority,
+    call_timeout, start_deadline, end_deadline
+)
+from grc_reports import (
+    build_template_report, build_report_prompt, select_prompt_controls,
+    parse_num_predict, num_predict_for
+)
+from grc_snapshot import SnapshotHolder
+from grc_metrics import (
+    MetricsRegistry, begin_request, end_request, stage, server_timing_header
+)
+from grc_jobs import (
+    JobStore, ReportJobQueue, QueueFullError, job_to_response, callback_allowed, parse_allowed_hosts
+)
+from grc_inventory import InventoryStore, valid_org_id
+from grc_mapping_table import MappingTableHolder, SeenRuleStore, rule_key, technique_key
+from grc_soar import parse_wazuh_alert, build_soar_prompt, parse_soar_response, build_template_soar
+from grc_aggregation import AlertAggregator, aggregation_key
+from grc_incidents import IncidentStore
+from grc_ingest_log import IngestLog, LogConsumer
+from grc_notify import TelegramClient, TelegramDispatcher, format_alert_message, format_digest_line
+from grc_triage import (
+    AnalysisMemory, TriageClassifier, parse_rule_ids, public_decision, ROUTE_CACHED, ROUTE_MAPPING_ONLY
+)
+
 app = Flask(__name__)
 
-QDRANT_URL = "http://localhost:6333"
-OLLAMA_URL = "http://localhost:11434"
+QDRANT_URL = os.getenv('QDRANT_URL', "http://localhost:6333")
+OLLAMA_URL = os.getenv('OLLAMA_URL', "http://localhost:11434")
 COLLECTION_NAME = "grc_controls"
 EMBED_MODEL = "nomic-embed-text"
 LLM_MODEL = "llama3.2:3b"
 
+# Keep-alive de modelos Ollama
+OLLAMA_KEEP_ALIVE = os.getenv('GRC_OLLAMA_KEEP_ALIVE', '30m')
+WARM_HEARTBEAT_SECONDS = int(os.getenv('GRC_WARM_HEARTBEAT_SECONDS', 240))
+WARM_ACTIVE_HOURS = os.getenv('GRC_WARM_ACTIVE_HOURS', '0-24')
+COLD_START_THRESHOLD_MS = float(os.getenv('GRC_COLD_START_THRESHOLD_MS', 1000))
+
+# Admisión LLM: concurrencia hacia Ollama, cola con prioridad por rule_level y deadline
+LLM_MAX_CONCURRENCY = int(os.getenv('GRC_LLM_MAX_CONCURRENCY', 1))
+LLM_MAX_QUEUE = int(os.getenv('GRC_LLM_MAX_QUEUE', 20))
+LLM_SHED_DEPTH = int(os.getenv('GRC_LLM_SHED_DEPTH', 10))
+LLM_SHED_BELOW_LEVEL = int(os.getenv('GRC_LLM_SHED_BELOW_LEVEL', 12))
+LLM_DEADLINE_SECONDS = float(os.getenv('GRC_LLM_DEADLINE_SECONDS', 45))
+
+# Compactación de prompt: poda de controles y tokens generados por severidad
+PROMPT_MIN_SCORE = float(os.getenv('GRC_PROMPT_MIN_SCORE', 0.35))
+PROMPT_MAX_CONTROLS = int(os.getenv('GRC_PROMPT_MAX_CONTROLS', 4))
+NUM_PREDICT_CAPS = parse_num_predict(os.getenv('GRC_NUM_PREDICT', '12:512,7:320,0:192'))
+# Análisis SOC + reporte en una sola generación: más tokens que un reporte aislado
+SOAR_NUM_PREDICT_CAPS = parse_num_predict(os.getenv('GRC_SOAR_NUM_PREDICT', '12:768,7:512,0:320'))
+
+# Circuit breaker del LLM (fallback: reporte determinista desde el catálogo)
+LLM_TIMEOUT_SECONDS = float(os.getenv('GRC_LLM_TIMEOUT_SECONDS', 45))
+# Presupuesto total por petición; cada llamada a Ollama/Qdrant recibe lo que queda
+# (como máximo UPSTREAM_TIMEOUT_SECONDS para embeddings y búsquedas)
+REQUEST_DEADLINE_SECONDS = float(os.getenv('GRC_REQUEST_DEADLINE_SECONDS', 60))
+UPSTREAM_TIMEOUT_SECONDS = float(os.getenv('GRC_UPSTREAM_TIMEOUT_SECONDS', 30))
+BREAKER_FAILURE_THRESHOLD = int(os.getenv('GRC_BREAKER_FAILURE_THRESHOLD', 3))
+BREAKER_RESET_SECONDS = float(os.getenv('GRC_BREAKER_RESET_SECONDS', 30))
+
+# Modo asíncrono de reportes
+JOBS_DB_PATH = os.getenv('GRC_JOBS_DB', 'grc_jobs.db')
+JOBS_MAX_WORKERS = int(os.getenv('GRC_JOBS_MAX_WORKERS', 2))
+JOBS_MAX_PENDING = int(os.getenv('GRC_JOBS_MAX_PENDING', 100))
+# Hosts (o host:puerto) a los que se puede entregar callback_url; vacío = sin callbacks
+CALLBACK_ALLOWED_HOSTS = parse_allowed_hosts(os.getenv('GRC_CALLBACK_ALLOWED_HOSTS', 'n8n'))
+
+# Inventarios de controles por organización
+INVENTORY_DB_PATH = os.getenv('GRC_INVENTORY_DB', 'grc_inventory.db')
+
+# Controles por framework en el mapeo de alertas (top-k filtrado, listas siempre completas)
+MAPPING_PER_FRAMEWORK = int(os.getenv('GRC_MAPPING_PER_FRAMEWORK', 5))
+
+# Tabla materializada de mapeos (grc_mapping_table.py build) y reglas observadas
+MAPPING_TABLE_PATH = os.getenv('GRC_MAPPING_TABLE_PATH', 'grc_mappings.json')
+SEEN_RULES_DB_PATH = os.getenv('GRC_SEEN_RULES_DB', 'grc_seen_rules.db')
+
+# Modo de búsqueda por defecto: hybrid | vector | lexical
+SEARCH_MODE = os.getenv('GRC_SEARCH_MODE', 'hybrid')
+SEARCH_MODES = ('hybrid', 'vector', 'lexical')
+
+# Mapeo en lote
+BATCH_MAX_ALERTS = int(os.getenv('GRC_BATCH_MAX_ALERTS', 256))
+BATCH_REPORT_CONCURRENCY = int(os.getenv('GRC_BATCH_REPORT_CONCURRENCY', 2))
+
+# Inteligencia de amenazas (colección del cti_fetcher) en map-alert
+THREAT_COLLECTION = "threat_intelligence"
+THREAT_INTEL_ENABLED = os.getenv('GRC_THREAT_INTEL', '1') == '1'
+THREAT_INTEL_LIMIT = int(os.getenv('GRC_THREAT_INTEL_LIMIT', 5))
+RETRIEVAL_WORKERS = int(os.getenv('GRC_RETRIEVAL_WORKERS', 16))
+# API del cti_fetcher (p. ej. http://cti-fetcher:8090): los CVEs se leen por ID de su almacén
+# en lugar de buscarse por similitud en Qdrant. Vacío = sólo la colección vectorial
+CTI_API_URL = os.getenv('GRC_CTI_API_URL', '').rstrip('/')
+
+# Agregación de eventos Wazuh en incidentes (ventana deslizante por regla/agente/MITRE)
+AGGREGATION_WINDOW_SECONDS = float(os.getenv('GRC_AGGREGATION_WINDOW_SECONDS', 60))
+AGGREGATION_MAX_OPEN_SECONDS = float(os.getenv('GRC_AGGREGATION_MAX_OPEN_SECONDS', 600))
+AGGREGATION_SAMPLES = int(os.getenv('GRC_AGGREGATION_SAMPLES', 5))
+INCIDENT_CALLBACK_URL = os.getenv('GRC_INCIDENT_CALLBACK_URL')
+INCIDENT_HISTORY = int(os.getenv('GRC_INCIDENT_HISTORY', 200))
+# Incidentes y estado del dueño del consumidor, legibles desde cualquier worker
+INCIDENTS_DB_PATH = os.getenv('GRC_INCIDENTS_DB', 'grc_incidents.db')
+STATE_PUBLISH_SECONDS = float(os.getenv('GRC_STATE_PUBLISH_SECONDS', 2))
+
+# Log de ingesta en disco (webhooks confirmados sin esperar al LLM, replay por rango)
+INGEST_LOG_DIR = os.getenv('GRC_INGEST_LOG_DIR', 'grc_ingest_log')
+INGEST_SEGMENT_BYTES = int(os.getenv('GRC_INGEST_SEGMENT_BYTES', 64 * 1024 * 1024))
+INGEST_FSYNC_SECONDS = float(os.getenv('GRC_INGEST_FSYNC_SECONDS', 1))
+INGEST_RETENTION_HOURS = float(os.getenv('GRC_INGEST_RETENTION_HOURS', 168))
+REPLAY_HISTORY = int(os.getenv('GRC_REPLAY_HISTORY', 100))
+# Análisis de replay en paralelo (el lector del log espera si hay el doble en cola)
+REPLAY_CONCURRENCY = int(os.getenv('GRC_REPLAY_CONCURRENCY', 1))
+
+# Triage previo al LLM: reglas por nivel/rule_id + kNN sobre análisis anteriores
+TRIAGE_ENABLED = os.getenv('GRC_TRIAGE', '1') == '1'
+TRIAGE_LLM_LEVEL = int(os.getenv('GRC_TRIAGE_LLM_LEVEL', 12))
+TRIAGE_MIN_LEVEL = int(os.getenv('GRC_TRIAGE_MIN_LEVEL', 5))
+TRIAGE_ALWAYS_LLM_RULES = parse_rule_ids(os.getenv('GRC_TRIAGE_ALWAYS_LLM_RULES', ''))
+TRIAGE_MAPPING_ONLY_RULES = parse_rule_ids(os.getenv('GRC_TRIAGE_MAPPING_ONLY_RULES', ''))
+TRIAGE_SIMILARITY = float(os.getenv('GRC_TRIAGE_SIMILARITY', 0.95))
+TRIAGE_MAX_AGE_HOURS = float(os.getenv('GRC_TRIAGE_MAX_AGE_HOURS', 24))
+TRIAGE_MEMORY_SIZE = int(os.getenv('GRC_TRIAGE_MEMORY_SIZE', 5000))
+TRIAGE_DB_PATH = os.getenv('GRC_TRIAGE_DB', 'grc_triage.db')
+TRIAGE_LOG_PATH = os.getenv('GRC_TRIAGE_LOG', 'grc_triage.jsonl')
+TRIAGE_LOG_MAX_MB = float(os.getenv('GRC_TRIAGE_LOG_MAX_MB', 50))
+
+# Notificaciones Telegram desde el servicio (sin token/chat configurados quedan desactivadas)
+TELEGRAM_API_URL = os.getenv('GRC_TELEGRAM_API_URL', 'https://api.telegram.org')
+TELEGRAM_BOT_TOKEN = os.getenv('GRC_TELEGRAM_BOT_TOKEN')
+TELEGRAM_CHAT_ID = os.getenv('GRC_TELEGRAM_CHAT_ID')
+NOTIFY_RATE_PER_CHAT = float(os.getenv('GRC_NOTIFY_RATE_PER_CHAT', 1.0))
+NOTIFY_BURST = float(os.getenv('GRC_NOTIFY_BURST', 1))
+NOTIFY_GLOBAL_RATE = float(os.getenv('GRC_NOTIFY_GLOBAL_RATE', 25))
+NOTIFY_HIGH_LEVEL = int(os.getenv('GRC_NOTIFY_HIGH_LEVEL', 12))
+NOTIFY_DIGEST_BELOW_LEVEL = int(os.getenv('GRC_NOTIFY_DIGEST_BELOW_LEVEL', 10))
+NOTIFY_DIGEST_SECONDS = float(os.getenv('GRC_NOTIFY_DIGEST_SECONDS', 60))
+NOTIFY_MAX_QUEUE = int(os.getenv('GRC_NOTIFY_MAX_QUEUE', 500))
+NOTIFY_LOG_DIR = os.getenv('GRC_NOTIFY_LOG_DIR', 'grc_notify_log')
+
+# Cache LRU de embeddings (las reglas Wazuh repiten descripciones)
+EMBED_CACHE_SIZE = int(os.getenv('GRC_EMBED_CACHE_SIZE', 1024))
+
+# Snapshot compartido (mmap) del catálogo + vectores; si existe, la búsqueda vectorial es local
+SNAPSHOT_PATH = os.getenv('GRC_SNAPSHOT_PATH', 'grc_catalog.snap')
+SNAPSHOT_CHECK_SECONDS = float(os.getenv('GRC_SNAPSHOT_CHECK_SECONDS', 5))
+
+# Índices en memoria construidos desde el catálogo al arrancar
+CONTROLS = load_controls()
+mitre_index = MitreIndex(CONTROLS)
+lexical_index = LexicalIndex(CONTROLS)
+crosswalk_index = CrosswalkIndex(CONTROLS)
+gap_index = GapIndex(CONTROLS, crosswalk_index)
+inventory_store = InventoryStore(INVENTORY_DB_PATH)
+inventory_store.sync_catalog(gap_index.fingerprint, gap_index.scopes.get)
+
+
+def refresh_catalog(snapshot):
+    """Reconstruye los índices en memoria cuando un reindexado publica un snapshot nuevo"""
+    global CONTROLS, mitre_index, lexical_index, crosswalk_index, gap_index
+    CONTROLS = snapshot.controls
+    mitre_index = MitreIndex(CONTROLS)
+    lexical_index = LexicalIndex(CONTROLS)
+    crosswalk_index = CrosswalkIndex(CONTROLS)
+    gap_index = GapIndex(CONTROLS, crosswalk_index)
+    recomputed = inventory_store.sync_catalog(gap_index.fingerprint, gap_index.scopes.get)
+    if recomputed:
+        print(f"[INFO] Catálogo actualizado: cobertura recalculada para {recomputed} organizaciones")
+
+
+snapshot_holder = SnapshotHolder(SNAPSHOT_PATH, SNAPSHOT_CHECK_SECONDS, on_reload=refresh_catalog)
+snapshot_holder.get()
+mapping_table = MappingTableHolder(MAPPING_TABLE_PATH, SNAPSHOT_CHECK_SECONDS)
+seen_rules = SeenRuleStore(SEEN_RULES_DB_PATH)
+
+
+def vectors_version() -> str:
+    """Versión de los vectores de controles (invalida mapeos materializados vectoriales)"""
+    snapshot = snapshot_holder.get()
+    if snapshot:
+        return f"snapshot:{snapshot.header.get('created_at')}"
+    return f"qdrant:{EMBED_MODEL}"
+
+model_warmer = ModelWarmer(
+    OLLAMA_URL, EMBED_MODEL, LLM_MODEL,
+    keep_alive=OLLAMA_KEEP_ALIVE,
+    heartbeat_interval=WARM_HEARTBEAT_SECONDS,
+    active_hours=WARM_ACTIVE_HOURS,
+    cold_start_threshold_ms=COLD_START_THRESHOLD_MS
+)
+
+llm_queue = LLMWorkQueue(
+    max_concurrency=LLM_MAX_CONCURRENCY,
+    max_queue=LLM_MAX_QUEUE,
+    shed_depth=LLM_SHED_DEPTH,
+    shed_below_level=LLM_SHED_BELOW_LEVEL
+)
+llm_usage = {"reports": 0, "prompt_tokens": 0, "generated_tokens": 0, "generation_ms": 0.0}
+llm_usage_lock = threading.Lock()
+llm_breaker = CircuitBreaker(
+    failure_threshold=BREAKER_FAILURE_THRESHOLD,
+    reset_timeout=BREAKER_RESET_SECONDS
+)
+
+metrics = MetricsRegistry()
+embedding_cache = OrderedDict()
+embedding_cache_lock = threading.Lock()
+
+# Sesión HTTP compartida: conexiones keep-alive reutilizadas hacia Ollama y Qdrant
+http = requests.Session()
+http.mount("http://", requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=64))
+
+
+def ollama_post(path: str, body: dict, timeout: float = None) -> dict:
+    """POST a Ollama contabilizando errores; sin timeout explícito, el del deadline vigente"""
+    try:
+        response = http.post(f"{OLLAMA_URL}{path}", json=body,
+                             timeout=timeout or call_timeout(UPSTREAM_TIMEOUT_SECONDS))
+        response.raise_for_status()
+        return response.json()
+    except Exception:
+        metrics.inc("ollama_errors_total", help_text="Errores en llamadas a Ollama", endpoint=path)
+        raise
+
+
+def qdrant_post(path: str, body: dict, timeout: float = None) -> dict:
+    """POST a Qdrant contabilizando errores; sin timeout explícito, el del deadline vigente"""
+    try:
+        response = http.post(f"{QDRANT_URL}{path}", json=body,
+                             timeout=timeout or call_timeout(UPSTREAM_TIMEOUT_SECONDS))
+        response.raise_for_status()
+        return response.json()
+    except Exception:
+        metrics.inc("qdrant_errors_total", help_text="Errores en llamadas a Qdrant", endpoint=path)
+        raise
+
+
+def count_cache(cache: str, hit: bool, amount: int = 1):
+    if amount:
+        name = "cache_hits_total" if hit else "cache_misses_total"
+        metrics.inc(name, amount, help_text="Aciertos/fallos de cache por tipo", cache=cache)
+
 
 def get_embedding(text: str) -> list:
     """Genera embedding usando Ollama"""
-    response = requests.post(
-        f"{OLLAMA_URL}/api/embeddings",
-        json={"model": EMBED_MODEL, "prompt": text}
-    )
-    return response.json()["embedding"]
+    return get_embeddings([text])[0]
+
+
+def embedding_cache_lookup(texts: list) -> tuple:
+    """Separa textos ya embebidos (cache LRU) de los que hay que pedir a Ollama"""
+    with embedding_cache_lock:
+        cached = {t: embedding_cache[t] for t in texts if t in embedding_cache}
+        for t in cached:
+            embedding_cache.move_to_end(t)
+    missing = [t for t in dict.fromkeys(texts) if t not in cached]
+    count_cache("embedding", True, len(texts) - len(missing))
+    count_cache("embedding", False, len(missing))
+    return cached, missing
+
+
+def embedding_cache_store(cached: dict, texts: list, embeddings: list):
+    with embedding_cache_lock:
+        for text, embedding in zip(texts, embeddings):
+            cached[text] = embedding
+            embedding_cache[text] = embedding
+        while len(embedding_cache) > EMBED_CACHE_SIZE:
+            embedding_cache.popitem(last=False)
+
+
+def get_embeddings(texts: list) -> list:
+    """Genera embeddings en lote con una sola llamada a Ollama (con cache LRU)"""
+    cached, missing = embedding_cache_lookup(texts)
+    
+    if missing:
+        with stage("embed"):
+            result = ollama_post(
+                "/api/embed",
+                {"model": EMBED_MODEL, "input": missing, "keep_alive": OLLAMA_KEEP_ALIVE}
+            )
+        model_warmer.record(EMBED_MODEL, result)
+        embedding_cache_store(cached, missing, result["embeddings"])
+    
+    return [cached[t] for t in texts]
 
 
 def search_grc_controls(query: str, limit: int = 5) -> list:
     """Busca controles GRC relevantes"""
-    embedding = get_embedding(query)
+    return vector_search_controls(get_embedding(query), limit)
+
+
+def vector_search_controls(embedding: list, limit: int = 5) -> list:
+    """Top-k de controles para un embedding ya calculado (snapshot local o Qdrant)"""
+    snapshot = snapshot_holder.get()
+    if snapshot:
+        with stage("search"):
+            return snapshot.search(embedding, limit)
     
-    response = requests.post(
-        f"{QDRANT_URL}/collections/{COLLECTION_NAME}/points/search",
-        json={
-            "vector": embedding,
-            "limit": limit,
-            "with_payload": True
-        }
-    )
+    with stage("search"):
+        result = qdrant_post(
+            f"/collections/{COLLECTION_NAME}/points/search",
+            {
+                "vector": embedding,
+                "limit": limit,
+                "with_payload": True
+            }
+        )
     
-    return response.json().get("result", [])
+    return result.get("result", [])
 
 
-def generate_compliance_report(alert_data: dict, controls: list) -> str:
-    """Genera reporte de cumplimiento usando LLM"""
+def hybrid_search_controls(query: str, limit: int = 5, mode: str = SEARCH_MODE) -> tuple:
+    """
+    Búsqueda léxica (BM25) + vectorial fusionada por RRF.
+    Las consultas que sólo contienen identificadores no generan embedding.
+    Devuelve (resultados, modo efectivo).
+    """
+    if mode == 'vector':
+        return search_grc_controls(query, limit), 'vector'
     
-    controls_text = "\n".join([
-        f"- {c['payload']['id']}: {c['payload']['name']} (Relevancia: {c['score']:.2f})"
-        for c in controls
-    ])
+    with stage("lexical"):
+        lexical = lexical_index.search(query, limit=limit)
+    if mode == 'lexical' or is_identifier_query(query):
+        return lexical, 'lexical'
     
-    prompt = f"""Eres un experto en GRC (Governance, Risk & Compliance).
+    vector = search_grc_controls(query, limit)
+    return reciprocal_rank_fusion(lexical, vector, limit=limit), 'hybrid'
 
-Analiza esta alerta de seguridad y su relación con los controles de cumplimiento identificados.
 
-## ALERTA DE SEGURIDAD:
-- Regla: {alert_data.get('rule_description', 'N/A')}
-- Nivel: {alert_data.get('rule_level', 'N/A')}
-- Agente: {alert_data.get('agent_name', 'N/A')}
-- MITRE: {alert_data.get('mitre_id', 'N/A')}
+def search_controls_by_framework(embeddings: list, per_framework: int = MAPPING_PER_FRAMEWORK) -> list:
+    """
+    per_framework controles de cada framework por embedding: ningún framework
+    desplaza al otro. En Qdrant, un único search/batch con filtros por framework.
+    """
+    if not embeddings:
+        return []
+    snapshot = snapshot_holder.get()
+    if snapshot:
+        with stage("search"):
+            return [sorted(snapshot.search_by_framework(e, per_framework), key=lambda h: -h['score'])
+                    for e in embeddings]
+    
+    frameworks = list(gap_index.by_framework)
+    with stage("search"):
+        result = qdrant_post(
+            f"/collections/{COLLECTION_NAME}/points/search/batch",
+            framework_search_request(embeddings, per_framework, frameworks)
+        )
+    return group_framework_results(result.get("result", []), len(embeddings), frameworks)
 
-## CONTROLES DE CUMPLIMIENTO RELACIONADOS:
-{controls_text}
 
-## GENERA UN REPORTE CON:
-1. **Impacto en Cumplimiento**: Qué frameworks se ven afectados
-2. **Controles Relevantes**: Top 3 controles más importantes
-3. **Riesgo de No-Cumplimiento**: Consecuencias potenciales
-4. **Acciones Recomendadas**: Para mantener/restaurar cumplimiento
-5. **Evidencia Requerida**: Documentación necesaria
+def search_grc_controls_batch(queries: list, per_framework: int = MAPPING_PER_FRAMEWORK) -> list:
+    """Busca controles para varias consultas: un embedding en lote y una búsqueda batch"""
+    # Consultas repetidas (misma regla) se embeben y buscan una sola vez
+    unique_queries = list(dict.fromkeys(queries))
+    results = search_controls_by_framework(get_embeddings(unique_queries), per_framework)
+    results_by_query = dict(zip(unique_queries, results))
+    return [results_by_query.get(q, []) for q in queries]
 
-Responde en formato estructurado y conciso.
-"""
 
-    response = requests.post(
-        f"{OLLAMA_URL}/api/generate",
-        json={
-            "model": LLM_MODEL,
-            "prompt": prompt,
-            "stream": False
-        }
-    )
-    
-    return response.json().get("response", "Error generando reporte")
+def report_request(alert_data: dict, controls: list) -> tuple:
+    """Cuerpo de /api/generate del reporte (prompt compacto, num_predict por severidad) y controles del prompt"""
+    prompt_controls = select_prompt_controls(controls, PROMPT_MIN_SCORE, PROMPT_MAX_CONTROLS)
+    body = {
+        "model": LLM_MODEL,
+        "prompt": build_report_prompt(alert_data, prompt_controls),
+        "stream": False,
+        "keep_alive": OLLAMA_KEEP_ALIVE,
+        "options": {"num_predict": num_predict_for(alert_priority(alert_data), NUM_PREDICT_CAPS)}
+    }
+    return body, prompt_controls
+
+
+def generate_compliance_report(alert_data: dict, controls: list) -> str:
+    """Genera reporte de cumplimiento usando LLM"""
+    body, prompt_controls = report_request(alert_data, controls)
+    result = ollama_post("/api/generate", body, timeout=call_timeout(LLM_TIMEOUT_SECONDS))
+    model_warmer.record(LLM_MODEL, result)
+    record_llm_usage(result, alert_data, "report", len(prompt_controls), len(controls))
+    return result.get("response", "Error generando reporte")
+
+
+def record_llm_usage(result: dict, alert_data: dict, kind: str, prompt_controls: int, candidate_controls: int):
+    """Registra tokens de prompt, tokens generados y tiempo de generación por reporte (log + métricas)"""
+    prompt_tokens = result.get("prompt_eval_count", 0)
+    generated_tokens = result.get("eval_count", 0)
+    generation_ms = result.get("eval_duration", 0) / 1e6
+    with llm_usage_lock:
+        llm_usage["reports"] += 1
+        llm_usage["prompt_tokens"] += prompt_tokens
+        llm_usage["generated_tokens"] += generated_tokens
+        llm_usage["generation_ms"] += generation_ms
+    print(f"[INFO] LLM {kind}: rule_id={alert_data.get('rule_id')} agent={alert_data.get('agent_name')} "
+          f"prompt_eval_count={prompt_tokens} eval_count={generated_tokens} "
+          f"generation_ms={generation_ms:.0f} controls={prompt_controls}/{candidate_controls}")
+    metrics.inc("llm_tokens_total", prompt_tokens, help_text="Tokens del LLM por tipo", kind="prompt")
+    metrics.inc("llm_tokens_total", generated_tokens, help_text="Tokens del LLM por tipo", kind="generated")
+    metrics.inc("llm_prompt_controls_total", prompt_controls,
+                help_text="Controles candidatos y enviados al prompt", kind="prompt")
+    metrics.inc("llm_prompt_controls_total", candidate_controls,
+                help_text="Controles candidatos y enviados al prompt", kind="candidate")
+    metrics.observe("llm_generation_seconds", generation_ms / 1000, help_text="Tiempo de generación por reporte")
+
+
+def generate_report(alert_data: dict, controls: list, sheddable: bool = True,
+                    timeout: float = LLM_DEADLINE_SECONDS) -> dict:
+    """
+    Genera el reporte con el LLM (cola con prioridad + circuit breaker + deadline).
+    Si el breaker está abierto, la alerta se descarta o se excede el presupuesto,
+    el reporte se construye de forma determinista desde el catálogo.
+    """
+    level = alert_priority(alert_data)
+    report, status = run_llm(level, generate_compliance_report, (alert_data, controls), sheddable, timeout)
+    if status == "generated":
+        return {"report": report, "source": "llm", "status": status}
+    return template_report(alert_data, controls, level, status)
+
+
+def run_llm(level: int, fn, args: tuple, sheddable: bool = True,
+            timeout: float = LLM_DEADLINE_SECONDS) -> tuple:
+    """Ejecuta fn en la cola del LLM tras el breaker. Devuelve (resultado o None, estado)"""
+    if not llm_breaker.allow():
+        return None, "circuit_open"
+    try:
+        with stage("llm"):
+            result = llm_queue.run(level, fn, *args, timeout=timeout, sheddable=sheddable)
+        llm_breaker.record_success()
+        return result, "generated"
+    except LLMOverloadedError:
+        llm_breaker.release()
+        return None, "shed"
+    except LLMDeadlineExceeded as e:
+        # Esperar turno en la cola no es un fallo de Ollama; agotar el deadline generando sí
+        if e.queued:
+            llm_breaker.release()
+        else:
+            llm_breaker.record_failure()
+        return None, "deadline_exceeded"
+    except Exception as e:
+        print(f"[ERROR] Generando reporte LLM: {e}")
+        llm_breaker.record_failure()
+        return None, "llm_error"
+
+
+def template_report(alert_data: dict, controls: list, level: int, status: str) -> dict:
+    """Reporte determinista desde el catálogo (breaker abierto, shed, deadline o error)"""
+    metrics.inc("report_fallbacks_total", help_text="Reportes generados por plantilla", reason=status)
+    return {
+        "report": build_template_report(alert_data, controls, level),
+        "source": "template",
+        "status": status
+    }
+
+
+def soar_request(alert_data: dict, controls: list, techniques: list) -> tuple:
+    """Cuerpo de /api/generate del análisis SOAR (salida JSON) y controles del prompt"""
+    prompt_controls = select_prompt_controls(controls, PROMPT_MIN_SCORE, PROMPT_MAX_CONTROLS)
+    body = {
+        "model": LLM_MODEL,
+        "prompt": build_soar_prompt(alert_data, prompt_controls, techniques),
+        "stream": False,
+        "format": "json",
+        "keep_alive": OLLAMA_KEEP_ALIVE,
+        "options": {"num_predict": num_predict_for(alert_priority(alert_data), SOAR_NUM_PREDICT_CAPS)}
+    }
+    return body, prompt_controls
+
+
+def generate_soar_response(alert_data: dict, controls: list, techniques: list) -> dict:
+    """Análisis SOC + reporte de cumplimiento con una única generación JSON"""
+    body, prompt_controls = soar_request(alert_data, controls, techniques)
+    result = ollama_post("/api/generate", body, timeout=call_timeout(LLM_TIMEOUT_SECONDS))
+    model_warmer.record(LLM_MODEL, result)
+    record_llm_usage(result, alert_data, "soar", len(prompt_controls), len(controls))
+    return parse_soar_response(result.get("response", ""))
+
+
+def generate_soar_analysis(alert_data: dict, controls: list, techniques: list, sheddable: bool = True,
+                           timeout: float = LLM_DEADLINE_SECONDS) -> dict:
+    """Igual que generate_report pero para la respuesta combinada del SOAR"""
+    level = alert_priority(alert_data)
+    generated, status = run_llm(level, generate_soar_response, (alert_data, controls, techniques),
+                                sheddable, timeout)
+    return soar_analysis(alert_data, controls, techniques, generated, status)
+
+
+def soar_analysis(alert_data: dict, controls: list, techniques: list, generated, status: str) -> dict:
+    """
+    Resultado de run_llm → análisis del SOAR. Sin generación se usa la plantilla; si el
+    JSON llega sin reporte de cumplimiento, éste se completa con la plantilla.
+    """
+    template = build_template_soar(alert_data, controls, techniques, alert_priority(alert_data))
+    if status != "generated":
+        metrics.inc("report_fallbacks_total", help_text="Reportes generados por plantilla", reason=status)
+        return {**template, "source": "template", "status": status}
+    if not generated["structured"]:
+        status = "unstructured"
+    return {
+        "soc_analysis": {**template["soc_analysis"], **generated["soc_analysis"]},
+        "compliance_report": generated["compliance_report"] or template["compliance_report"],
+        "source": "llm",
+        "status": status
+    }
+
+
+def generate_report_queued(alert_data: dict, controls: list) -> dict:
+    """Generación para jobs asíncronos: respeta la cola y la prioridad, sin descarte"""
+    return generate_report(alert_data, controls, sheddable=False, timeout=None)
+
+
+@app.before_request
+def start_request_timing():
+    g.timing_token = begin_request()
+    g.deadline_token = start_deadline(REQUEST_DEADLINE_SECONDS)
+    g.request_start = time.perf_counter()
+
+
+@app.teardown_request
+def end_request_deadline(exc):
+    token = g.pop('deadline_token', None)
+    if token is not None:
+        end_deadline(token)
+
+
+@app.after_request
+def finish_request_timing(response):
+    """Cabecera Server-Timing + histogramas por ruta y etapa"""
+    token = g.pop('timing_token', None)
+    if token is None:
+        return response
+    timings = end_request(token)
+    total = time.perf_counter() - g.request_start
+    route = request.url_rule.rule if request.url_rule else "unmatched"
+    response.headers['Server-Timing'] = observe_request(route, response.status_code, timings, total)
+    return response
+
+
+def observe_request(route: str, status: int, timings: dict, total: float) -> str:
+    """Registra histogramas por etapa y el contador de peticiones; devuelve Server-Timing"""
+    for name, seconds in list(timings.items()) + [("total", total)]:
+        metrics.observe("stage_duration_seconds", seconds,
+                        help_text="Duración por ruta y etapa", route=route, stage=name)
+    metrics.inc("requests_total", help_text="Peticiones por ruta y código",
+                route=route, status=status)
+    return server_timing_header(timings, total)
+
+
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    """Métricas en formato Prometheus"""
+    queue = llm_queue.status()
+    breaker = llm_breaker.status()
+    models = model_warmer.status()["models"]
+    counters = {
+        "llm_queue_events_total": [(queue[k], {"event": k})
+                                   for k in ("submitted", "completed", "shed", "evicted", "expired")],
+        "llm_breaker_events_total": [(breaker[k], {"event": k})
+                                     for k in ("opened", "rejected", "failures", "successes")],
+        "model_loads_total": [(m["loads"], {"model": name}) for name, m in models.items()],
+        "model_cold_starts_total": [(m["cold_starts"], {"model": name}) for name, m in models.items()],
+        "model_load_seconds_total": [(m["load_time_ms_total"] / 1000, {"model": name})
+                                     for name, m in models.items()],
+    }
+    gauges = {
+        "llm_queue_depth": [(queue["depth"], {})],
+        "llm_breaker_open": [(1 if breaker["state"] == "open" else 0, {})],
+        "report_jobs_pending": [(job_queue.pending(), {})],
+        "mapping_table_entries": [(len(mapping_table.entries), {})],
+        "aggregation_open_groups": [(aggregator.status()["open_groups"], {})],
+        "ingest_consumer_lag_bytes": [(ingest_consumer.status()["lag_bytes"], {})],
+        "triage_memory_entries": [(count, {"kind": kind}) for kind, count in triage.memory.size().items()],
+        "notify_queue_depth": [(notifier.status()["queue_depth"], {})] if notifier else [],
+    }
+    return Response(metrics.render(gauges, counters), mimetype="text/plain; version=0.0.4")
 
 
 @app.route('/health', methods=['GET'])
@@ -91,23 +606,40 @@ def health():
     return jsonify({"status": "healthy", "service": "GRC API"})
 
 
+@app.route('/api/grc/models', methods=['GET'])
+def models_status():
+    """Estado de precarga/keep-alive, métricas de carga y cola de admisión LLM"""
+    return jsonify({
+        **model_warmer.status(),
+        "llm_queue": llm_queue.status(),
+        "llm_breaker": llm_breaker.status(),
+        "llm_usage": dict(llm_usage)
+    })
+
+
 @app.route('/api/grc/search', methods=['POST'])
 def search_controls():
     """
     Busca controles de cumplimiento por consulta
     
-    Body: {"query": "brute force attack", "limit": 5}
+    Body: {"query": "brute force attack", "limit": 5, "mode": "hybrid"}
     """
     data = request.json
     query = data.get('query', '')
     limit = data.get('limit', 5)
+    mode = data.get('mode', SEARCH_MODE)
     
     if not query:
         return jsonify({"error": "Query requerida"}), 400
+    if mode not in SEARCH_MODES:
+        return jsonify({"error": f"Modo inválido, usar: {', '.join(SEARCH_MODES)}"}), 400
     
-    results = search_grc_controls(query, limit)
-    
-    # Formatear resultados
+    results, effective_mode = hybrid_search_controls(query, limit, mode)
+    return jsonify(search_response(query, effective_mode, results))
+
+
+def search_response(query: str, mode: str, results: list) -> dict:
+    """Formatea los resultados de búsqueda (compartido con la variante ASGI)"""
     controls = []
     for r in results:
         control = r['payload']
@@ -120,12 +652,307 @@ def search_controls():
             "mitre_mapping": control.get('mitre_mapping', []),
             "implementation_guidance": control.get('implementation_guidance', '')
         })
+        # Híbrido: relevance_score es el RRF; los scores de cada ranking van aparte
+        for source in ("vector_score", "lexical_score"):
+            if source in r:
+                controls[-1][source] = round(r[source] * 100, 2)
     
-    return jsonify({
+    return {
         "query": query,
+        "mode": mode,
         "total_results": len(controls),
         "controls": controls
-    })
+    }
+
+
+def build_compliance_mapping(results: list) -> dict:
+    """Separa los controles encontrados por framework"""
+    iso_controls = []
+    nist_controls = []
+    
+    for r in results:
+        control = r['payload']
+        control_info = {
+            "id": control['id'],
+            "name": control['name'],
+            "relevance": round(r['score'] * 100, 2),
+            "implementation_guidance": control.get('implementation_guidance', '')
+        }
+        
+        if control['framework'] == "ISO 27001:2022":
+            iso_controls.append(control_info)
+        else:
+            nist_controls.append(control_info)
+    
+    return {
+        "iso_27001": iso_controls[:MAPPING_PER_FRAMEWORK],
+        "nist_800_53": nist_controls[:MAPPING_PER_FRAMEWORK]
+    }
+
+
+def threat_point_id(kind: str, key: str) -> str:
+    """ID determinista del cti_fetcher: md5("attack_T1110"), md5("cve_CVE-..."), ..."""
+    return hashlib.md5(f"{kind}_{key}".encode()).hexdigest()
+
+
+def attack_technique_ids(mitre_value) -> list:
+    """Técnicas de la alerta y sus técnicas padre (T1110.001 → T1110)"""
+    techniques = parse_mitre_ids(mitre_value)
+    return list(dict.fromkeys(techniques + [t.split('.')[0] for t in techniques]))
+
+
+def lookup_attack_techniques(technique_ids: list) -> list:
+    """Lectura directa por ID de las técnicas ATT&CK en threat_intelligence (sin búsqueda)"""
+    if not technique_ids:
+        return []
+    with stage("threat_lookup"):
+        result = qdrant_post(
+            f"/collections/{THREAT_COLLECTION}/points",
+            {"ids": [threat_point_id("attack", t) for t in technique_ids], "with_payload": True}
+        )
+    return [p["payload"] for p in result.get("result", []) if p.get("payload")]
+
+
+def alert_cve_ids(alert_data: dict) -> list:
+    return parse_cve_ids(alert_data.get('cve_id'), alert_data.get('rule_description'))
+
+
+def lookup_cves(cve_ids: list) -> list:
+    """Lectura exacta por ID en el almacén de CVEs del cti_fetcher (POST /api/cve/lookup)"""
+    if not cve_ids or not CTI_API_URL:
+        return []
+    with stage("cve_lookup"):
+        response = http.post(f"{CTI_API_URL}/api/cve/lookup", json={"ids": cve_ids},
+                             timeout=call_timeout(UPSTREAM_TIMEOUT_SECONDS))
+        response.raise_for_status()
+    return [r for r in response.json().get("results", {}).values() if r]
+
+
+def threat_search_request(embedding: list, limit: int) -> dict:
+    """Búsqueda en threat_intelligence; con la API CTI los CVEs no se buscan por similitud"""
+    body = {"vector": embedding, "limit": limit, "with_payload": True}
+    if CTI_API_URL:
+        body["filter"] = {"must_not": [{"key": "source", "match": {"value": "nvd"}}]}
+    return body
+
+
+def search_threat_intel(embedding: list, limit: int) -> list:
+    """Documentos CTI (ATT&CK, ATLAS, malware y, sin API CTI, CVEs) cercanos a la alerta"""
+    with stage("threat_search"):
+        result = qdrant_post(f"/collections/{THREAT_COLLECTION}/points/search",
+                             threat_search_request(embedding, limit))
+    return result.get("result", [])
+
+
+def format_threat_intel(techniques: list, related: list, cves: list = ()) -> dict:
+    return {
+        "cves": [
+            {k: c.get(k) for k in ("cve_id", "severity", "score", "published", "description", "cwes")}
+            for c in cves
+        ],
+        "techniques": [
+            {
+                "technique_id": t.get('metadata', {}).get('technique_id'),
+                "title": t.get('title'),
+                "tactics": t.get('metadata', {}).get('tactics', []),
+                "content": t.get('content')
+            }
+            for t in techniques
+        ],
+        "related": [
+            {
+                "source": r['payload'].get('source'),
+                "title": r['payload'].get('title'),
+                "relevance": round(r['score'] * 100, 2),
+                "metadata": r['payload'].get('metadata', {})
+            }
+            for r in related if r.get('payload')
+        ]
+    }
+
+
+retrieval_executor = ThreadPoolExecutor(max_workers=RETRIEVAL_WORKERS, thread_name_prefix="grc-retrieval")
+
+
+def submit_in_context(fn, *args):
+    """Ejecuta fn en el pool de recuperación sumando sus tiempos a la petición actual"""
+    return retrieval_executor.submit(contextvars.copy_context().run, fn, *args)
+
+
+def threat_branch_result(future) -> list:
+    """La CTI enriquece la respuesta: si falla (colección ausente, timeout) no rompe el mapeo"""
+    if future is None:
+        return []
+    try:
+        return future.result()
+    except Exception as e:
+        print(f"[ERROR] Consultando {THREAT_COLLECTION}: {e}")
+        metrics.inc("threat_intel_errors_total", help_text="Errores consultando inteligencia de amenazas")
+        return []
+
+
+def lookup_mapping_table(alert_data: dict) -> list:
+    """
+    Mapeo materializado: por rule_id y, si falta, por técnica única. None si no hay
+    entrada (las reglas nuevas se registran para el próximo build de la tabla).
+    """
+    catalog_fingerprint = gap_index.content_fingerprint
+    keys = []
+    if alert_data.get('rule_id'):
+        keys.append(rule_key(alert_data['rule_id']))
+    techniques = parse_mitre_ids(alert_data.get('mitre_id'))
+    if len(techniques) == 1:
+        keys.append(technique_key(techniques[0]))
+    
+    controls = mitre_index.controls
+    with stage("mapping_table"):
+        for key in keys:
+            entry = mapping_table.get(key, catalog_fingerprint)
+            if entry is not None:
+                count_cache("mapping_table", True)
+                return [
+                    {"id": control_id, "score": score, "payload": controls[control_id], "match": match}
+                    for control_id, score, match in entry if control_id in controls
+                ]
+    
+    count_cache("mapping_table", False)
+    if keys and keys[0].startswith("rule:"):
+        seen_rules.record(alert_data)
+    return None
+
+
+def retrieve_controls_batch(alerts: list, per_framework: int = MAPPING_PER_FRAMEWORK,
+                            use_table: bool = True, search_batch=None) -> list:
+    """
+    Controles para un lote de alertas: tabla materializada y coincidencia MITRE exacta;
+    las alertas con algún framework incompleto se rellenan hasta per_framework con un
+    único embedding en lote + search/batch por framework
+    search_batch: consultas → resultados por framework (la variante ASGI usa su cliente async)
+    """
+    if search_batch is None:
+        search_batch = lambda queries: search_grc_controls_batch(queries, per_framework)
+    results = [lookup_mapping_table(a) if use_table else None for a in alerts]
+    missing = [i for i, mapped in enumerate(results) if mapped is None]
+    mapped = map_alerts([alerts[i] for i in missing], mitre_index, list(gap_index.by_framework),
+                        search_batch, per_framework)
+    for i, hits in zip(missing, mapped):
+        results[i] = hits
+    return results
+
+
+def needs_vector_fill(exact: list, per_framework: int = MAPPING_PER_FRAMEWORK) -> bool:
+    """Las coincidencias MITRE exactas no llenan algún framework: se completa con búsqueda"""
+    return frameworks_short(exact, gap_index.by_framework, per_framework)
+
+
+def retrieve_alert_context(alert_data: dict, per_framework: int = MAPPING_PER_FRAMEWORK) -> tuple:
+    """
+    Controles + inteligencia de amenazas para una alerta. Las coincidencias exactas por
+    MITRE ID van primero y cada framework se completa con la búsqueda por framework;
+    las ramas comparten un único embedding y corren en paralelo (lookup ATT&CK por ID,
+    búsqueda CTI, búsqueda de controles).
+    Devuelve (resultados de controles, threat_intelligence o None).
+    """
+    exact = lookup_mapping_table(alert_data)
+    if exact is not None:
+        need_controls = False
+    else:
+        with stage("mitre"):
+            exact = mitre_index.search(alert_data.get('mitre_id'))
+        count_cache("mitre_index", bool(exact))
+        need_controls = needs_vector_fill(exact, per_framework)
+    
+    if not THREAT_INTEL_ENABLED:
+        if not need_controls:
+            return exact, None
+        vector = search_grc_controls_batch([build_alert_query(alert_data)], per_framework)[0]
+        return fill_by_framework(exact, vector, per_framework), None
+    
+    # El lookup por ID no depende del embedding: arranca antes de calcularlo
+    lookup = submit_in_context(lookup_attack_techniques, attack_technique_ids(alert_data.get('mitre_id')))
+    cve_ids = alert_cve_ids(alert_data)
+    cves = submit_in_context(lookup_cves, cve_ids) if cve_ids and CTI_API_URL else None
+    related = None
+    results = exact
+    if need_controls or THREAT_INTEL_LIMIT:
+        embedding = get_embedding(build_alert_query(alert_data))
+        if THREAT_INTEL_LIMIT:
+            related = submit_in_context(search_threat_intel, embedding, THREAT_INTEL_LIMIT)
+        if need_controls:
+            results = fill_by_framework(exact, search_controls_by_framework([embedding], per_framework)[0],
+                                        per_framework)
+    
+    return results, format_threat_intel(threat_branch_result(lookup), threat_branch_result(related),
+                                        threat_branch_result(cves))
+
+
+def alert_summary(alert_data: dict) -> dict:
+    return {
+        "description": alert_data.get('rule_description'),
+        "level": alert_data.get('rule_level'),
+        "mitre_id": alert_data.get('mitre_id')
+    }
+
+
+triage = TriageClassifier(
+    AnalysisMemory(TRIAGE_DB_PATH, max_entries=TRIAGE_MEMORY_SIZE),
+    llm_level=TRIAGE_LLM_LEVEL,
+    min_level=TRIAGE_MIN_LEVEL,
+    always_llm_rules=TRIAGE_ALWAYS_LLM_RULES,
+    mapping_only_rules=TRIAGE_MAPPING_ONLY_RULES,
+    reuse_similarity=TRIAGE_SIMILARITY,
+    max_age_seconds=TRIAGE_MAX_AGE_HOURS * 3600,
+    log_path=TRIAGE_LOG_PATH,
+    log_max_bytes=int(TRIAGE_LOG_MAX_MB * 1024 * 1024)
+)
+
+
+def triage_alert(alert_data: dict, kind: str) -> dict:
+    """Ruta de la alerta: llm, cached (análisis previo casi idéntico) o mapping_only"""
+    if not TRIAGE_ENABLED:
+        return {"route": "llm", "reason": "triage_disabled"}
+    with stage("triage"):
+        decision = triage.classify(alert_data, kind, gap_index.content_fingerprint,
+                                   lambda: get_embedding(build_alert_query(alert_data)))
+    count_triage(kind, decision)
+    return decision
+
+
+def count_triage(kind: str, decision: dict):
+    metrics.inc("triage_decisions_total", help_text="Decisiones del triage previo al LLM",
+                kind=kind, route=decision["route"], reason=decision["reason"])
+
+
+def remember_analysis(alert_data: dict, kind: str, result, decision: dict):
+    """Guarda un análisis LLM para que alertas casi idénticas lo reutilicen"""
+    if not TRIAGE_ENABLED:
+        return
+    embedding = decision.get("embedding") or get_embedding(build_alert_query(alert_data))
+    triage.memory.remember(kind, embedding, result, gap_index.content_fingerprint, alert_data)
+
+
+def routed_report(alert_data: dict, controls: list) -> dict:
+    """generate_report tras el triage: sólo las alertas enrutadas a 'llm' generan"""
+    decision = triage_alert(alert_data, "report")
+    if decision["route"] == ROUTE_CACHED:
+        report = {"report": decision["result"], "source": "cache", "status": "triage_cached"}
+    elif decision["route"] == ROUTE_MAPPING_ONLY:
+        report = {"report": None, "source": None, "status": "mapping_only"}
+    else:
+        report = generate_report(alert_data, controls)
+        if report["source"] == "llm":
+            remember_analysis(alert_data, "report", report["report"], decision)
+    report["triage"] = public_decision(decision)
+    return report
+
+
+job_queue = ReportJobQueue(
+    JobStore(JOBS_DB_PATH),
+    generate_report_queued,
+    max_workers=JOBS_MAX_WORKERS,
+    max_pending=JOBS_MAX_PENDING,
+    allowed_callback_hosts=CALLBACK_ALLOWED_HOSTS
+)
 
 
 @app.route('/api/grc/map-alert', methods=['POST'])
@@ -138,7 +965,9 @@ def map_alert_to_controls():
         "rule_level": 10,
         "agent_name": "server-01",
         "mitre_id": "T1110",
-        "mitre_tactic": "Credential Access"
+        "mitre_tactic": "Credential Access",
+        "async": false,                 # opcional: reporte en segundo plano
+        "callback_url": "http://..."    # opcional: entrega del reporte (modo async)
     }
     """
     alert_data = request.json
@@ -146,94 +975,625 @@ def map_alert_to_controls():
     if not alert_data:
         return jsonify({"error": "Datos de alerta requeridos"}), 400
     
-    # Construir query de búsqueda
-    search_query = f"""
-    {alert_data.get('rule_description', '')}
-    {alert_data.get('mitre_id', '')}
-    {alert_data.get('mitre_tactic', '')}
+    alert_data = dict(alert_data)
+    async_mode = bool(alert_data.pop('async', False)) or request.args.get('async') == '1'
+    callback_url = alert_data.pop('callback_url', None)
+    if callback_url and not callback_allowed(callback_url, CALLBACK_ALLOWED_HOSTS):
+        return jsonify({"error": "callback_url no permitido (GRC_CALLBACK_ALLOWED_HOSTS)"}), 400
+    
+    # Buscar controles relacionados e inteligencia de amenazas
+    results, threat_intel = retrieve_alert_context(alert_data)
+    compliance_mapping = build_compliance_mapping(results)
+    
+    if async_mode:
+        try:
+            job_id = job_queue.submit(alert_data, results[:5], compliance_mapping, callback_url)
+        except QueueFullError as e:
+            return jsonify({"error": f"Cola de reportes llena: {e}"}), 503
+        
+        return jsonify({
+            "job_id": job_id,
+            "status": "queued",
+            "status_url": f"/api/grc/jobs/{job_id}",
+            "alert": alert_summary(alert_data),
+            "compliance_mapping": compliance_mapping,
+            "threat_intelligence": threat_intel,
+            "ai_analysis": None,
+            "timestamp": datetime.now().isoformat()
+        }), 202
+    
+    # Triage y, si hace falta, reporte con IA (admisión por severidad, fallback determinista)
+    report = routed_report(alert_data, results[:5])
+    
+    return jsonify({
+        "alert": alert_summary(alert_data),
+        "compliance_mapping": compliance_mapping,
+        "threat_intelligence": threat_intel,
+        "ai_analysis": report["report"],
+        "report_source": report["source"],
+        "report_status": report["status"],
+        "triage": report["triage"],
+        "timestamp": datetime.now().isoformat()
+    })
+
+
+@app.route('/api/grc/map-alerts', methods=['POST'])
+def map_alerts_to_controls():
     """
+    Mapea un lote de alertas a controles de cumplimiento
     
-    # Buscar controles relacionados
-    results = search_grc_controls(search_query, limit=10)
+    Body: {
+        "alerts": [{"rule_description": "...", "rule_level": 10, "mitre_id": "T1110", ...}],
+        "generate_reports": false
+    }
+    """
+    data = request.json or {}
+    alerts = data.get('alerts', [])
+    generate_reports = bool(data.get('generate_reports', False))
     
-    # Separar por framework
-    iso_controls = []
-    nist_controls = []
+    if not alerts or not isinstance(alerts, list):
+        return jsonify({"error": "Lista de alertas requerida"}), 400
+    if len(alerts) > BATCH_MAX_ALERTS:
+        return jsonify({"error": f"Máximo {BATCH_MAX_ALERTS} alertas por lote"}), 400
     
-    for r in results:
-        control = r['payload']
-        control_info = {
-            "id": control['id'],
-            "name": control['name'],
-            "relevance": round(r['score'] * 100, 2),
-            "implementation_guidance": control.get('implementation_guidance', '')
-        }
-        
-        if control['framework'] == "ISO 27001:2022":
-            iso_controls.append(control_info)
-        else:
-            nist_controls.append(control_info)
+    # Sólo las alertas sin mapeo materializado ni coincidencia MITRE pasan por embedding + búsqueda
+    all_results = retrieve_controls_batch(alerts)
     
-    # Generar reporte con IA
-    compliance_report = generate_compliance_report(alert_data, results[:5])
+    reports = [{"report": None, "source": None, "status": "not_requested"}] * len(alerts)
+    if generate_reports:
+        # Reportes LLM con concurrencia acotada para no saturar Ollama
+        with ThreadPoolExecutor(max_workers=BATCH_REPORT_CONCURRENCY) as executor:
+            # Cada hilo corre en una copia del contexto para sumar sus tiempos a la petición
+            reports = list(executor.map(
+                lambda pair, ctx: ctx.run(routed_report, pair[0], pair[1][:5]),
+                zip(alerts, all_results),
+                [contextvars.copy_context() for _ in alerts]
+            ))
+    
+    mappings = []
+    for alert_data, results, report in zip(alerts, all_results, reports):
+        mappings.append({
+            "alert": alert_summary(alert_data),
+            "compliance_mapping": build_compliance_mapping(results),
+            "ai_analysis": report["report"],
+            "report_source": report["source"],
+            "report_status": report["status"],
+            "triage": report.get("triage")
+        })
     
     return jsonify({
+        "total_alerts": len(mappings),
+        "results": mappings,
+        "timestamp": datetime.now().isoformat()
+    })
+
+
+@app.route('/api/soar/alert', methods=['POST'])
+def soar_alert():
+    """
+    Webhook crudo de Wazuh → análisis SOC + mapeo y reporte de cumplimiento.
+    Sustituye el fan-out de n8n (dos generaciones LLM por alerta): la recuperación
+    se hace una vez y el LLM produce ambas partes en un único JSON.
+    
+    Body: {"alert": {"rule": {"id", "level", "description", "mitre"}, "agent": {...},
+                     "data": {"srcip", "srcuser"}, "timestamp"}}
+    """
+    body = request.json
+    if not isinstance(body, dict):
+        return jsonify({"error": "Webhook de Wazuh requerido"}), 400
+    
+    # n8n reenvía el webhook completo ({"body": {...}}); Wazuh envía la alerta directa
+    alert_data = parse_wazuh_alert(body.get('body', body))
+    if not alert_data['rule_description']:
+        return jsonify({"error": "rule.description requerido"}), 400
+    
+    response = analyze_soar_alert(alert_data)
+    response["notification"] = notify_analysis(response)
+    return jsonify(response)
+
+
+def analyze_soar_alert(alert_data: dict, sheddable: bool = True,
+                       timeout: float = LLM_DEADLINE_SECONDS) -> dict:
+    """Recuperación única + generación combinada → respuesta del SOAR"""
+    results, threat_intel = retrieve_alert_context(alert_data)
+    techniques = threat_intel["techniques"] if threat_intel else []
+    decision = triage_alert(alert_data, "soar")
+    analysis = soar_triaged_analysis(alert_data, results[:5], techniques, decision)
+    if analysis is None:
+        analysis = generate_soar_analysis(alert_data, results[:5], techniques, sheddable, timeout)
+        if analysis["status"] == "generated":
+            remember_analysis(alert_data, "soar", {k: analysis[k] for k in ("soc_analysis", "compliance_report")},
+                              decision)
+    return soar_response(alert_data, results, threat_intel, analysis, decision)
+
+
+def soar_triaged_analysis(alert_data: dict, controls: list, techniques: list, decision: dict) -> dict:
+    """Análisis sin LLM para las rutas cached y mapping_only del triage; None si la ruta es llm"""
+    if decision["route"] == ROUTE_CACHED:
+        # Análisis reutilizado; los IOCs son siempre los de esta alerta
+        template = build_template_soar(alert_data, controls, techniques, alert_priority(alert_data))
+        cached = decision["result"]
+        return {
+            "soc_analysis": {**cached["soc_analysis"], "iocs": template["soc_analysis"]["iocs"]},
+            "compliance_report": cached["compliance_report"],
+            "source": "cache",
+            "status": "triage_cached"
+        }
+    if decision["route"] == ROUTE_MAPPING_ONLY:
+        template = build_template_soar(alert_data, controls, techniques, alert_priority(alert_data))
+        return {**template, "source": "template", "status": "mapping_only"}
+    return None
+
+
+def soar_response(alert_data: dict, results: list, threat_intel, analysis: dict, decision: dict) -> dict:
+    return {
         "alert": {
-            "description": alert_data.get('rule_description'),
-            "level": alert_data.get('rule_level'),
-            "mitre_id": alert_data.get('mitre_id')
+            **alert_summary(alert_data),
+            "rule_id": alert_data.get('rule_id'),
+            "agent_name": alert_data.get('agent_name'),
+            "srcip": alert_data.get('srcip'),
+            "srcuser": alert_data.get('srcuser'),
+            "timestamp": alert_data.get('timestamp')
         },
-        "compliance_mapping": {
-            "iso_27001": iso_controls[:5],
-            "nist_800_53": nist_controls[:5]
-        },
-        "ai_analysis": compliance_report,
+        "soc_analysis": analysis["soc_analysis"],
+        "compliance_mapping": build_compliance_mapping(results),
+        "compliance_report": analysis["compliance_report"],
+        "threat_intelligence": threat_intel,
+        "analysis_source": analysis["source"],
+        "analysis_status": analysis["status"],
+        "triage": public_decision(decision),
         "timestamp": datetime.now().isoformat()
+    }
+
+
+notifier = TelegramDispatcher(
+    TelegramClient(TELEGRAM_API_URL, TELEGRAM_BOT_TOKEN),
+    TELEGRAM_CHAT_ID,
+    rate_per_chat=NOTIFY_RATE_PER_CHAT,
+    burst=NOTIFY_BURST,
+    global_rate=NOTIFY_GLOBAL_RATE,
+    high_level=NOTIFY_HIGH_LEVEL,
+    digest_below_level=NOTIFY_DIGEST_BELOW_LEVEL,
+    digest_seconds=NOTIFY_DIGEST_SECONDS,
+    max_queue=NOTIFY_MAX_QUEUE,
+    metrics=metrics
+) if TELEGRAM_BOT_TOKEN and TELEGRAM_CHAT_ID else None
+
+
+# Los límites de Telegram son por bot: los workers escriben las notificaciones en un log
+# en disco y sólo el dueño de su consumidor las despacha (un único conjunto de buckets)
+notify_log = IngestLog(NOTIFY_LOG_DIR, segment_bytes=INGEST_SEGMENT_BYTES,
+                       fsync_seconds=INGEST_FSYNC_SECONDS) if notifier else None
+
+
+def consume_notification(offset: int, timestamp: float, payload: bytes):
+    message = json.loads(payload)
+    notifier.notify(message["text"], message["level"], digest_line=message["digest_line"])
+
+
+notify_consumer = LogConsumer(notify_log, "telegram", consume_notification,
+                              retention_seconds=INGEST_RETENTION_HOURS * 3600) if notifier else None
+
+
+def notify_analysis(response: dict) -> str:
+    """Pasa la notificación Telegram del análisis al despachador ('accepted'); None si no hay bot"""
+    if notifier is None:
+        return None
+    notify_log.append(json.dumps({
+        "text": format_alert_message(response),
+        "level": alert_priority({"rule_level": response["alert"].get('level')}),
+        "digest_line": format_digest_line(response)
+    }).encode())
+    return "accepted"
+
+
+incident_store = IncidentStore(INCIDENTS_DB_PATH, history=INCIDENT_HISTORY)
+incident_executor = ThreadPoolExecutor(max_workers=BATCH_REPORT_CONCURRENCY, thread_name_prefix="grc-incident")
+replay_executor = ThreadPoolExecutor(max_workers=REPLAY_CONCURRENCY, thread_name_prefix="grc-replay")
+replay_slots = threading.BoundedSemaphore(REPLAY_CONCURRENCY * 2)
+
+
+def analyze_incident(incident: dict, replay: bool = False):
+    """
+    Un análisis por incidente cerrado; se guarda para polling y se entrega por callback.
+    replay: reanálisis de eventos pasados, sin notificación ni callback (no se vuelve a
+    avisar al SOC) y descartable ante tráfico en vivo
+    """
+    try:
+        alert_data = dict(incident["alert"], event_count=incident["count"], first_seen=incident["first_seen"],
+                          last_seen=incident["last_seen"], sources=incident["sources"])
+        if replay:
+            response = analyze_soar_alert(alert_data)
+        else:
+            response = analyze_soar_alert(alert_data, sheddable=False, timeout=None)
+        response["incident"] = {
+            k: incident.get(k) for k in ("incident_id", "count", "first_seen", "last_seen",
+                                         "sources", "samples", "flush_reason", "replay_id")
+        }
+        metrics.inc("incidents_total", help_text="Incidentes agregados analizados",
+                    reason=incident["flush_reason"])
+        response["notification"] = None if replay else notify_analysis(response)
+        incident_store.add(response)
+        if incident.get("offset") is not None:
+            # Tras un reinicio, estos eventos no vuelven a formar el incidente
+            incident_store.mark_analyzed(list(aggregation_key(incident["alert"])),
+                                         incident["offset"], incident["last_offset"])
+        
+        if INCIDENT_CALLBACK_URL and not replay:
+            http.post(INCIDENT_CALLBACK_URL, json=response, timeout=10).raise_for_status()
+    except Exception as e:
+        print(f"[ERROR] Incidente {incident['incident_id']}: {e}")
+        metrics.inc("incident_errors_total", help_text="Errores analizando o entregando incidentes")
+    finally:
+        if incident.get("offset") is not None:
+            # Sus eventos ya no hace falta releerlos del log tras un reinicio
+            aggregator.done(incident["incident_id"])
+
+
+aggregator = AlertAggregator(
+    window_seconds=AGGREGATION_WINDOW_SECONDS,
+    max_open_seconds=AGGREGATION_MAX_OPEN_SECONDS,
+    max_samples=AGGREGATION_SAMPLES,
+    on_flush=lambda incident: incident_executor.submit(analyze_incident, incident),
+    # Al releer tras un reinicio las ventanas se cierran con el tiempo de los eventos
+    clock=lambda: ingest_consumer.clock()
+)
+
+
+@app.route('/api/soar/events', methods=['POST'])
+def soar_event():
+    """
+    Webhook crudo de Wazuh → log de ingesta → agregación. Responde al instante; el
+    único consumidor del log agrupa los eventos de todos los workers y el análisis se
+    hace una vez por incidente al cerrarse la ventana (GET /api/soar/incidents o
+    callback GRC_INCIDENT_CALLBACK_URL).
+    """
+    body = request.get_json(silent=True)
+    if not isinstance(body, dict):
+        return jsonify({"error": "Webhook de Wazuh requerido"}), 400
+    
+    event = body.get('body', body)
+    if not parse_wazuh_alert(event)['rule_description']:
+        return jsonify({"error": "rule.description requerido"}), 400
+    
+    offset = ingest_log.append(request.get_data())
+    return jsonify({
+        "status": "accepted",
+        "offset": offset,
+        "window_seconds": AGGREGATION_WINDOW_SECONDS
+    }), 202
+
+
+ingest_log = IngestLog(INGEST_LOG_DIR, segment_bytes=INGEST_SEGMENT_BYTES, fsync_seconds=INGEST_FSYNC_SECONDS)
+
+
+def ingested_event(payload: bytes) -> tuple:
+    """Registro del log → (evento Wazuh, alert_data)"""
+    body = json.loads(payload)
+    event = body.get('body', body)
+    return event.get('alert', event), parse_wazuh_alert(event)
+
+
+def consume_ingested(offset: int, timestamp: float, payload: bytes):
+    event, alert_data = ingested_event(payload)
+    if incident_store.analyzed(list(aggregation_key(alert_data)), offset):
+        # Relectura tras un reinicio: el incidente de este evento ya se analizó y notificó
+        return
+    # Tiempo del evento, no de lectura: tras un reinicio los grupos se reconstruyen igual
+    aggregator.add(alert_data, event, at=timestamp, offset=offset)
+
+
+# Un solo proceso consume el log: la agregación ve todos los eventos aunque haya varios workers.
+# El checkpoint no pasa del primer evento de un grupo abierto o de un incidente sin analizar.
+ingest_consumer = LogConsumer(ingest_log, "aggregator", consume_ingested,
+                              retention_seconds=INGEST_RETENTION_HOURS * 3600,
+                              low_watermark=aggregator.low_watermark)
+replays = {}
+replays_lock = threading.Lock()
+
+
+def prune_replays():
+    """Conserva los REPLAY_HISTORY replays más recientes (los que siguen en curso no se borran)"""
+    finished = [replay_id for replay_id, state in replays.items() if state["status"] != "running"]
+    for replay_id in finished[:max(len(replays) - REPLAY_HISTORY, 0)]:
+        del replays[replay_id]
+
+
+def replay_ingested(replay_id: str, start: float, end: float):
+    """
+    Reproduce un rango del log con su propio agregador sobre el tiempo de los eventos:
+    los incidentes se reconstruyen como se formaron originalmente y se reanalizan sin
+    notificar. Como mucho 2 × REPLAY_CONCURRENCY análisis en cola: la lectura espera.
+    """
+    replay_aggregator = AlertAggregator(
+        window_seconds=AGGREGATION_WINDOW_SECONDS,
+        max_open_seconds=AGGREGATION_MAX_OPEN_SECONDS,
+        max_samples=AGGREGATION_SAMPLES
+    )
+    state = replays[replay_id]
+    
+    def submit(incidents):
+        for incident in incidents:
+            incident["replay_id"] = replay_id
+            replay_slots.acquire()
+            future = replay_executor.submit(analyze_incident, incident, replay=True)
+            future.add_done_callback(lambda _: replay_slots.release())
+            state["incidents"] += 1
+    
+    try:
+        for offset, timestamp, payload in ingest_log.replay(start, end):
+            submit(replay_aggregator.flush_due(now=timestamp))
+            try:
+                event, alert_data = ingested_event(payload)
+            except (ValueError, AttributeError) as e:
+                print(f"[ERROR] Replay {replay_id}, offset {offset}: {e}")
+                continue
+            replay_aggregator.add(alert_data, event, at=timestamp)
+            state["events"] += 1
+        submit(replay_aggregator.flush_all("replay_end"))
+        state["status"] = "completed"
+    except Exception as e:
+        print(f"[ERROR] Replay {replay_id}: {e}")
+        state.update(status="failed", error=str(e))
+
+
+@app.route('/api/soar/replay', methods=['POST'])
+def soar_replay():
+    """
+    Reanaliza los eventos ingeridos en un rango de tiempo (tras cambiar modelo o catálogo)
+    
+    Body: {"start": "2026-01-07T00:00:00", "end": "2026-01-07T12:00:00"}
+    """
+    data = request.json or {}
+    try:
+        start = datetime.fromisoformat(data['start']).timestamp()
+        end = datetime.fromisoformat(data['end']).timestamp() if data.get('end') else time.time()
+    except (KeyError, TypeError, ValueError):
+        return jsonify({"error": "start (ISO 8601) requerido; end opcional"}), 400
+    if end < start:
+        return jsonify({"error": "end anterior a start"}), 400
+    
+    replay_id = uuid.uuid4().hex[:12]
+    with replays_lock:
+        replays[replay_id] = {"status": "running", "start": data['start'], "end": data.get('end'),
+                              "events": 0, "incidents": 0, "created_at": datetime.now().isoformat()}
+        prune_replays()
+    threading.Thread(target=replay_ingested, args=(replay_id, start, end),
+                     name=f"grc-replay-{replay_id}", daemon=True).start()
+    return jsonify({"replay_id": replay_id, "status": "running"}), 202
+
+
+@app.route('/api/soar/ingest/status', methods=['GET'])
+def soar_ingest_status():
+    with replays_lock:
+        replay_status = {replay_id: dict(state) for replay_id, state in replays.items()}
+    return jsonify({
+        "log": ingest_log.status(),
+        "consumer": ingest_consumer.status(),
+        "replays": replay_status
+    })
+
+
+@app.route('/api/soar/notifications', methods=['GET'])
+def soar_notifications():
+    """Estado del despachador Telegram: cola, resúmenes pendientes, latencia y descartes"""
+    if notifier is None:
+        return jsonify({"enabled": False})
+    if notify_consumer.owner:
+        return jsonify(notifications_state())
+    # Los buckets y la cola viven en el worker dueño del consumidor: último estado publicado
+    return jsonify(incident_store.snapshot("notifications") or
+                   {"enabled": True, "consumer": notify_consumer.status()})
+
+
+@app.route('/api/soar/incidents', methods=['GET'])
+def soar_incidents():
+    """Incidentes analizados recientes (más nuevos primero) y grupos aún abiertos"""
+    limit = request.args.get('limit', 50, type=int)
+    # Sólo el worker dueño del consumidor agrega: el resto lee el último estado publicado
+    state = aggregation_state() if ingest_consumer.owner else incident_store.snapshot("aggregation")
+    return jsonify({
+        "incidents": incident_store.recent(limit),
+        **(state or {"open_groups": [], "aggregator": None}),
+        "consumer_owner": ingest_consumer.owner
     })
 
 
+def aggregation_state() -> dict:
+    return {"open_groups": aggregator.open_groups(), "aggregator": aggregator.status()}
+
+
+def notifications_state() -> dict:
+    return {"enabled": True, "consumer": notify_consumer.status(), **notifier.status()}
+
+
+def publish_state():
+    """El dueño de cada consumidor publica su estado en memoria para los demás workers"""
+    while True:
+        time.sleep(STATE_PUBLISH_SECONDS)
+        try:
+            if ingest_consumer.owner:
+                incident_store.publish("aggregation", aggregation_state())
+                incident_store.forget_before(ingest_consumer.committed())
+            if notifier and notify_consumer.owner:
+                incident_store.publish("notifications", notifications_state())
+        except Exception as e:
+            print(f"[ERROR] Publicando estado: {e}")
+
+
+@app.route('/api/grc/jobs/<job_id>', methods=['GET'])
+def get_report_job(job_id):
+    """Consulta el estado y el reporte de un job asíncrono"""
+    job = job_queue.store.get(job_id)
+    if not job:
+        return jsonify({"error": "Job no encontrado"}), 404
+    return jsonify(job_to_response(job))
+
+
 @app.route('/api/grc/gap-analysis', methods=['POST'])
 def gap_analysis():
     """
-    Realiza análisis de brechas
+    Realiza análisis de brechas sobre el catálogo en memoria (bitsets precomputados)
     
     Body: {
-        "implemented_controls": ["ISO-A.5.1", "ISO-A.8.5", "NIST-AC-2"]
+        "implemented_controls": ["ISO-A.5.1", "ISO-A.8.5", "NIST-AC-2"],
+        "offset": 0,        # opcional: paginación de missing_controls
+        "limit": 100,
+        "credit_equivalents": false     # opcional: acreditar equivalentes ISO ↔ NIST
     }
     """
-    data = request.json
-    implemented = set(data.get('implemented_controls', []))
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify({"error": "Body JSON requerido"}), 400
+    implemented = data.get('implemented_controls', [])
+    if not isinstance(implemented, list) or not all(isinstance(c, str) for c in implemented):
+        return jsonify({"error": "implemented_controls debe ser una lista de IDs"}), 400
+    credit_equivalents = bool(data.get('credit_equivalents', False))
+    try:
+        offset = max(0, int(data.get('offset') or 0))
+        limit = data.get('limit')
+        limit = max(0, int(limit)) if limit is not None else None
+    except (TypeError, ValueError, OverflowError):
+        return jsonify({"error": "offset y limit deben ser enteros"}), 400
     
-    # Obtener todos los controles de la colección
-    response = requests.post(
-        f"{QDRANT_URL}/collections/{COLLECTION_NAME}/points/scroll",
-        json={"limit": 100, "with_payload": True}
-    )
-    
-    all_controls = response.json().get("result", {}).get("points", [])
-    all_control_ids = set([c['payload']['id'] for c in all_controls])
-    
-    # Calcular gaps
-    gaps = all_control_ids - implemented
-    covered = all_control_ids & implemented
-    
-    # Categorizar gaps por prioridad
-    critical_gaps = [g for g in gaps if any(x in g for x in ['AC-', 'IA-', 'A.8.5', 'A.5.15'])]
+    with stage("gaps"):
+        index = gap_index
+        implemented_mask, unknown = index.mask_of(implemented)
+        result = index.analyze(implemented_mask, offset=offset, limit=limit,
+                               credit_equivalents=credit_equivalents)
     
+    gaps = result["summary"]["gaps"]
     return jsonify({
-        "summary": {
-            "total_controls": len(all_control_ids),
-            "implemented": len(covered),
-            "gaps": len(gaps),
-            "compliance_percentage": round(len(covered) / len(all_control_ids) * 100, 2) if all_control_ids else 0
+        **result,
+        "unknown_controls": unknown,
+        "pagination": {
+            "offset": offset,
+            "limit": limit,
+            "next_offset": offset + limit if limit is not None and offset + limit < gaps else None
         },
-        "implemented_controls": list(covered),
-        "missing_controls": list(gaps),
-        "critical_gaps": critical_gaps[:10],
         "recommendation": "Priorizar implementación de controles de Access Control e Identity Management"
     })
 
 
+@app.route('/api/grc/orgs', methods=['GET'])
+def list_orgs():
+    """Cumplimiento global de todas las organizaciones (dashboard)"""
+    return jsonify({"orgs": inventory_store.orgs(gap_index.scope_totals.get("all", 0))})
+
+
+@app.route('/api/grc/orgs/<org>/controls', methods=['GET', 'POST'])
+def org_controls(org):
+    """
+    Inventario de controles de una organización
+    
+    POST Body: {"add": ["ISO-A.5.1", "NIST-AC-2"], "remove": ["ISO-A.8.5"]}
+    """
+    if not valid_org_id(org):
+        return jsonify({"error": "ID de organización inválido"}), 400
+    if request.method == 'GET':
+        return jsonify({"org": org, "implemented_controls": inventory_store.control_ids(org)})
+    
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify({"error": "Body JSON requerido"}), 400
+    add = data.get('add', [])
+    remove = data.get('remove', [])
+    if not isinstance(add, list) or not isinstance(remove, list) or not (add or remove):
+        return jsonify({"error": "Listas 'add' y/o 'remove' requeridas"}), 400
+    if not all(isinstance(control_id, str) for control_id in add + remove):
+        return jsonify({"error": "Los IDs de control deben ser cadenas"}), 400
+    
+    index = gap_index
+    with stage("inventory"):
+        result = inventory_store.apply(org, add, remove, index.scopes.get, index.scope_totals)
+    return jsonify(result)
+
+
+@app.route('/api/grc/orgs/<org>/coverage', methods=['GET'])
+def org_coverage(org):
+    """Cobertura precalculada de una organización (sin recalcular)"""
+    if not valid_org_id(org):
+        return jsonify({"error": "ID de organización inválido"}), 400
+    coverage = inventory_store.coverage(org, gap_index.scope_totals)
+    if coverage is None:
+        return jsonify({"error": "Organización no encontrada"}), 404
+    return jsonify(coverage)
+
+
+@app.route('/api/grc/orgs/<org>/coverage/history', methods=['GET'])
+def org_coverage_history(org):
+    """Evolución del cumplimiento (una entrada por cambio en el inventario)"""
+    if not valid_org_id(org):
+        return jsonify({"error": "ID de organización inválido"}), 400
+    if inventory_store.coverage(org, {}) is None:
+        return jsonify({"error": "Organización no encontrada"}), 404
+    limit = max(1, min(request.args.get('limit', 100, type=int), 1000))
+    return jsonify({"org": org, "history": inventory_store.history(org, limit)})
+
+
+@app.route('/api/grc/orgs/<org>/gap-analysis', methods=['GET'])
+def org_gap_analysis(org):
+    """Análisis de brechas completo sobre el inventario almacenado"""
+    if not valid_org_id(org):
+        return jsonify({"error": "ID de organización inválido"}), 400
+    if inventory_store.coverage(org, {}) is None:
+        return jsonify({"error": "Organización no encontrada"}), 404
+    offset = max(0, request.args.get('offset', 0, type=int))
+    limit = request.args.get('limit', type=int)
+    limit = max(0, limit) if limit is not None else None
+    
+    with stage("gaps"):
+        index = gap_index
+        implemented_mask, unknown = index.mask_of(inventory_store.control_ids(org))
+        result = index.analyze(implemented_mask, offset=offset, limit=limit,
+                               credit_equivalents=request.args.get('credit_equivalents') == '1')
+    return jsonify({"org": org, **result, "unknown_controls": unknown})
+
+
+@app.route('/api/grc/crosswalk', methods=['GET'])
+@app.route('/api/grc/crosswalk/<node_id>', methods=['GET'])
+def crosswalk(node_id=None):
+    """
+    Equivalencias ISO ↔ NIST ↔ ATT&CK de un control o técnica
+    
+    GET /api/grc/crosswalk/ISO-A.5.15?max_hops=2   (sin ID: estadísticas del grafo)
+    max_hops: 1 (directas) por defecto, hasta la profundidad precalculada del índice
+    """
+    index = crosswalk_index
+    if node_id is None:
+        return jsonify(index.stats())
+    
+    max_hops = request.args.get('max_hops', default=1, type=int)
+    if max_hops is None or not 1 <= max_hops <= index.max_hops:
+        return jsonify({"error": f"max_hops debe estar entre 1 y {index.max_hops}"}), 400
+    with stage("crosswalk"):
+        result = index.lookup(node_id, max_hops)
+    if result is None:
+        return jsonify({"error": f"{node_id} no aparece en el crosswalk"}), 404
+    return jsonify(result)
+
+
+_background_started = False
+
+
+def start_background_services(requeue_interrupted: bool = True):
+    """Precarga de modelos y reanudación de jobs (una vez por proceso/worker)"""
+    global _background_started
+    if _background_started:
+        return
+    _background_started = True
+    model_warmer.start()
+    aggregator.start()
+    ingest_consumer.start()
+    if notifier:
+        notifier.start()
+        notify_consumer.start()
+    threading.Thread(target=publish_state, name="grc-state", daemon=True).start()
+    resumed = job_queue.start(requeue_interrupted=requeue_interrupted)
+    if resumed:
+        print(f"♻️  {resumed} jobs de reporte reanudados")
+
+
 if __name__ == '__main__':
     print("=" * 60)
     print("🏛️  GRC API Server - ISO 27001 & NIST 800-53")
@@ -242,9 +1602,26 @@ if __name__ == '__main__':
     print()
     print("📍 Endpoints disponibles:")
     print("   GET  /health              - Health check")
+    print("   GET  /metrics             - Métricas Prometheus")
+    print("   GET  /api/grc/models      - Estado de modelos Ollama")
     print("   POST /api/grc/search      - Buscar controles")
     print("   POST /api/grc/map-alert   - Mapear alerta → controles")
+    print("   POST /api/grc/map-alerts  - Mapear lote de alertas")
+    print("   GET  /api/grc/jobs/<id>   - Estado de reporte asíncrono")
+    print("   POST /api/soar/alert      - Webhook Wazuh → análisis SOC + cumplimiento")
+    print("   POST /api/soar/events     - Webhook Wazuh → agregación por incidente")
+    print("   POST /api/soar/replay     - Reanalizar un rango de tiempo del log")
+    print("   GET  /api/soar/incidents  - Incidentes analizados y grupos abiertos")
+    print("   GET  /api/soar/notifications - Despachador Telegram (cola, latencia, descartes)")
     print("   POST /api/grc/gap-analysis - Análisis de brechas")
+    print("   GET  /api/grc/crosswalk/<id> - Equivalencias ISO ↔ NIST ↔ ATT&CK")
+    print("   GET  /api/grc/orgs        - Cumplimiento por organización")
+    print("   POST /api/grc/orgs/<org>/controls - Alta/baja de controles implementados")
+    print("   GET  /api/grc/orgs/<org>/coverage[/history] - Cobertura y su evolución")
     print()
     print("=" * 60)
-    app.run(host='0.0.0.0', port=5000, debug=True)
+    print("⚠️  Servidor de desarrollo. Producción: gunicorn -c gunicorn.conf.py grc_api:app")
+    start_background_services()
+    # Sin reloader: duplicaría los servicios de fondo (y requeue_interrupted) en el proceso hijo
+    # El depurador de Werkzeug permite ejecutar código: sólo con FLASK_DEBUG=1 explícito
+    app.run(host='0.0.0.0', port=5000, debug=os.environ.get('FLASK_DEBUG') == '1', use_reloader=False)
@@ -0,0 +1,570 @@
+#!/usr/bin/env python3
+"""
+GRC API (ASGI) - Variante asíncrona de la GRC API
+Las rutas que esperan a Ollama/Qdrant (search, map-alert, map-alerts, soar/alert) y
+el webhook de ingesta (soar/events) se sirven en el event loop con
+clientes httpx compartidos (pool de conexiones keep-alive): miles de peticiones en
+vuelo no ocupan un hilo cada una. Lo que toca disco (SQLite, snapshot, logs) va a
+hilos con asyncio.to_thread. El resto de rutas se delega a la app Flask montada
+como WSGI. Mismo contrato JSON que grc_api.
+
+Uso:
+    cd grc/scripts && uvicorn grc_api_async:app --host 0.0.0.0 --port 5000
+    gunicorn -c gunicorn.conf.py -k uvicorn_worker.UvicornWorker grc_api_async:app   # varios workers
+"""
+
+import asyncio
+import json
+import os
+import time
+from contextlib import asynccontextmanager
+from datetime import datetime
+
+import httpx
+from a2wsgi import WSGIMiddleware
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse
+from starlette.routing import Mount, Route
+
+import grc_api as api
+from grc_admission import (
+    LLMOverloadedError, LLMDeadlineExceeded, alert_priority, bounded_deadline, call_timeout,
+    start_deadline, end_deadline
+)
+from grc_catalog import fill_by_framework, reciprocal_rank_fusion, is_identifier_query
+from grc_jobs import QueueFullError, callback_allowed
+from grc_metrics import begin_request, end_request, stage
+from grc_triage import ROUTE_CACHED, ROUTE_MAPPING_ONLY, public_decision
+
+# Pool de conexiones hacia Ollama y Qdrant (por worker)
+UPSTREAM_MAX_CONNECTIONS = int(os.getenv('GRC_UPSTREAM_MAX_CONNECTIONS', 64))
+UPSTREAM_MAX_KEEPALIVE = int(os.getenv('GRC_UPSTREAM_MAX_KEEPALIVE', 32))
+
+# Hilos para las rutas Flask montadas (jobs, gap-analysis, métricas...)
+WSGI_THREADS = int(os.getenv('GRC_WSGI_THREADS', 8))
+
+clients = {}
+
+
+@asynccontextmanager
+async def lifespan(app):
+    """Abre los clientes compartidos y arranca los servicios de fondo del proceso"""
+    limits = httpx.Limits(max_connections=UPSTREAM_MAX_CONNECTIONS,
+                          max_keepalive_connections=UPSTREAM_MAX_KEEPALIVE)
+    timeout = httpx.Timeout(api.UPSTREAM_TIMEOUT_SECONDS)
+    async with httpx.AsyncClient(base_url=api.OLLAMA_URL, limits=limits, timeout=timeout) as ollama, \
+            httpx.AsyncClient(base_url=api.QDRANT_URL, limits=limits, timeout=timeout) as qdrant:
+        clients["ollama"] = ollama
+        clients["qdrant"] = qdrant
+        if api.CTI_API_URL:
+            clients["cti"] = httpx.AsyncClient(base_url=api.CTI_API_URL, limits=limits, timeout=timeout)
+        # Bajo gunicorn ya lo hizo post_worker_init (no-op aquí)
+        api.start_background_services()
+        yield
+        if "cti" in clients:
+            await clients["cti"].aclose()
+        clients.clear()
+
+
+async def upstream_post(name: str, path: str, body: dict, timeout: float = None) -> dict:
+    """POST a Ollama/Qdrant por el pool compartido; sin timeout explícito, el del deadline vigente"""
+    try:
+        response = await clients[name].post(
+            path, json=body, timeout=timeout or call_timeout(api.UPSTREAM_TIMEOUT_SECONDS))
+        response.raise_for_status()
+        return response.json()
+    except Exception:
+        api.metrics.inc(f"{name}_errors_total", help_text=f"Errores en llamadas a {name.capitalize()}",
+                        endpoint=path)
+        raise
+
+
+async def get_embeddings(texts: list) -> list:
+    """Embeddings en lote con la cache LRU compartida con grc_api"""
+    cached, missing = api.embedding_cache_lookup(texts)
+
+    if missing:
+        with stage("embed"):
+            result = await upstream_post(
+                "ollama", "/api/embed",
+                {"model": api.EMBED_MODEL, "input": missing, "keep_alive": api.OLLAMA_KEEP_ALIVE}
+            )
+        api.model_warmer.record(api.EMBED_MODEL, result)
+        api.embedding_cache_store(cached, missing, result["embeddings"])
+
+    return [cached[t] for t in texts]
+
+
+async def search_grc_controls(query: str, limit: int = 5) -> list:
+    return await vector_search_controls((await get_embeddings([query]))[0], limit)
+
+
+async def local_snapshot():
+    """Snapshot vigente; la comprobación (y recarga) del archivo no bloquea el event loop"""
+    return await asyncio.to_thread(api.snapshot_holder.get)
+
+
+async def vector_search_controls(embedding: list, limit: int = 5) -> list:
+    snapshot = await local_snapshot()
+    if snapshot:
+        with stage("search"):
+            return await asyncio.to_thread(snapshot.search, embedding, limit)
+
+    with stage("search"):
+        result = await upstream_post(
+            "qdrant", f"/collections/{api.COLLECTION_NAME}/points/search",
+            {"vector": embedding, "limit": limit, "with_payload": True}
+        )
+    return result.get("result", [])
+
+
+async def hybrid_search_controls(query: str, limit: int = 5, mode: str = api.SEARCH_MODE) -> tuple:
+    if mode == 'vector':
+        return await search_grc_controls(query, limit), 'vector'
+
+    with stage("lexical"):
+        lexical = api.lexical_index.search(query, limit=limit)
+    if mode == 'lexical' or is_identifier_query(query):
+        return lexical, 'lexical'
+
+    vector = await search_grc_controls(query, limit)
+    return reciprocal_rank_fusion(lexical, vector, limit=limit), 'hybrid'
+
+
+async def search_controls_by_framework(embeddings: list, per_framework: int = api.MAPPING_PER_FRAMEWORK) -> list:
+    if not embeddings:
+        return []
+    snapshot = await local_snapshot()
+    if snapshot:
+        with stage("search"):
+            return await asyncio.to_thread(
+                lambda: [sorted(snapshot.search_by_framework(e, per_framework), key=lambda h: -h['score'])
+                         for e in embeddings]
+            )
+
+    frameworks = list(api.gap_index.by_framework)
+    with stage("search"):
+        result = await upstream_post(
+            "qdrant", f"/collections/{api.COLLECTION_NAME}/points/search/batch",
+            api.framework_search_request(embeddings, per_framework, frameworks)
+        )
+    return api.group_framework_results(result.get("result", []), len(embeddings), frameworks)
+
+
+async def search_grc_controls_batch(queries: list, per_framework: int = api.MAPPING_PER_FRAMEWORK) -> list:
+    unique_queries = list(dict.fromkeys(queries))
+    results = await search_controls_by_framework(await get_embeddings(unique_queries), per_framework)
+    results_by_query = dict(zip(unique_queries, results))
+    return [results_by_query.get(q, []) for q in queries]
+
+
+async def retrieve_controls_batch(alerts: list, per_framework: int = api.MAPPING_PER_FRAMEWORK) -> list:
+    """
+    grc_api.retrieve_controls_batch (tabla materializada + grc_retrieval.map_alerts) en un
+    hilo; su única búsqueda en lote vuelve al event loop por el pool httpx
+    """
+    loop = asyncio.get_running_loop()
+
+    def search_batch(queries: list) -> list:
+        return asyncio.run_coroutine_threadsafe(search_grc_controls_batch(queries, per_framework), loop).result()
+
+    return await asyncio.to_thread(api.retrieve_controls_batch, alerts, per_framework, search_batch=search_batch)
+
+
+async def lookup_attack_techniques(technique_ids: list) -> list:
+    if not technique_ids:
+        return []
+    with stage("threat_lookup"):
+        result = await upstream_post(
+            "qdrant", f"/collections/{api.THREAT_COLLECTION}/points",
+            {"ids": [api.threat_point_id("attack", t) for t in technique_ids], "with_payload": True}
+        )
+    return [p["payload"] for p in result.get("result", []) if p.get("payload")]
+
+
+async def search_threat_intel(embedding: list, limit: int) -> list:
+    with stage("threat_search"):
+        result = await upstream_post(
+            "qdrant", f"/collections/{api.THREAT_COLLECTION}/points/search",
+            api.threat_search_request(embedding, limit)
+        )
+    return result.get("result", [])
+
+
+async def lookup_cves(cve_ids: list) -> list:
+    """grc_api.lookup_cves contra la API del cti_fetcher por el pool compartido"""
+    with stage("cve_lookup"):
+        result = await upstream_post("cti", "/api/cve/lookup", {"ids": cve_ids})
+    return [r for r in result.get("results", {}).values() if r]
+
+
+async def threat_branch(coro) -> list:
+    try:
+        return await coro
+    except Exception as e:
+        print(f"[ERROR] Consultando {api.THREAT_COLLECTION}: {e}")
+        api.metrics.inc("threat_intel_errors_total", help_text="Errores consultando inteligencia de amenazas")
+        return []
+
+
+async def empty_branch() -> list:
+    return []
+
+
+async def retrieve_alert_context(alert_data: dict, per_framework: int = api.MAPPING_PER_FRAMEWORK) -> tuple:
+    """Mismo flujo que grc_api.retrieve_alert_context con las ramas en asyncio.gather"""
+    # Tabla de mapeos (recarga del archivo) y registro de reglas nuevas (SQLite) en un hilo
+    exact = await asyncio.to_thread(api.lookup_mapping_table, alert_data)
+    if exact is not None:
+        need_controls = False
+    else:
+        with stage("mitre"):
+            exact = api.mitre_index.search(alert_data.get('mitre_id'))
+        api.count_cache("mitre_index", bool(exact))
+        need_controls = api.needs_vector_fill(exact, per_framework)
+
+    if not api.THREAT_INTEL_ENABLED:
+        if not need_controls:
+            return exact, None
+        vector = (await search_grc_controls_batch([api.build_alert_query(alert_data)], per_framework))[0]
+        return fill_by_framework(exact, vector, per_framework), None
+
+    lookup = asyncio.ensure_future(threat_branch(
+        lookup_attack_techniques(api.attack_technique_ids(alert_data.get('mitre_id')))
+    ))
+    cve_ids = api.alert_cve_ids(alert_data)
+    cves = asyncio.ensure_future(threat_branch(lookup_cves(cve_ids)) if cve_ids and api.CTI_API_URL
+                                 else empty_branch())
+    related, results = [], exact
+    if need_controls or api.THREAT_INTEL_LIMIT:
+        embedding = (await get_embeddings([api.build_alert_query(alert_data)]))[0]
+        related, vector = await asyncio.gather(
+            threat_branch(search_threat_intel(embedding, api.THREAT_INTEL_LIMIT))
+            if api.THREAT_INTEL_LIMIT else empty_branch(),
+            search_controls_by_framework([embedding], per_framework) if need_controls else empty_branch()
+        )
+        if need_controls:
+            results = fill_by_framework(exact, vector[0], per_framework)
+
+    return results, api.format_threat_intel(await lookup, related, await cves)
+
+
+async def run_llm(level: int, fn, args: tuple, sheddable: bool = True,
+                  timeout: float = api.LLM_DEADLINE_SECONDS) -> tuple:
+    """
+    Mismo flujo que grc_api.run_llm (cola con prioridad, breaker), pero la espera en
+    cola es un await: sólo los workers de la cola LLM ocupan hilos
+    """
+    if not api.llm_breaker.allow():
+        return None, "circuit_open"
+    try:
+        with stage("llm"):
+            deadline = bounded_deadline(timeout)
+            future = api.llm_queue.submit(level, fn, *args, deadline=deadline, sheddable=sheddable)
+            try:
+                # Al expirar, wait_for cancela también el trabajo encolado
+                result = await asyncio.wait_for(asyncio.wrap_future(future),
+                                                max(0.0, deadline - time.monotonic()))
+            except asyncio.TimeoutError:
+                # cancel() sólo tiene éxito si el trabajo seguía en cola; en ejecución lo
+                # corta su propio deadline en el worker
+                raise LLMDeadlineExceeded(f"sin respuesta del LLM en {timeout}s", queued=future.cancel())
+        api.llm_breaker.record_success()
+        return result, "generated"
+    except LLMOverloadedError:
+        api.llm_breaker.release()
+        return None, "shed"
+    except LLMDeadlineExceeded as e:
+        if e.queued:
+            api.llm_breaker.release()
+        else:
+            api.llm_breaker.record_failure()
+        return None, "deadline_exceeded"
+    except Exception as e:
+        print(f"[ERROR] Generando reporte LLM: {e}")
+        api.llm_breaker.record_failure()
+        return None, "llm_error"
+
+
+def ollama_generate(loop, body: dict) -> dict:
+    """
+    Trabajo de la cola LLM: el worker conserva la prioridad, la concurrencia y el deadline
+    (call_timeout), pero la petición va por el cliente httpx del event loop, no por requests
+    """
+    timeout = call_timeout(api.LLM_TIMEOUT_SECONDS)
+    return asyncio.run_coroutine_threadsafe(
+        upstream_post("ollama", "/api/generate", body, timeout=timeout), loop).result()
+
+
+async def generate(kind: str, alert_data: dict, controls: list, body: dict, prompt_controls: list,
+                   sheddable: bool = True, timeout: float = api.LLM_DEADLINE_SECONDS) -> tuple:
+    """/api/generate por la cola LLM → (respuesta de Ollama o None, estado); registra tokens y uso del modelo"""
+    result, status = await run_llm(alert_priority(alert_data), ollama_generate,
+                                   (asyncio.get_running_loop(), body), sheddable, timeout)
+    if status == "generated":
+        api.model_warmer.record(api.LLM_MODEL, result)
+        api.record_llm_usage(result, alert_data, kind, len(prompt_controls), len(controls))
+    return result, status
+
+
+async def generate_report(alert_data: dict, controls: list, sheddable: bool = True,
+                          timeout: float = api.LLM_DEADLINE_SECONDS) -> dict:
+    """grc_api.generate_report con la espera del LLM en el event loop"""
+    body, prompt_controls = api.report_request(alert_data, controls)
+    result, status = await generate("report", alert_data, controls, body, prompt_controls, sheddable, timeout)
+    if status == "generated":
+        return {"report": result.get("response", "Error generando reporte"), "source": "llm", "status": status}
+    return api.template_report(alert_data, controls, alert_priority(alert_data), status)
+
+
+async def triage_alert(alert_data: dict, kind: str) -> dict:
+    """grc_api.triage_alert con el embedding (si las reglas no deciden) pedido en async"""
+    if not api.TRIAGE_ENABLED:
+        return {"route": "llm", "reason": "triage_disabled"}
+    with stage("triage"):
+        decision = api.triage.rule_decision(alert_data)
+        if decision is None:
+            embedding = (await get_embeddings([api.build_alert_query(alert_data)]))[0]
+            # kNN sobre la memoria (carga SQLite) y log JSONL: fuera del event loop
+            decision = await asyncio.to_thread(api.triage.knn_decision, kind, embedding,
+                                               api.gap_index.content_fingerprint, alert_data)
+    await asyncio.to_thread(api.triage.log, alert_data, kind, decision)
+    api.count_triage(kind, decision)
+    return decision
+
+
+async def remember_analysis(alert_data: dict, kind: str, result, decision: dict):
+    if not api.TRIAGE_ENABLED:
+        return
+    embedding = decision.get("embedding") or (await get_embeddings([api.build_alert_query(alert_data)]))[0]
+    await asyncio.to_thread(api.triage.memory.remember, kind, embedding, result,
+                            api.gap_index.content_fingerprint, alert_data)
+
+
+async def routed_report(alert_data: dict, controls: list) -> dict:
+    decision = await triage_alert(alert_data, "report")
+    if decision["route"] == ROUTE_CACHED:
+        report = {"report": decision["result"], "source": "cache", "status": "triage_cached"}
+    elif decision["route"] == ROUTE_MAPPING_ONLY:
+        report = {"report": None, "source": None, "status": "mapping_only"}
+    else:
+        report = await generate_report(alert_data, controls)
+        if report["source"] == "llm":
+            await remember_analysis(alert_data, "report", report["report"], decision)
+    report["triage"] = public_decision(decision)
+    return report
+
+
+async def analyze_soar_alert(alert_data: dict) -> dict:
+    """grc_api.analyze_soar_alert con recuperación, triage y espera del LLM asíncronos"""
+    results, threat_intel = await retrieve_alert_context(alert_data)
+    techniques = threat_intel["techniques"] if threat_intel else []
+    decision = await triage_alert(alert_data, "soar")
+    analysis = api.soar_triaged_analysis(alert_data, results[:5], techniques, decision)
+    if analysis is None:
+        body, prompt_controls = api.soar_request(alert_data, results[:5], techniques)
+        result, status = await generate("soar", alert_data, results[:5], body, prompt_controls)
+        generated = api.parse_soar_response(result.get("response", "")) if result is not None else None
+        analysis = api.soar_analysis(alert_data, results[:5], techniques, generated, status)
+        if analysis["status"] == "generated":
+            await remember_analysis(alert_data, "soar",
+                                    {k: analysis[k] for k in ("soc_analysis", "compliance_report")}, decision)
+    return api.soar_response(alert_data, results, threat_intel, analysis, decision)
+
+
+def timed(route: str):
+    """Server-Timing + histogramas por etapa para las rutas nativas (como el after_request de Flask)"""
+    def decorator(endpoint):
+        async def wrapper(request):
+            token = begin_request()
+            deadline_token = start_deadline(api.REQUEST_DEADLINE_SECONDS)
+            start = time.perf_counter()
+            try:
+                response = await endpoint(request)
+            finally:
+                end_deadline(deadline_token)
+                timings = end_request(token)
+            total = time.perf_counter() - start
+            response.headers['Server-Timing'] = api.observe_request(route, response.status_code, timings, total)
+            return response
+        return wrapper
+    return decorator
+
+
+async def read_json(request):
+    try:
+        return await request.json()
+    except ValueError:
+        return None
+
+
+@timed('/api/grc/search')
+async def search_controls(request):
+    data = await read_json(request) or {}
+    query = data.get('query', '')
+    limit = data.get('limit', 5)
+    mode = data.get('mode', api.SEARCH_MODE)
+
+    if not query:
+        return JSONResponse({"error": "Query requerida"}, status_code=400)
+    if mode not in api.SEARCH_MODES:
+        return JSONResponse({"error": f"Modo inválido, usar: {', '.join(api.SEARCH_MODES)}"}, status_code=400)
+
+    results, effective_mode = await hybrid_search_controls(query, limit, mode)
+    return JSONResponse(api.search_response(query, effective_mode, results))
+
+
+@timed('/api/grc/map-alert')
+async def map_alert_to_controls(request):
+    alert_data = await read_json(request)
+
+    if not alert_data:
+        return JSONResponse({"error": "Datos de alerta requeridos"}, status_code=400)
+
+    alert_data = dict(alert_data)
+    async_mode = bool(alert_data.pop('async', False)) or request.query_params.get('async') == '1'
+    callback_url = alert_data.pop('callback_url', None)
+    if callback_url and not callback_allowed(callback_url, api.CALLBACK_ALLOWED_HOSTS):
+        return JSONResponse({"error": "callback_url no permitido (GRC_CALLBACK_ALLOWED_HOSTS)"},
+                            status_code=400)
+
+    results, threat_intel = await retrieve_alert_context(alert_data)
+    compliance_mapping = api.build_compliance_mapping(results)
+
+    if async_mode:
+        try:
+            # Escritura SQLite fuera del event loop
+            job_id = await asyncio.to_thread(
+                api.job_queue.submit, alert_data, results[:5], compliance_mapping, callback_url
+            )
+        except QueueFullError as e:
+            return JSONResponse({"error": f"Cola de reportes llena: {e}"}, status_code=503)
+
+        return JSONResponse({
+            "job_id": job_id,
+            "status": "queued",
+            "status_url": f"/api/grc/jobs/{job_id}",
+            "alert": api.alert_summary(alert_data),
+            "compliance_mapping": compliance_mapping,
+            "threat_intelligence": threat_intel,
+            "ai_analysis": None,
+            "timestamp": datetime.now().isoformat()
+        }, status_code=202)
+
+    report = await routed_report(alert_data, results[:5])
+
+    return JSONResponse({
+        "alert": api.alert_summary(alert_data),
+        "compliance_mapping": compliance_mapping,
+        "threat_intelligence": threat_intel,
+        "ai_analysis": report["report"],
+        "report_source": report["source"],
+        "report_status": report["status"],
+        "triage": report["triage"],
+        "timestamp": datetime.now().isoformat()
+    })
+
+
+@timed('/api/grc/map-alerts')
+async def map_alerts_to_controls(request):
+    data = await read_json(request) or {}
+    alerts = data.get('alerts', [])
+    generate_reports = bool(data.get('generate_reports', False))
+
+    if not alerts or not isinstance(alerts, list):
+        return JSONResponse({"error": "Lista de alertas requerida"}, status_code=400)
+    if len(alerts) > api.BATCH_MAX_ALERTS:
+        return JSONResponse({"error": f"Máximo {api.BATCH_MAX_ALERTS} alertas por lote"}, status_code=400)
+
+    all_results = await retrieve_controls_batch(alerts)
+
+    reports = [{"report": None, "source": None, "status": "not_requested"}] * len(alerts)
+    if generate_reports:
+        semaphore = asyncio.Semaphore(api.BATCH_REPORT_CONCURRENCY)
+
+        async def bounded_report(alert_data, results):
+            async with semaphore:
+                return await routed_report(alert_data, results[:5])
+
+        reports = await asyncio.gather(*(bounded_report(a, r) for a, r in zip(alerts, all_results)))
+
+    mappings = []
+    for alert_data, results, report in zip(alerts, all_results, reports):
+        mappings.append({
+            "alert": api.alert_summary(alert_data),
+            "compliance_mapping": api.build_compliance_mapping(results),
+            "ai_analysis": report["report"],
+            "report_source": report["source"],
+            "report_status": report["status"],
+            "triage": report.get("triage")
+        })
+
+    return JSONResponse({
+        "total_alerts": len(mappings),
+        "results": mappings,
+        "timestamp": datetime.now().isoformat()
+    })
+
+
+@timed('/api/soar/alert')
+async def soar_alert(request):
+    body = await read_json(request)
+    if not isinstance(body, dict):
+        return JSONResponse({"error": "Webhook de Wazuh requerido"}, status_code=400)
+
+    alert_data = api.parse_wazuh_alert(body.get('body', body))
+    if not alert_data['rule_description']:
+        return JSONResponse({"error": "rule.description requerido"}, status_code=400)
+
+    response = await analyze_soar_alert(alert_data)
+    # Append al log de notificaciones (flock + write): fuera del event loop
+    response["notification"] = await asyncio.to_thread(api.notify_analysis, response)
+    return JSONResponse(response)
+
+
+@timed('/api/soar/events')
+async def soar_event(request):
+    payload = await request.body()
+    try:
+        body = json.loads(payload)
+    except ValueError:
+        body = None
+    if not isinstance(body, dict):
+        return JSONResponse({"error": "Webhook de Wazuh requerido"}, status_code=400)
+
+    event = body.get('body', body)
+    if not api.parse_wazuh_alert(event)['rule_description']:
+        return JSONResponse({"error": "rule.description requerido"}, status_code=400)
+
+    # El consumidor único del log agrega los eventos de todos los workers
+    offset = await asyncio.to_thread(api.ingest_log.append, payload)
+    return JSONResponse({
+        "status": "accepted",
+        "offset": offset,
+        "window_seconds": api.AGGREGATION_WINDOW_SECONDS
+    }, status_code=202)
+
+
+app = Starlette(
+    routes=[
+        Route('/api/grc/search', search_controls, methods=['POST']),
+        Route('/api/grc/map-alert', map_alert_to_controls, methods=['POST']),
+        Route('/api/grc/map-alerts', map_alerts_to_controls, methods=['POST']),
+        Route('/api/soar/alert', soar_alert, methods=['POST']),
+        Route('/api/soar/events', soar_event, methods=['POST']),
+        # health, metrics, models, jobs, gap-analysis, replay, incidentes: app Flask sin cambios
+        Mount('/', app=WSGIMiddleware(api.app, workers=WSGI_THREADS)),
+    ],
+    lifespan=lifespan
+)
+
+
+if __name__ == '__main__':
+    import uvicorn
+
+    print("=" * 60)
+    print("🏛️  GRC API Server (ASGI) - ISO 27001 & NIST 800-53")
+    print("=" * 60)
+    print(f"⏰ Iniciado: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+    print(f"🔌 Pool upstream: {UPSTREAM_MAX_CONNECTIONS} conexiones, {UPSTREAM_MAX_KEEPALIVE} keep-alive")
+    uvicorn.run(app, host='0.0.0.0', port=int(os.getenv('GRC_PORT', 5000)))
@@ -0,0 +1,490 @@
+#!/usr/bin/env python3
+"""
+GRC Catalog - Índices en memoria sobre el catálogo de controles
+Se construyen una sola vez al arrancar la API
+"""
+
+import hashlib
+import json
+import math
+import re
+from collections import Counter
+from typing import Dict, List
+
+from index_grc_controls import ISO_27001_CONTROLS, NIST_800_53_CONTROLS
+
+MITRE_ID_PATTERN = re.compile(r"T\d{4}(?:\.\d{3})?", re.IGNORECASE)
+CVE_ID_PATTERN = re.compile(r"CVE-\d{4}-\d{4,}", re.IGNORECASE)
+
+# Identificadores que el embedding maneja mal: AC-7, A.8.5, CVE-2024-1234, T1110.001
+IDENTIFIER_PATTERN = re.compile(
+    r"cve-\d{4}-\d{4,}|t\d{4}(?:\.\d{3})?|(?:iso-|nist-)?(?:a\.\d+(?:\.\d+)*|[a-z]{2}-\d+(?:\(\d+\))?)",
+    re.IGNORECASE
+)
+WORD_PATTERN = re.compile(r"[a-z0-9]+")
+
+# Parámetros BM25 y reciprocal rank fusion
+BM25_K1 = 1.2
+BM25_B = 0.75
+RRF_K = 60
+
+# Puntuación de cada tipo de coincidencia MITRE
+MITRE_EXACT_SCORE = 1.0
+MITRE_PARENT_SCORE = 0.9   # alerta T1110.001 → control mapeado a T1110
+MITRE_CHILD_SCORE = 0.8    # alerta T1110 → control mapeado a T1110.001
+
+# Brechas críticas: familias NIST de control de acceso/identidad y sus equivalentes ISO
+CRITICAL_NIST_FAMILIES = ('AC', 'IA')
+CRITICAL_CONTROL_IDS = ('ISO-A.8.5', 'ISO-A.5.15')
+
+# Un control implementado acredita sus equivalentes hasta esta distancia en el crosswalk
+CREDIT_MAX_HOPS = 1
+# Profundidad máxima de la clausura del crosswalk: más allá de 2-3 saltos las cadenas
+# ISO → NIST → ISO enlazan casi todo el catálogo y dejan de ser equivalencias
+CROSSWALK_MAX_HOPS = 2
+
+
+def load_controls() -> List[Dict]:
+    """Catálogo completo ISO 27001 + NIST 800-53"""
+    return ISO_27001_CONTROLS + NIST_800_53_CONTROLS
+
+
+def catalog_fingerprint(controls: List[Dict]) -> str:
+    """Huella del contenido completo del catálogo (mitre_mapping, textos, guías...)"""
+    return hashlib.md5(json.dumps(controls, sort_keys=True).encode()).hexdigest()
+
+
+def parse_mitre_ids(value) -> List[str]:
+    """Extrae IDs de técnica de un campo Wazuh ("T1110", ["T1110.001"], "N/A"...)"""
+    if not value:
+        return []
+    if isinstance(value, (list, tuple)):
+        value = " ".join(str(v) for v in value)
+    return list(dict.fromkeys(m.upper() for m in MITRE_ID_PATTERN.findall(str(value))))
+
+
+def parse_cve_ids(*values) -> List[str]:
+    """IDs CVE citados en campos de la alerta (data.vulnerability.cve, descripción...)"""
+    text = " ".join(str(v) for v in values if v)
+    return list(dict.fromkeys(c.upper() for c in CVE_ID_PATTERN.findall(text)))
+
+
+class MitreIndex:
+    """Índice invertido técnica/sub-técnica ATT&CK → controles"""
+
+    def __init__(self, controls: List[Dict]):
+        self.controls = {c['id']: c for c in controls}
+        self.by_technique: Dict[str, List[str]] = {}
+        self.subtechniques: Dict[str, set] = {}
+
+        for control in controls:
+            for technique in control.get('mitre_mapping', []):
+                technique = technique.upper()
+                self.by_technique.setdefault(technique, []).append(control['id'])
+                if '.' in technique:
+                    parent = technique.split('.')[0]
+                    self.subtechniques.setdefault(parent, set()).add(technique)
+
+    def search(self, mitre_value) -> List[Dict]:
+        """
+        Controles con mapeo exacto a las técnicas de la alerta, incluyendo
+        roll-up padre/sub-técnica. Devuelve hits con el formato de Qdrant.
+        """
+        scores: Dict[str, float] = {}
+
+        def add(technique: str, score: float):
+            for control_id in self.by_technique.get(technique, []):
+                scores[control_id] = max(scores.get(control_id, 0.0), score)
+
+        for technique in parse_mitre_ids(mitre_value):
+            add(technique, MITRE_EXACT_SCORE)
+            if '.' in technique:
+                add(technique.split('.')[0], MITRE_PARENT_SCORE)
+            else:
+                for sub in self.subtechniques.get(technique, ()):
+                    add(sub, MITRE_CHILD_SCORE)
+
+        ranked = sorted(scores.items(), key=lambda item: (-item[1], item[0]))
+        return [
+            {"id": control_id, "score": score, "payload": self.controls[control_id], "match": "mitre"}
+            for control_id, score in ranked
+        ]
+
+
+def tokenize(text: str) -> List[str]:
+    """Palabras en minúsculas + identificadores completos (ac-7, a.8.5, cve-...)"""
+    text = text.lower()
+    tokens = WORD_PATTERN.findall(text)
+    for identifier in IDENTIFIER_PATTERN.findall(text):
+        tokens.append(identifier)
+        # "nist-ac-7" también indexa "ac-7"; "iso-a.8.5" también "a.8.5"
+        if identifier.startswith(("iso-", "nist-")):
+            tokens.append(identifier.split("-", 1)[1])
+    return tokens
+
+
+def is_identifier_query(query: str) -> bool:
+    """True si la consulta sólo contiene identificadores (no requiere embedding)"""
+    parts = [p for p in re.split(r"[\s,;]+", query.strip()) if p]
+    return bool(parts) and all(IDENTIFIER_PATTERN.fullmatch(p) for p in parts)
+
+
+class LexicalIndex:
+    """Índice invertido BM25 sobre ID, nombre, descripción y guía de cada control"""
+
+    FIELDS = ('id', 'name', 'description', 'implementation_guidance')
+
+    def __init__(self, controls: List[Dict]):
+        self.controls = controls
+        self.postings: Dict[str, List[tuple]] = {}
+        self.doc_lengths: List[int] = []
+
+        for doc_id, control in enumerate(controls):
+            terms = Counter(tokenize(" ".join(str(control.get(f, '')) for f in self.FIELDS)))
+            self.doc_lengths.append(sum(terms.values()))
+            for term, tf in terms.items():
+                self.postings.setdefault(term, []).append((doc_id, tf))
+
+        total = len(self.doc_lengths)
+        self.avg_length = sum(self.doc_lengths) / total if total else 0.0
+        self.idf = {
+            term: math.log(1 + (total - len(docs) + 0.5) / (len(docs) + 0.5))
+            for term, docs in self.postings.items()
+        }
+
+    def search(self, query: str, limit: int = 5) -> List[Dict]:
+        """Top-k por BM25, con el score normalizado al mejor resultado (0-1)"""
+        scores: Dict[int, float] = {}
+        for term in set(tokenize(query)):
+            idf = self.idf.get(term)
+            if idf is None:
+                continue
+            for doc_id, tf in self.postings[term]:
+                norm = BM25_K1 * (1 - BM25_B + BM25_B * self.doc_lengths[doc_id] / self.avg_length)
+                scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (BM25_K1 + 1) / (tf + norm)
+
+        ranked = sorted(scores.items(), key=lambda item: -item[1])[:limit]
+        top = ranked[0][1] if ranked else 1.0
+        return [
+            {"id": self.controls[doc_id]['id'], "score": score / top,
+             "payload": self.controls[doc_id], "match": "lexical"}
+            for doc_id, score in ranked
+        ]
+
+
+def reciprocal_rank_fusion(*rankings: List[Dict], limit: int = 5) -> List[Dict]:
+    """
+    Fusiona rankings por RRF. score es la suma de 1/(k + rank) normalizada al máximo
+    posible (1.0 = primero en todos los rankings). Los scores de origen no son
+    comparables entre sí (BM25 normalizado al mejor vs. coseno): se conservan aparte
+    como lexical_score / vector_score.
+    """
+    fused: Dict[str, float] = {}
+    hits: Dict[str, Dict] = {}
+    sources: Dict[str, Dict[str, float]] = {}
+    for ranking in rankings:
+        for rank, hit in enumerate(ranking, start=1):
+            control_id = hit['payload']['id']
+            fused[control_id] = fused.get(control_id, 0.0) + 1.0 / (RRF_K + rank)
+            hits.setdefault(control_id, hit)
+            sources.setdefault(control_id, {})[f"{hit.get('match', 'vector')}_score"] = hit['score']
+
+    max_score = len(rankings) / (RRF_K + 1)
+    ranked = sorted(fused, key=lambda control_id: -fused[control_id])[:limit]
+    return [
+        dict(hits[control_id], score=fused[control_id] / max_score, match="hybrid", **sources[control_id])
+        for control_id in ranked
+    ]
+
+
+def frameworks_short(hits: List[Dict], frameworks, per_framework: int) -> bool:
+    """True si algún framework tiene menos de per_framework controles en hits"""
+    counts = Counter(h['payload']['framework'] for h in hits)
+    return any(counts[framework] < per_framework for framework in frameworks)
+
+
+def fill_by_framework(exact: List[Dict], vector: List[Dict], per_framework: int) -> List[Dict]:
+    """
+    Coincidencias exactas primero; cada framework se completa hasta per_framework con
+    resultados vectoriales/híbridos (sin duplicados)
+    """
+    seen = {r['payload']['id'] for r in exact}
+    counts = Counter(r['payload']['framework'] for r in exact)
+    filled = list(exact)
+    for hit in vector:
+        control = hit['payload']
+        if control['id'] in seen or counts[control['framework']] >= per_framework:
+            continue
+        seen.add(control['id'])
+        counts[control['framework']] += 1
+        filled.append(hit)
+    return filled
+
+
+def normalize_node_id(value: str) -> str:
+    """'a.5.15' → 'ISO-A.5.15', 'ac-7' → 'NIST-AC-7', 't1110' → 'T1110'"""
+    value = str(value).strip().upper()
+    if MITRE_ID_PATTERN.fullmatch(value):
+        return value
+    if value.startswith(('ISO-', 'NIST-')):
+        return value
+    if value.startswith('A.'):
+        return f"ISO-{value}"
+    return f"NIST-{value}"
+
+
+class CrosswalkIndex:
+    """
+    Grafo ISO ↔ NIST ↔ ATT&CK precomputado desde nist_mapping, iso_mapping y mitre_mapping.
+    Nodos numerados con listas de adyacencia; las equivalencias entre controles (sin
+    atravesar técnicas) hasta max_hops saltos se calculan una vez por BFS desde cada nodo.
+    """
+
+    def __init__(self, controls: List[Dict], max_hops: int = CROSSWALK_MAX_HOPS):
+        self.max_hops = max_hops
+        self.catalog = {c['id']: c for c in controls}
+        self.nodes: List[str] = []
+        self.node_index: Dict[str, int] = {}
+        self.equivalent_edges: List[set] = []   # control ↔ control
+        self.technique_edges: List[set] = []    # control ↔ técnica
+
+        for control in controls:
+            node = self._node(control['id'])
+            for target in control.get('nist_mapping', []) + control.get('iso_mapping', []):
+                self._link(self.equivalent_edges, node, self._node(normalize_node_id(target)))
+            for technique in control.get('mitre_mapping', []):
+                self._link(self.technique_edges, node, self._node(technique.upper()))
+
+        # Adyacencia congelada en tuplas ordenadas por ID
+        order = lambda i: self.nodes[i]
+        self.equivalents = [tuple(sorted(edges, key=order)) for edges in self.equivalent_edges]
+        self.techniques = [tuple(sorted(edges, key=order)) for edges in self.technique_edges]
+        self.closure = [self._bfs(i) for i in range(len(self.nodes))]
+        del self.equivalent_edges, self.technique_edges
+
+    def _node(self, node_id: str) -> int:
+        i = self.node_index.get(node_id)
+        if i is None:
+            i = self.node_index[node_id] = len(self.nodes)
+            self.nodes.append(node_id)
+            self.equivalent_edges.append(set())
+            self.technique_edges.append(set())
+        return i
+
+    @staticmethod
+    def _link(edges: List[set], a: int, b: int):
+        if a != b:
+            edges[a].add(b)
+            edges[b].add(a)
+
+    def _bfs(self, start: int) -> tuple:
+        """((nodo, saltos), ...) alcanzables en max_hops equivalencias, por distancia e ID"""
+        if self.is_technique(start):
+            return ()
+        hops = {start: 0}
+        frontier = [start]
+        for _ in range(self.max_hops):
+            next_frontier = []
+            for node in frontier:
+                for neighbour in self.equivalent_edges[node]:
+                    if neighbour not in hops:
+                        hops[neighbour] = hops[node] + 1
+                        next_frontier.append(neighbour)
+            frontier = next_frontier
+        del hops[start]
+        return tuple(sorted(hops.items(), key=lambda item: (item[1], self.nodes[item[0]])))
+
+    def is_technique(self, i: int) -> bool:
+        return bool(MITRE_ID_PATTERN.fullmatch(self.nodes[i]))
+
+    def equivalent_ids(self, control_id: str, max_hops: int = None) -> List[str]:
+        i = self.node_index.get(control_id)
+        if i is None:
+            return []
+        return [self.nodes[j] for j, hops in self.closure[i] if max_hops is None or hops <= max_hops]
+
+    def _describe(self, i: int, **extra) -> Dict:
+        node_id = self.nodes[i]
+        control = self.catalog.get(node_id)
+        return {
+            "id": node_id,
+            "framework": control['framework'] if control else None,
+            "name": control['name'] if control else None,
+            "in_catalog": control is not None,
+            **extra
+        }
+
+    def lookup(self, node_id: str, max_hops: int = 1) -> Dict:
+        """Vecindario de un control o técnica (por defecto sólo equivalencias directas); None si no existe"""
+        i = self.node_index.get(normalize_node_id(node_id))
+        if i is None:
+            return None
+        closure = [(j, hops) for j, hops in self.closure[i] if max_hops is None or hops <= max_hops]
+
+        if self.is_technique(i):
+            direct = self.techniques[i]
+            seen = set(direct)
+            via_crosswalk = []
+            for control in direct:
+                for j, hops in self.closure[control]:
+                    if j not in seen and (max_hops is None or hops <= max_hops):
+                        seen.add(j)
+                        via_crosswalk.append(self._describe(j, via=self.nodes[control], hops=hops))
+            return {
+                "id": self.nodes[i],
+                "type": "technique",
+                "controls": [self._describe(j, hops=0) for j in direct],
+                "equivalent_controls": via_crosswalk
+            }
+
+        techniques = {self.nodes[t] for t in self.techniques[i]}
+        for j, _ in closure:
+            techniques.update(self.nodes[t] for t in self.techniques[j])
+        return {
+            **self._describe(i),
+            "type": "control",
+            "direct_equivalents": [self._describe(j, hops=1) for j in self.equivalents[i]],
+            "equivalents": [self._describe(j, hops=hops) for j, hops in closure],
+            "direct_techniques": [self.nodes[t] for t in self.techniques[i]],
+            "techniques": sorted(techniques)
+        }
+
+    def stats(self) -> Dict:
+        techniques = sum(1 for i in range(len(self.nodes)) if self.is_technique(i))
+        return {
+            "nodes": len(self.nodes),
+            "controls": len(self.nodes) - techniques,
+            "controls_in_catalog": len(self.catalog),
+            "techniques": techniques,
+            "equivalence_edges": sum(len(e) for e in self.equivalents) // 2,
+            "technique_edges": sum(len(e) for e in self.techniques) // 2,
+            "max_hops": self.max_hops,
+            "largest_closure": max((len(c) for c in self.closure), default=0)
+        }
+
+
+def _bit_count(mask: int) -> int:
+    return bin(mask).count("1")
+
+
+class GapIndex:
+    """
+    Bitsets precomputados sobre el catálogo (un bit por control) por framework,
+    familia/categoría y criticidad. Un análisis de brechas es un OR de los bits
+    implementados y unas pocas operaciones AND/NOT sobre enteros.
+    """
+
+    def __init__(self, controls: List[Dict], crosswalk: "CrosswalkIndex" = None,
+                 credit_max_hops: int = CREDIT_MAX_HOPS):
+        self.ids = [c['id'] for c in controls]
+        self.position = {control_id: i for i, control_id in enumerate(self.ids)}
+        self.all_mask = (1 << len(self.ids)) - 1
+        self.by_framework: Dict[str, int] = {}
+        self.by_group: Dict[str, Dict[str, int]] = {}
+        self.critical_mask = 0
+        # Ámbitos de agregación de cada control (inventarios con contadores incrementales)
+        self.scopes: Dict[str, tuple] = {}
+        self.scope_totals: Dict[str, int] = {}
+
+        for i, control in enumerate(controls):
+            bit = 1 << i
+            framework = control['framework']
+            group = control.get('family') or control.get('category') or 'Other'
+            self.by_framework[framework] = self.by_framework.get(framework, 0) | bit
+            groups = self.by_group.setdefault(framework, {})
+            groups[group] = groups.get(group, 0) | bit
+            scopes = ["all", f"framework:{framework}", f"group:{framework}/{group}"]
+            if self.is_critical(control):
+                self.critical_mask |= bit
+                scopes.append("critical")
+            self.scopes[control['id']] = tuple(scopes)
+            for scope in scopes:
+                self.scope_totals[scope] = self.scope_totals.get(scope, 0) + 1
+
+        # fingerprint: sólo IDs y ámbitos (recalcular inventarios); content_fingerprint: todo el
+        # contenido (invalida mapeos materializados y análisis reutilizados por el triage)
+        self.fingerprint = hashlib.md5(json.dumps(sorted(self.scopes.items())).encode()).hexdigest()
+        self.content_fingerprint = catalog_fingerprint(controls)
+
+        # Por control: bitset de los equivalentes que acredita (vía crosswalk)
+        self.credit_masks = [0] * len(self.ids)
+        if crosswalk is not None:
+            for i, control_id in enumerate(self.ids):
+                self.credit_masks[i], _ = self.mask_of(crosswalk.equivalent_ids(control_id, credit_max_hops))
+
+    def credited_by(self, implemented_mask: int) -> int:
+        """Controles no implementados cubiertos por equivalencia con alguno implementado"""
+        credited = 0
+        mask = implemented_mask
+        while mask:
+            low = mask & -mask
+            credited |= self.credit_masks[low.bit_length() - 1]
+            mask ^= low
+        return credited & ~implemented_mask
+
+    @staticmethod
+    def is_critical(control: Dict) -> bool:
+        control_id = control['id']
+        if control_id in CRITICAL_CONTROL_IDS:
+            return True
+        return control_id.startswith('NIST-') and control_id[5:].split('-')[0] in CRITICAL_NIST_FAMILIES
+
+    def mask_of(self, control_ids) -> tuple:
+        """(bitset de los IDs conocidos, IDs que no existen en el catálogo)"""
+        mask = 0
+        unknown = []
+        for control_id in control_ids:
+            i = self.position.get(control_id)
+            if i is None:
+                unknown.append(control_id)
+            else:
+                mask |= 1 << i
+        return mask, unknown
+
+    def ids_of(self, mask: int, offset: int = 0, limit: int = None) -> List[str]:
+        """IDs de los bits activos, en orden de catálogo (paginado)"""
+        result = []
+        skipped = 0
+        while mask and (limit is None or len(result) < limit):
+            low = mask & -mask
+            if skipped < offset:
+                skipped += 1
+            else:
+                result.append(self.ids[low.bit_length() - 1])
+            mask ^= low
+        return result
+
+    @staticmethod
+    def coverage(total_mask: int, implemented_mask: int, credited_mask: int = 0) -> Dict:
+        """implemented: declarados; credited: cubiertos por equivalencia; covered: ambos"""
+        total = _bit_count(total_mask)
+        covered = _bit_count(total_mask & (implemented_mask | credited_mask))
+        return {
+            "total_controls": total,
+            "implemented": _bit_count(total_mask & implemented_mask),
+            "credited": _bit_count(total_mask & credited_mask),
+            "covered": covered,
+            "gaps": total - covered,
+            "compliance_percentage": round(covered / total * 100, 2) if total else 0
+        }
+
+    def analyze(self, implemented_mask: int, offset: int = 0, limit: int = None,
+                critical_limit: int = 10, credit_equivalents: bool = False) -> Dict:
+        implemented_mask &= self.all_mask
+        credited_mask = self.credited_by(implemented_mask) if credit_equivalents else 0
+        gaps_mask = self.all_mask & ~(implemented_mask | credited_mask)
+        return {
+            "summary": self.coverage(self.all_mask, implemented_mask, credited_mask),
+            "by_framework": {
+                framework: {
+                    **self.coverage(mask, implemented_mask, credited_mask),
+                    "groups": {group: self.coverage(group_mask, implemented_mask, credited_mask)
+                               for group, group_mask in self.by_group[framework].items()}
+                }
+                for framework, mask in self.by_framework.items()
+            },
+            "implemented_controls": self.ids_of(implemented_mask),
+            "credited_controls": self.ids_of(credited_mask),
+            "missing_controls": self.ids_of(gaps_mask, offset, limit),
+            "critical_gaps": self.ids_of(gaps_mask & self.critical_mask, 0, critical_limit)
+        }
@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+GRC Incidents - Incidentes analizados y estado del agregador compartidos entre workers
+Sólo el dueño del consumidor del log agrega y analiza; con varios workers de gunicorn
+las lecturas (GET /api/soar/incidents, /api/soar/notifications) llegan a cualquiera.
+El dueño escribe aquí los incidentes y publica periódicamente el estado que vive en su
+memoria (grupos abiertos, despachador Telegram); el resto de workers lo leen.
+También guarda el rango de offsets del log de cada incidente analizado: al releer desde
+el checkpoint tras un reinicio, sus eventos no forman de nuevo el mismo incidente.
+"""
+
+import json
+import sqlite3
+import threading
+from datetime import datetime
+from typing import Dict, List, Optional
+
+
+class IncidentStore:
+    """SQLite en modo WAL: un proceso escribe, todos leen"""
+
+    def __init__(self, path: str, history: int = 200):
+        self.path = path
+        self.history = history
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.row_factory = sqlite3.Row
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS incidents (
+                    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                    incident_id TEXT NOT NULL,
+                    response TEXT NOT NULL,
+                    created_at TEXT NOT NULL
+                )
+            """)
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS snapshots (
+                    name TEXT PRIMARY KEY,
+                    state TEXT NOT NULL,
+                    updated_at TEXT NOT NULL
+                )
+            """)
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS analyzed (
+                    agg_key TEXT NOT NULL,
+                    first_offset INTEGER NOT NULL,
+                    last_offset INTEGER NOT NULL
+                )
+            """)
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_analyzed_key ON analyzed (agg_key, first_offset)")
+            row = self._conn.execute("SELECT MAX(last_offset) AS last FROM analyzed").fetchone()
+        self._max_offset = row["last"] if row["last"] is not None else -1
+
+    def add(self, response: dict):
+        """Guarda un incidente analizado y conserva sólo los history más recientes"""
+        incident_id = (response.get("incident") or {}).get("incident_id") or ""
+        with self._lock, self._conn:
+            cursor = self._conn.execute(
+                "INSERT INTO incidents (incident_id, response, created_at) VALUES (?, ?, ?)",
+                (incident_id, json.dumps(response), datetime.now().isoformat())
+            )
+            self._conn.execute("DELETE FROM incidents WHERE seq <= ?", (cursor.lastrowid - self.history,))
+
+    def mark_analyzed(self, key: list, first_offset: int, last_offset: int):
+        """Los eventos de key en [first_offset, last_offset] ya tienen su incidente analizado"""
+        with self._lock, self._conn:
+            self._conn.execute("INSERT INTO analyzed (agg_key, first_offset, last_offset) VALUES (?, ?, ?)",
+                               (json.dumps(key), first_offset, last_offset))
+            self._max_offset = max(self._max_offset, last_offset)
+
+    def analyzed(self, key: list, offset: int) -> bool:
+        """¿El evento (key, offset) pertenece a un incidente ya analizado?"""
+        if offset > self._max_offset:
+            # Caso normal: evento nuevo, sin consulta
+            return False
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT 1 FROM analyzed WHERE agg_key = ? AND first_offset <= ? AND last_offset >= ? LIMIT 1",
+                (json.dumps(key), offset, offset)
+            ).fetchone()
+        return row is not None
+
+    def forget_before(self, offset: int) -> int:
+        """Descarta los rangos que el consumidor ya no releerá (anteriores a su checkpoint)"""
+        with self._lock, self._conn:
+            return self._conn.execute("DELETE FROM analyzed WHERE last_offset < ?", (offset,)).rowcount
+
+    def recent(self, limit: int = 50) -> List[Dict]:
+        """Más nuevos primero"""
+        limit = max(0, min(limit, self.history))
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT response FROM incidents ORDER BY seq DESC LIMIT ?", (limit,)
+            ).fetchall()
+        return [json.loads(row["response"]) for row in rows]
+
+    def publish(self, name: str, state: dict):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO snapshots (name, state, updated_at) VALUES (?, ?, ?) "
+                "ON CONFLICT(name) DO UPDATE SET state = excluded.state, updated_at = excluded.updated_at",
+                (name, json.dumps(state), datetime.now().isoformat())
+            )
+
+    def snapshot(self, name: str) -> Optional[Dict]:
+        """Último estado publicado por el dueño, con su updated_at (None si nunca se publicó)"""
+        with self._lock:
+            row = self._conn.execute("SELECT state, updated_at FROM snapshots WHERE name = ?", (name,)).fetchone()
+        return {**json.loads(row["state"]), "updated_at": row["updated_at"]} if row else None
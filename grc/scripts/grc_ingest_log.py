@@ -0,0 +1,344 @@
+#!/usr/bin/env python3
+"""
+GRC Ingest Log - Registro de ingesta en disco, segmentado y de sólo anexado
+Los webhooks de Wazuh/n8n se confirman en cuanto el evento está escrito en el log
+(coste constante, independiente del LLM); un consumidor lo procesa en segundo plano
+con offsets confirmados en disco y cualquier rango de tiempo puede volver a
+reproducirse tras un cambio de modelo o de catálogo.
+
+Formato:
+  <dir>/<base:020d>.log     segmentos; base = offset (en bytes) de su primer registro
+  registro                  cabecera <IId (longitud, crc32, timestamp) + JSON
+  <dir>/consumers/<n>.offset checkpoint del consumidor n (escritura atómica)
+
+El offset de un registro es su posición global en bytes: leer desde un offset es un
+seek, sin índices. Varios procesos (workers de gunicorn) anexan al mismo log
+serializados con flock; un único proceso consume (lock no bloqueante por consumidor).
+"""
+
+import bisect
+import fcntl
+import json
+import os
+import struct
+import threading
+import time
+import zlib
+from datetime import datetime
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+HEADER = struct.Struct("<IId")
+SEGMENT_SUFFIX = ".log"
+
+
+def segment_name(base: int) -> str:
+    return f"{base:020d}{SEGMENT_SUFFIX}"
+
+
+class IngestLog:
+    """
+    append() es O(1): flock + write + (fsync cada fsync_seconds; 0 = en cada evento).
+    Un segmento se cierra al superar segment_bytes; el siguiente empieza en el offset
+    donde terminó el anterior, así los offsets son contiguos entre segmentos.
+    """
+
+    def __init__(self, directory: str, segment_bytes: int = 64 * 1024 * 1024,
+                 fsync_seconds: float = 1.0):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.fsync_seconds = fsync_seconds
+        os.makedirs(os.path.join(directory, "consumers"), exist_ok=True)
+        self._lock = threading.Lock()
+        self._lock_fd = os.open(os.path.join(directory, ".append.lock"), os.O_CREAT | os.O_RDWR, 0o644)
+        self._base: Optional[int] = None
+        self._fd: Optional[int] = None
+        self._last_fsync = 0.0
+        with self._lock, self._file_lock():
+            self._recover()
+
+    def _file_lock(self):
+        return _FileLock(self._lock_fd)
+
+    def segments(self) -> List[int]:
+        return sorted(
+            int(name[:-len(SEGMENT_SUFFIX)]) for name in os.listdir(self.directory)
+            if name.endswith(SEGMENT_SUFFIX) and name[:-len(SEGMENT_SUFFIX)].isdigit()
+        )
+
+    def _path(self, base: int) -> str:
+        return os.path.join(self.directory, segment_name(base))
+
+    def _recover(self):
+        """Trunca un registro incompleto al final del último segmento (caída a mitad de escritura)"""
+        bases = self.segments()
+        if not bases:
+            return
+        path = self._path(bases[-1])
+        with open(path, "rb") as f:
+            for _ in _scan(f, 0):
+                pass
+            valid = f.tell()
+        size = os.path.getsize(path)
+        if valid < size:
+            print(f"[ERROR] Log de ingesta: {size - valid} bytes incompletos truncados en {path}")
+            os.truncate(path, valid)
+
+    def _open_active(self):
+        """Abre (o crea) el segmento activo; llamado con el flock tomado"""
+        if self._fd is not None and os.fstat(self._fd).st_size < self.segment_bytes:
+            return
+        bases = self.segments()
+        if self._base is not None and bases and bases[-1] == self._base:
+            # Segmento lleno y nadie ha rotado todavía: se abre el siguiente
+            base = self._base + os.fstat(self._fd).st_size
+        elif bases:
+            base = bases[-1]
+            if os.path.getsize(self._path(base)) >= self.segment_bytes:
+                base += os.path.getsize(self._path(base))
+        else:
+            base = 0
+        if self._fd is not None:
+            os.fsync(self._fd)
+            os.close(self._fd)
+        self._fd = os.open(self._path(base), os.O_CREAT | os.O_WRONLY | os.O_APPEND, 0o644)
+        self._base = base
+
+    def append(self, payload: bytes, timestamp: Optional[float] = None) -> int:
+        """Escribe un evento (JSON ya serializado) y devuelve su offset"""
+        timestamp = time.time() if timestamp is None else timestamp
+        record = HEADER.pack(len(payload), zlib.crc32(payload), timestamp) + payload
+        with self._lock, self._file_lock():
+            self._open_active()
+            offset = self._base + os.fstat(self._fd).st_size
+            os.write(self._fd, record)
+            if time.monotonic() - self._last_fsync >= self.fsync_seconds:
+                os.fsync(self._fd)
+                self._last_fsync = time.monotonic()
+        return offset
+
+    def end_offset(self) -> int:
+        bases = self.segments()
+        return bases[-1] + os.path.getsize(self._path(bases[-1])) if bases else 0
+
+    def read(self, offset: int, max_records: int = 100) -> Tuple[List[Tuple[int, float, bytes]], int]:
+        """Hasta max_records registros desde offset → (registros, siguiente offset)"""
+        records = []
+        bases = self.segments()
+        while len(records) < max_records and bases:
+            index = bisect.bisect_right(bases, offset) - 1
+            if index < 0:
+                # Offset anterior a la retención: se continúa en el segmento más antiguo
+                offset = bases[0]
+                index = 0
+            base = bases[index]
+            try:
+                f = open(self._path(base), "rb")
+            except FileNotFoundError:
+                # Borrado por retención entre el listado y la apertura
+                bases = self.segments()
+                continue
+            with f:
+                for position, timestamp, payload in _scan(f, offset - base):
+                    records.append((base + position, timestamp, payload))
+                    if len(records) >= max_records:
+                        break
+                offset = base + f.tell()
+            if len(records) >= max_records or index + 1 == len(bases):
+                break
+            # Segmento cerrado: lo que queda sin leer sólo puede ser un registro corrupto
+            if offset < bases[index + 1]:
+                print(f"[ERROR] Log de ingesta: registro corrupto en {offset}, "
+                      f"se salta al segmento {bases[index + 1]}")
+            offset = bases[index + 1]
+        return records, offset
+
+    def replay(self, start: float, end: float) -> Iterator[Tuple[int, float, bytes]]:
+        """Registros con timestamp en [start, end], empezando en el segmento que contiene start"""
+        bases = self.segments()
+        first = 0
+        for i, base in enumerate(bases):
+            timestamp = self._first_timestamp(base)
+            if timestamp is not None and timestamp <= start:
+                first = i
+        offset = bases[first] if bases else 0
+        while True:
+            records, offset = self.read(offset, 500)
+            if not records:
+                return
+            for record in records:
+                if record[1] > end:
+                    return
+                if record[1] >= start:
+                    yield record
+
+    def _first_timestamp(self, base: int) -> Optional[float]:
+        try:
+            with open(self._path(base), "rb") as f:
+                header = f.read(HEADER.size)
+        except FileNotFoundError:
+            return None
+        return HEADER.unpack(header)[2] if len(header) == HEADER.size else None
+
+    def delete_before(self, offset: int, older_than: float) -> int:
+        """Borra segmentos completos anteriores a offset cuyo último evento es previo a older_than"""
+        deleted = 0
+        with self._lock, self._file_lock():
+            bases = self.segments()
+            for base, next_base in zip(bases, bases[1:]):
+                timestamp = self._first_timestamp(next_base)
+                if next_base > offset or timestamp is None or timestamp >= older_than:
+                    break
+                os.remove(self._path(base))
+                deleted += 1
+        return deleted
+
+    def status(self) -> Dict:
+        bases = self.segments()
+        return {
+            "directory": self.directory,
+            "segments": len(bases),
+            "start_offset": bases[0] if bases else 0,
+            "end_offset": self.end_offset(),
+            "segment_bytes": self.segment_bytes
+        }
+
+
+class _FileLock:
+    def __init__(self, fd: int):
+        self.fd = fd
+
+    def __enter__(self):
+        fcntl.flock(self.fd, fcntl.LOCK_EX)
+
+    def __exit__(self, *exc):
+        fcntl.flock(self.fd, fcntl.LOCK_UN)
+
+
+def _scan(f, position: int) -> Iterator[Tuple[int, float, bytes]]:
+    """Registros completos y válidos desde position; se detiene en el primero que no lo es"""
+    f.seek(position)
+    while True:
+        header = f.read(HEADER.size)
+        if len(header) < HEADER.size:
+            f.seek(position)
+            return
+        length, crc, timestamp = HEADER.unpack(header)
+        payload = f.read(length)
+        if len(payload) < length or zlib.crc32(payload) != crc:
+            f.seek(position)
+            return
+        yield position, timestamp, payload
+        position = f.tell()
+
+
+class LogConsumer:
+    """
+    Procesa el log desde el último offset confirmado (al menos una vez). Sólo un proceso
+    consume: el que obtiene el lock. La lectura avanza en memoria (position); el
+    checkpoint se limita a low_watermark() para que los eventos que el handler aún
+    retiene (grupos abiertos, incidentes sin analizar) se relean tras una caída.
+    """
+
+    def __init__(self, log: IngestLog, name: str, handler: Callable[[int, float, bytes], None],
+                 batch_size: int = 100, poll_interval: float = 0.5,
+                 retention_seconds: Optional[float] = None,
+                 low_watermark: Optional[Callable[[], Optional[int]]] = None):
+        self.log = log
+        self.name = name
+        self.handler = handler
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.retention_seconds = retention_seconds
+        self.low_watermark = low_watermark
+        self.checkpoint_path = os.path.join(log.directory, "consumers", f"{name}.offset")
+        self.owner = False
+        self.position: Optional[int] = None
+        self.lagging = False
+        self.last_timestamp: Optional[float] = None
+        self.stats = {"processed": 0, "errors": 0}
+        self._committed: Optional[int] = None
+        self._thread: Optional[threading.Thread] = None
+
+    def committed(self) -> int:
+        try:
+            with open(self.checkpoint_path) as f:
+                return json.load(f)["offset"]
+        except (OSError, ValueError, KeyError):
+            return 0
+
+    def commit(self, offset: int):
+        tmp_path = f"{self.checkpoint_path}.tmp-{os.getpid()}"
+        with open(tmp_path, "w") as f:
+            json.dump({"offset": offset, "updated_at": datetime.now().isoformat()}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.checkpoint_path)
+        self._committed = offset
+
+    def checkpoint(self):
+        """Confirma hasta position, o hasta el menor offset que el handler aún necesita"""
+        offset = self.position
+        held = self.low_watermark() if self.low_watermark else None
+        if held is not None:
+            offset = min(offset, held)
+        if offset != self._committed:
+            self.commit(offset)
+
+    def poll(self) -> int:
+        """Procesa un lote; devuelve registros procesados"""
+        if self.position is None:
+            self.position = self._committed = self.committed()
+        records, self.position = self.log.read(self.position, self.batch_size)
+        # Quedan registros por leer (relectura tras un reinicio o atraso)
+        self.lagging = bool(records) and self.position < self.log.end_offset()
+        for offset, timestamp, payload in records:
+            self.last_timestamp = timestamp
+            try:
+                self.handler(offset, timestamp, payload)
+                self.stats["processed"] += 1
+            except Exception as e:
+                # Un evento inválido no bloquea el log
+                print(f"[ERROR] Consumidor {self.name}, offset {offset}: {e}")
+                self.stats["errors"] += 1
+        # También sin registros nuevos: los incidentes terminados liberan el checkpoint
+        self.checkpoint()
+        return len(records)
+
+    def clock(self) -> float:
+        """Tiempo del log: el del último registro leído mientras hay atraso; si no, el real"""
+        if self.lagging and self.last_timestamp is not None:
+            return self.last_timestamp
+        return time.time()
+
+    def start(self):
+        if self._thread:
+            return
+        self._thread = threading.Thread(target=self._loop, name=f"grc-consumer-{self.name}", daemon=True)
+        self._thread.start()
+
+    def _loop(self):
+        lock_fd = os.open(f"{self.checkpoint_path}.lock", os.O_CREAT | os.O_RDWR, 0o644)
+        while not self.owner:
+            try:
+                fcntl.flock(lock_fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                self.owner = True
+            except BlockingIOError:
+                time.sleep(5)
+        last_retention = 0.0
+        while True:
+            if not self.poll():
+                time.sleep(self.poll_interval)
+            if self.retention_seconds and time.monotonic() - last_retention >= 60:
+                last_retention = time.monotonic()
+                self.log.delete_before(self.committed(), time.time() - self.retention_seconds)
+
+    def status(self) -> Dict:
+        committed = self.committed()
+        return {
+            "name": self.name,
+            "owner": self.owner,
+            "committed_offset": committed,
+            "position": self.position,
+            "lag_bytes": max(self.log.end_offset() - (committed if self.position is None else self.position), 0),
+            **self.stats
+        }
@@ -0,0 +1,231 @@
+#!/usr/bin/env python3
+"""
+GRC Inventory - Inventarios de controles por organización (SQLite)
+Altas/bajas incrementales con contadores de cobertura mantenidos en la misma
+transacción: leer el porcentaje de cumplimiento de una organización es una
+consulta por clave primaria, sin recalcular sobre el catálogo.
+"""
+
+import json
+import re
+import sqlite3
+import threading
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+
+ORG_ID_PATTERN = re.compile(r"^[A-Za-z0-9_.-]{1,64}$")
+
+
+def valid_org_id(org_id) -> bool:
+    return isinstance(org_id, str) and bool(ORG_ID_PATTERN.match(org_id))
+
+
+class InventoryStore:
+    """
+    Tablas:
+      org_controls     (org, control_id)            controles implementados
+      org_coverage     (org, scope) → implemented   agregados incrementales
+      coverage_history (org, recorded_at, ...)      una fila por cambio
+    Los ámbitos (all, framework:*, group:*, critical) y sus totales los define el catálogo
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.row_factory = sqlite3.Row
+        with self._lock, self._conn:
+            self._conn.executescript("""
+                CREATE TABLE IF NOT EXISTS org_controls (
+                    org TEXT NOT NULL,
+                    control_id TEXT NOT NULL,
+                    added_at TEXT NOT NULL,
+                    PRIMARY KEY (org, control_id)
+                );
+                CREATE TABLE IF NOT EXISTS org_coverage (
+                    org TEXT NOT NULL,
+                    scope TEXT NOT NULL,
+                    implemented INTEGER NOT NULL,
+                    PRIMARY KEY (org, scope)
+                );
+                CREATE TABLE IF NOT EXISTS org_meta (
+                    org TEXT PRIMARY KEY,
+                    updated_at TEXT NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS coverage_history (
+                    org TEXT NOT NULL,
+                    recorded_at TEXT NOT NULL,
+                    implemented INTEGER NOT NULL,
+                    total INTEGER NOT NULL,
+                    compliance_percentage REAL NOT NULL,
+                    by_framework TEXT NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS idx_history_org ON coverage_history(org, recorded_at);
+                CREATE TABLE IF NOT EXISTS inventory_meta (
+                    key TEXT PRIMARY KEY,
+                    value TEXT NOT NULL
+                );
+            """)
+
+    def sync_catalog(self, fingerprint: str, scopes_of: Callable[[str], Optional[tuple]]) -> int:
+        """
+        Si el catálogo cambió desde el último arranque, recalcula los agregados de
+        todas las organizaciones desde sus inventarios. Devuelve organizaciones recalculadas.
+        """
+        with self._lock, self._conn:
+            row = self._conn.execute(
+                "SELECT value FROM inventory_meta WHERE key = 'catalog_fingerprint'"
+            ).fetchone()
+            if row and row["value"] == fingerprint:
+                return 0
+            orgs = [r["org"] for r in self._conn.execute("SELECT org FROM org_meta")]
+            self._conn.execute("DELETE FROM org_coverage")
+            for org in orgs:
+                counts: Dict[str, int] = {}
+                for r in self._conn.execute("SELECT control_id FROM org_controls WHERE org = ?", (org,)):
+                    for scope in scopes_of(r["control_id"]) or ():
+                        counts[scope] = counts.get(scope, 0) + 1
+                self._conn.executemany(
+                    "INSERT INTO org_coverage (org, scope, implemented) VALUES (?, ?, ?)",
+                    [(org, scope, count) for scope, count in counts.items()]
+                )
+            self._conn.execute(
+                "INSERT OR REPLACE INTO inventory_meta (key, value) VALUES ('catalog_fingerprint', ?)",
+                (fingerprint,)
+            )
+        return len(orgs)
+
+    def apply(self, org: str, add: List[str], remove: List[str],
+              scopes_of: Callable[[str], Optional[tuple]], totals: Dict[str, int]) -> Dict:
+        """
+        Aplica altas y bajas; sólo los cambios efectivos mueven los contadores.
+        IDs fuera del catálogo se devuelven en 'unknown' sin almacenarse.
+        """
+        now = datetime.now().isoformat()
+        deltas: Dict[str, int] = {}
+        added, removed, unknown = [], [], []
+
+        with self._lock, self._conn:
+            for control_id in dict.fromkeys(add):
+                scopes = scopes_of(control_id)
+                if scopes is None:
+                    unknown.append(control_id)
+                    continue
+                cursor = self._conn.execute(
+                    "INSERT OR IGNORE INTO org_controls (org, control_id, added_at) VALUES (?, ?, ?)",
+                    (org, control_id, now)
+                )
+                if cursor.rowcount:
+                    added.append(control_id)
+                    for scope in scopes:
+                        deltas[scope] = deltas.get(scope, 0) + 1
+
+            for control_id in dict.fromkeys(remove):
+                cursor = self._conn.execute(
+                    "DELETE FROM org_controls WHERE org = ? AND control_id = ?", (org, control_id)
+                )
+                if cursor.rowcount:
+                    removed.append(control_id)
+                    for scope in scopes_of(control_id) or ():
+                        deltas[scope] = deltas.get(scope, 0) - 1
+                elif scopes_of(control_id) is None:
+                    unknown.append(control_id)
+
+            self._conn.execute(
+                "INSERT OR REPLACE INTO org_meta (org, updated_at) VALUES (?, ?)", (org, now)
+            )
+            for scope, delta in deltas.items():
+                if delta:
+                    self._conn.execute(
+                        "INSERT INTO org_coverage (org, scope, implemented) VALUES (?, ?, ?) "
+                        "ON CONFLICT(org, scope) DO UPDATE SET implemented = implemented + excluded.implemented",
+                        (org, scope, delta)
+                    )
+
+            coverage = self._coverage(org, totals)
+            if added or removed:
+                summary = coverage["summary"]
+                self._conn.execute(
+                    "INSERT INTO coverage_history (org, recorded_at, implemented, total, "
+                    "compliance_percentage, by_framework) VALUES (?, ?, ?, ?, ?, ?)",
+                    (org, now, summary["implemented"], summary["total_controls"],
+                     summary["compliance_percentage"],
+                     json.dumps({f: c["compliance_percentage"] for f, c in coverage["by_framework"].items()}))
+                )
+
+        return {"added": added, "removed": removed, "unknown": unknown, "coverage": coverage}
+
+    def coverage(self, org: str, totals: Dict[str, int]) -> Optional[Dict]:
+        with self._lock:
+            if not self._conn.execute("SELECT 1 FROM org_meta WHERE org = ?", (org,)).fetchone():
+                return None
+            return self._coverage(org, totals)
+
+    def _coverage(self, org: str, totals: Dict[str, int]) -> Dict:
+        implemented = {
+            r["scope"]: r["implemented"]
+            for r in self._conn.execute("SELECT scope, implemented FROM org_coverage WHERE org = ?", (org,))
+        }
+        updated = self._conn.execute("SELECT updated_at FROM org_meta WHERE org = ?", (org,)).fetchone()
+
+        def entry(scope: str) -> Dict:
+            total = totals.get(scope, 0)
+            count = implemented.get(scope, 0)
+            return {
+                "total_controls": total,
+                "implemented": count,
+                "gaps": total - count,
+                "compliance_percentage": round(count / total * 100, 2) if total else 0
+            }
+
+        by_framework = {}
+        for scope in totals:
+            if scope.startswith("framework:"):
+                framework = scope.split(":", 1)[1]
+                by_framework[framework] = {
+                    **entry(scope),
+                    "groups": {
+                        g.split("/", 1)[1]: entry(g) for g in totals if g.startswith(f"group:{framework}/")
+                    }
+                }
+        return {
+            "org": org,
+            "summary": entry("all"),
+            "critical": entry("critical"),
+            "by_framework": by_framework,
+            "updated_at": updated["updated_at"] if updated else None
+        }
+
+    def control_ids(self, org: str) -> List[str]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT control_id FROM org_controls WHERE org = ? ORDER BY control_id", (org,)
+            ).fetchall()
+        return [r["control_id"] for r in rows]
+
+    def orgs(self, total: int) -> List[Dict]:
+        """Todas las organizaciones con su cumplimiento global (vista de dashboard)"""
+        with self._lock:
+            rows = self._conn.execute("""
+                SELECT m.org, m.updated_at, COALESCE(c.implemented, 0) AS implemented
+                FROM org_meta m LEFT JOIN org_coverage c ON c.org = m.org AND c.scope = 'all'
+                ORDER BY m.org
+            """).fetchall()
+        return [
+            {"org": r["org"], "implemented": r["implemented"], "total_controls": total,
+             "compliance_percentage": round(r["implemented"] / total * 100, 2) if total else 0,
+             "updated_at": r["updated_at"]}
+            for r in rows
+        ]
+
+    def history(self, org: str, limit: int = 100) -> List[Dict]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT * FROM coverage_history WHERE org = ? ORDER BY recorded_at DESC, rowid DESC LIMIT ?",
+                (org, limit)
+            ).fetchall()
+        return [
+            {**{k: r[k] for k in ("recorded_at", "implemented", "total", "compliance_percentage")},
+             "by_framework": json.loads(r["by_framework"])}
+            for r in reversed(rows)
+        ]
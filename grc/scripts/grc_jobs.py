@@ -0,0 +1,242 @@
+#!/usr/bin/env python3
+"""
+GRC Jobs - Generación asíncrona de reportes de cumplimiento
+Cola persistente (SQLite) + pool acotado de workers en segundo plano
+"""
+
+import json
+import sqlite3
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+from urllib.parse import urlsplit
+
+import requests
+
+
+class QueueFullError(Exception):
+    """La cola de jobs alcanzó su capacidad máxima"""
+
+
+class CallbackNotAllowedError(ValueError):
+    """callback_url fuera de la lista de hosts permitidos"""
+
+
+def parse_allowed_hosts(value: str) -> frozenset:
+    """"n8n, soar.local:5678" → {"n8n", "soar.local:5678"}"""
+    return frozenset(h.strip().lower() for h in (value or "").split(",") if h.strip())
+
+
+def callback_allowed(url: str, allowed_hosts: frozenset) -> bool:
+    """Sólo http(s) hacia un host (o host:puerto) de la lista: evita SSRF desde la API"""
+    try:
+        parts = urlsplit(url)
+        host = (parts.hostname or "").lower()
+        port = parts.port
+    except ValueError:
+        return False
+    if parts.scheme not in ("http", "https") or not host or parts.username or parts.password:
+        return False
+    return host in allowed_hosts or (port is not None and f"{host}:{port}" in allowed_hosts)
+
+
+class JobStore:
+    """Persistencia local de jobs para sobrevivir reinicios"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.row_factory = sqlite3.Row
+        with self._lock, self._conn:
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    status TEXT NOT NULL,
+                    alert TEXT NOT NULL,
+                    controls TEXT NOT NULL,
+                    compliance_mapping TEXT NOT NULL,
+                    callback_url TEXT,
+                    report TEXT,
+                    report_source TEXT,
+                    report_status TEXT,
+                    error TEXT,
+                    callback_status TEXT,
+                    created_at TEXT NOT NULL,
+                    updated_at TEXT NOT NULL
+                )
+            """)
+            columns = {row["name"] for row in self._conn.execute("PRAGMA table_info(jobs)")}
+            for column in ("report_source", "report_status"):
+                if column not in columns:
+                    # Bases creadas antes de distinguir reporte LLM y de plantilla
+                    self._conn.execute(f"ALTER TABLE jobs ADD COLUMN {column} TEXT")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs(status)")
+
+    def create(self, alert: dict, controls: list, mapping: dict,
+               callback_url: Optional[str] = None) -> str:
+        job_id = uuid.uuid4().hex
+        now = datetime.now().isoformat()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO jobs (id, status, alert, controls, compliance_mapping, callback_url, "
+                "created_at, updated_at) VALUES (?, 'queued', ?, ?, ?, ?, ?, ?)",
+                (job_id, json.dumps(alert), json.dumps(controls), json.dumps(mapping),
+                 callback_url, now, now)
+            )
+        return job_id
+
+    def get(self, job_id: str) -> Optional[Dict]:
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._row_to_job(row) if row else None
+
+    def claim(self, job_id: str) -> bool:
+        """Marca el job como 'running' sólo si sigue en cola"""
+        with self._lock, self._conn:
+            cursor = self._conn.execute(
+                "UPDATE jobs SET status = 'running', updated_at = ? WHERE id = ? AND status = 'queued'",
+                (datetime.now().isoformat(), job_id)
+            )
+        return cursor.rowcount == 1
+
+    def update(self, job_id: str, **fields):
+        fields["updated_at"] = datetime.now().isoformat()
+        columns = ", ".join(f"{k} = ?" for k in fields)
+        with self._lock, self._conn:
+            self._conn.execute(f"UPDATE jobs SET {columns} WHERE id = ?",
+                               (*fields.values(), job_id))
+
+    def requeue_interrupted(self) -> int:
+        """Devuelve a la cola los jobs que quedaron en ejecución al reiniciar"""
+        with self._lock, self._conn:
+            cursor = self._conn.execute(
+                "UPDATE jobs SET status = 'queued', updated_at = ? WHERE status = 'running'",
+                (datetime.now().isoformat(),)
+            )
+        return cursor.rowcount
+
+    def queued_ids(self) -> List[str]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id FROM jobs WHERE status = 'queued' ORDER BY created_at"
+            ).fetchall()
+        return [r["id"] for r in rows]
+
+    @staticmethod
+    def _row_to_job(row: sqlite3.Row) -> Dict:
+        job = dict(row)
+        for key in ("alert", "controls", "compliance_mapping"):
+            job[key] = json.loads(job[key])
+        return job
+
+
+class ReportJobQueue:
+    """
+    Pool acotado de workers que genera reportes y los entrega por polling o callback.
+    generate devuelve {"report", "source" ("llm" | "template"), "status"}
+    """
+
+    def __init__(self, store: JobStore, generate: Callable[[dict, list], Dict],
+                 max_workers: int = 2, max_pending: int = 100, callback_timeout: int = 10,
+                 allowed_callback_hosts: frozenset = frozenset()):
+        self.store = store
+        self.generate = generate
+        self.max_pending = max_pending
+        self.callback_timeout = callback_timeout
+        self.allowed_callback_hosts = allowed_callback_hosts
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="grc-job")
+        self._pending = 0
+        self._lock = threading.Lock()
+
+    def start(self, requeue_interrupted: bool = True) -> int:
+        """
+        Reanuda los jobs persistidos que no llegaron a completarse. Con varios procesos,
+        los 'running' sólo se reencolan una vez al arrancar (requeue_interrupted=False en workers).
+        """
+        if requeue_interrupted:
+            self.store.requeue_interrupted()
+        job_ids = self.store.queued_ids()
+        for job_id in job_ids:
+            self._dispatch(job_id, force=True)
+        return len(job_ids)
+
+    def submit(self, alert: dict, controls: list, mapping: dict,
+               callback_url: Optional[str] = None) -> str:
+        if callback_url and not callback_allowed(callback_url, self.allowed_callback_hosts):
+            raise CallbackNotAllowedError(f"callback_url no permitido: {callback_url}")
+        self._reserve()
+        job_id = self.store.create(alert, controls, mapping, callback_url)
+        self._executor.submit(self._run, job_id)
+        return job_id
+
+    def pending(self) -> int:
+        return self._pending
+
+    def _reserve(self, force: bool = False):
+        with self._lock:
+            if not force and self._pending >= self.max_pending:
+                raise QueueFullError(f"{self._pending} jobs pendientes")
+            self._pending += 1
+
+    def _dispatch(self, job_id: str, force: bool = False):
+        self._reserve(force)
+        self._executor.submit(self._run, job_id)
+
+    def _run(self, job_id: str):
+        try:
+            if not self.store.claim(job_id):
+                return
+            job = self.store.get(job_id)
+            try:
+                result = self.generate(job["alert"], job["controls"])
+                self.store.update(job_id, status="completed", report=result["report"],
+                                  report_source=result.get("source"), report_status=result.get("status"))
+            except Exception as e:
+                print(f"[ERROR] Job {job_id}: {e}")
+                self.store.update(job_id, status="failed", error=str(e))
+
+            if job.get("callback_url"):
+                self._deliver(self.store.get(job_id))
+        finally:
+            with self._lock:
+                self._pending -= 1
+
+    def _deliver(self, job: dict):
+        if not callback_allowed(job["callback_url"], self.allowed_callback_hosts):
+            # Jobs persistidos antes de restringir los hosts
+            self.store.update(job["id"], callback_status="error:callback_url no permitido")
+            return
+        try:
+            response = requests.post(job["callback_url"], json=job_to_response(job),
+                                     timeout=self.callback_timeout)
+            status = f"delivered:{response.status_code}"
+        except Exception as e:
+            print(f"[ERROR] Callback {job['id']}: {e}")
+            status = f"error:{e}"
+        self.store.update(job["id"], callback_status=status)
+
+
+def job_to_response(job: dict) -> dict:
+    """Formato JSON expuesto por la API para un job"""
+    alert = job["alert"]
+    return {
+        "job_id": job["id"],
+        "status": job["status"],
+        "alert": {
+            "description": alert.get("rule_description"),
+            "level": alert.get("rule_level"),
+            "mitre_id": alert.get("mitre_id")
+        },
+        "compliance_mapping": job["compliance_mapping"],
+        "ai_analysis": job.get("report"),
+        # "template": el LLM no respondió (breaker, deadline, error) y se usó el catálogo
+        "report_source": job.get("report_source"),
+        "report_status": job.get("report_status"),
+        "error": job.get("error"),
+        "callback_status": job.get("callback_status"),
+        "created_at": job["created_at"],
+        "updated_at": job["updated_at"]
+    }
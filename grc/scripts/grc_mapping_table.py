@@ -0,0 +1,307 @@
+#!/usr/bin/env python3
+"""
+GRC Mapping Table - Mapeos alerta → controles precalculados fuera de línea
+Las alertas Wazuh vienen de un conjunto finito de reglas y técnicas ATT&CK: el job
+calcula una vez los controles ISO/NIST de cada técnica (catálogo + colección
+threat_intelligence) y de cada rule_id observado por la API, y los guarda en una
+tabla compacta que map-alert consulta con una búsqueda en diccionario.
+
+Cada entrada guarda la huella de sus entradas (texto de la regla, contenido del
+catálogo y versión de los vectores); un rebuild sólo recalcula las entradas cuya
+huella cambió. El build no importa grc_api: carga el catálogo (snapshot o módulo) y
+consulta Ollama/Qdrant directamente, sin abrir las bases de datos ni los hilos de la API.
+
+Uso:
+    python grc_mapping_table.py build            # incremental
+    python grc_mapping_table.py build --force    # recalcula todo
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+from datetime import datetime
+from typing import Dict, List, Optional
+
+import requests
+
+from grc_catalog import MitreIndex, catalog_fingerprint, frameworks_short, load_controls
+from grc_retrieval import framework_search_request, group_framework_results, map_alerts
+from grc_snapshot import DEFAULT_SNAPSHOT_PATH, CatalogSnapshot
+
+DEFAULT_TABLE_PATH = os.getenv('GRC_MAPPING_TABLE_PATH', 'grc_mappings.json')
+DEFAULT_SEEN_RULES_DB = os.getenv('GRC_SEEN_RULES_DB', 'grc_seen_rules.db')
+BUILD_BATCH_SIZE = 64
+
+# Mismos servicios, modelo y colecciones que grc_api
+QDRANT_URL = os.getenv('QDRANT_URL', "http://localhost:6333")
+OLLAMA_URL = os.getenv('OLLAMA_URL', "http://localhost:11434")
+COLLECTION_NAME = "grc_controls"
+THREAT_COLLECTION = "threat_intelligence"
+EMBED_MODEL = "nomic-embed-text"
+MAPPING_PER_FRAMEWORK = int(os.getenv('GRC_MAPPING_PER_FRAMEWORK', 5))
+BUILD_TIMEOUT_SECONDS = float(os.getenv('GRC_MAPPING_BUILD_TIMEOUT_SECONDS', 120))
+
+
+def rule_key(rule_id) -> str:
+    return f"rule:{rule_id}"
+
+
+def technique_key(technique_id: str) -> str:
+    return f"technique:{technique_id.upper()}"
+
+
+class SeenRuleStore:
+    """Reglas Wazuh observadas por la API que aún no están en la tabla (SQLite)"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._recorded = set()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.row_factory = sqlite3.Row
+        with self._lock, self._conn:
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS seen_rules (
+                    rule_id TEXT PRIMARY KEY,
+                    rule_description TEXT NOT NULL,
+                    mitre_id TEXT,
+                    mitre_tactic TEXT,
+                    first_seen TEXT NOT NULL
+                )
+            """)
+
+    def record(self, alert_data: dict):
+        """Una escritura por regla nueva y proceso; las repeticiones no tocan disco"""
+        rule_id = str(alert_data.get('rule_id') or '')
+        if not rule_id or rule_id in self._recorded:
+            return
+        with self._lock, self._conn:
+            self._recorded.add(rule_id)
+            self._conn.execute(
+                "INSERT OR IGNORE INTO seen_rules (rule_id, rule_description, mitre_id, mitre_tactic, first_seen) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (rule_id, alert_data.get('rule_description') or '', json.dumps(alert_data.get('mitre_id')),
+                 json.dumps(alert_data.get('mitre_tactic')), datetime.now().isoformat())
+            )
+
+    def rules(self) -> List[Dict]:
+        with self._lock:
+            rows = self._conn.execute("SELECT * FROM seen_rules ORDER BY rule_id").fetchall()
+        return [
+            {"rule_id": r["rule_id"], "rule_description": r["rule_description"],
+             "mitre_id": json.loads(r["mitre_id"]), "mitre_tactic": json.loads(r["mitre_tactic"])}
+            for r in rows
+        ]
+
+
+class MappingTableHolder:
+    """Tabla vigente en memoria; se recarga cuando el job publica un archivo nuevo"""
+
+    def __init__(self, path: str, check_interval: float = 5.0):
+        self.path = path
+        self.check_interval = check_interval
+        self.entries: Dict[str, List] = {}
+        self.catalog_fingerprint: Optional[str] = None
+        self._identity = None
+        self._last_check = 0.0
+        self._lock = threading.Lock()
+
+    def get(self, key: str, catalog_fingerprint: str) -> Optional[List]:
+        """[[control_id, score, match], ...] o None (sin entrada o tabla de otro catálogo)"""
+        now = time.monotonic()
+        if now - self._last_check >= self.check_interval:
+            self._last_check = now
+            self._maybe_reload()
+        if self.catalog_fingerprint != catalog_fingerprint:
+            return None
+        return self.entries.get(key)
+
+    def _maybe_reload(self):
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return
+        identity = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+        if identity == self._identity:
+            return
+        with self._lock:
+            if identity == self._identity:
+                return
+            try:
+                with open(self.path) as f:
+                    table = json.load(f)
+            except (OSError, ValueError) as e:
+                print(f"[ERROR] Cargando tabla de mapeos {self.path}: {e}")
+                return
+            self.entries = {key: entry["controls"] for key, entry in table.get("entries", {}).items()}
+            self.catalog_fingerprint = table.get("catalog_fingerprint")
+            self._identity = identity
+            print(f"[INFO] Tabla de mapeos cargada: {len(self.entries)} entradas")
+
+
+def entry_fingerprint(alert_input: dict, catalog_fingerprint: str, vectors_version: Optional[str]) -> str:
+    """vectors_version sólo participa si la entrada necesitó búsqueda vectorial"""
+    data = json.dumps([alert_input, catalog_fingerprint, vectors_version], sort_keys=True)
+    return hashlib.md5(data.encode()).hexdigest()
+
+
+def write_table(path: str, table: dict):
+    tmp_path = f"{path}.tmp-{os.getpid()}"
+    with open(tmp_path, "w") as f:
+        json.dump(table, f, separators=(",", ":"))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def load_table(path: str) -> dict:
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+class CatalogMapper:
+    """
+    Contexto del build: catálogo vigente (snapshot si existe, si no el del módulo),
+    índice MITRE, embeddings y búsqueda por framework. Mismo mapeo que la API
+    (grc_retrieval.map_alerts) sin su estado de proceso.
+    """
+
+    def __init__(self, ollama_url: str = OLLAMA_URL, qdrant_url: str = QDRANT_URL,
+                 snapshot_path: str = DEFAULT_SNAPSHOT_PATH, per_framework: int = MAPPING_PER_FRAMEWORK):
+        self.ollama_url = ollama_url
+        self.qdrant_url = qdrant_url
+        self.per_framework = per_framework
+        self.snapshot = CatalogSnapshot(snapshot_path) if os.path.exists(snapshot_path) else None
+        controls = self.snapshot.controls if self.snapshot else load_controls()
+        self.mitre_index = MitreIndex(controls)
+        self.frameworks = list(dict.fromkeys(c['framework'] for c in controls))
+        self.catalog_fingerprint = catalog_fingerprint(controls)
+        self.vectors_version = (f"snapshot:{self.snapshot.header.get('created_at')}" if self.snapshot
+                                else f"qdrant:{EMBED_MODEL}")
+
+    def qdrant_post(self, path: str, body: dict) -> dict:
+        response = requests.post(f"{self.qdrant_url}{path}", json=body, timeout=BUILD_TIMEOUT_SECONDS)
+        response.raise_for_status()
+        return response.json()
+
+    def embed(self, texts: List[str]) -> List[List[float]]:
+        response = requests.post(f"{self.ollama_url}/api/embed", json={"model": EMBED_MODEL, "input": texts},
+                                 timeout=BUILD_TIMEOUT_SECONDS)
+        response.raise_for_status()
+        return response.json()["embeddings"]
+
+    def search_batch(self, queries: List[str]) -> List[List[Dict]]:
+        """Un embedding en lote y per_framework controles de cada framework por consulta"""
+        unique_queries = list(dict.fromkeys(queries))
+        embeddings = self.embed(unique_queries)
+        if self.snapshot:
+            results = [sorted(self.snapshot.search_by_framework(e, self.per_framework), key=lambda h: -h['score'])
+                       for e in embeddings]
+        else:
+            result = self.qdrant_post(f"/collections/{COLLECTION_NAME}/points/search/batch",
+                                      framework_search_request(embeddings, self.per_framework, self.frameworks))
+            results = group_framework_results(result.get("result", []), len(embeddings), self.frameworks)
+        by_query = dict(zip(unique_queries, results))
+        return [by_query[q] for q in queries]
+
+    def needs_vector(self, alert_input: dict) -> bool:
+        return frameworks_short(self.mitre_index.search(alert_input.get("mitre_id")), self.frameworks,
+                                self.per_framework)
+
+    def map_alerts(self, alerts: List[dict]) -> List[List[Dict]]:
+        return map_alerts(alerts, self.mitre_index, self.frameworks, self.search_batch, self.per_framework)
+
+
+def scroll_attack_techniques(qdrant_post, collection: str) -> List[Dict]:
+    """Técnicas ATT&CK indexadas por el cti_fetcher (paginado)"""
+    techniques = []
+    offset = None
+    while True:
+        body = {"limit": 256, "with_payload": True,
+                "filter": {"must": [{"key": "source", "match": {"value": "mitre_attack"}}]}}
+        if offset is not None:
+            body["offset"] = offset
+        result = qdrant_post(f"/collections/{collection}/points/scroll", body).get("result", {})
+        techniques.extend(p["payload"] for p in result.get("points", []) if p.get("payload"))
+        offset = result.get("next_page_offset")
+        if offset is None:
+            return techniques
+
+
+def collect_inputs(mapper: CatalogMapper, seen_rules: SeenRuleStore) -> Dict[str, dict]:
+    """Alerta representativa por clave: cada técnica ATT&CK y cada regla observada"""
+    inputs: Dict[str, dict] = {}
+    try:
+        for payload in scroll_attack_techniques(mapper.qdrant_post, THREAT_COLLECTION):
+            technique_id = payload.get('metadata', {}).get('technique_id')
+            if technique_id:
+                inputs[technique_key(technique_id)] = {
+                    "rule_description": payload.get('title', ''),
+                    "mitre_id": technique_id,
+                    "mitre_tactic": ", ".join(payload.get('metadata', {}).get('tactics', []))
+                }
+    except Exception as e:
+        print(f"[ERROR] Leyendo técnicas de {THREAT_COLLECTION}: {e} (sólo técnicas del catálogo)")
+
+    for technique_id in mapper.mitre_index.by_technique:
+        inputs.setdefault(technique_key(technique_id), {"rule_description": "", "mitre_id": technique_id})
+
+    for rule in seen_rules.rules():
+        inputs[rule_key(rule["rule_id"])] = {
+            "rule_description": rule["rule_description"],
+            "mitre_id": rule["mitre_id"],
+            "mitre_tactic": rule["mitre_tactic"]
+        }
+    return inputs
+
+
+def build_mapping_table(mapper: CatalogMapper, path: str, seen_rules: SeenRuleStore, force: bool = False) -> Dict:
+    """Recalcula sólo las entradas nuevas o cuya huella cambió; devuelve estadísticas"""
+    previous = {} if force else load_table(path).get("entries", {})
+    catalog_fingerprint = mapper.catalog_fingerprint
+    vectors_version = mapper.vectors_version
+    inputs = collect_inputs(mapper, seen_rules)
+
+    entries, stale = {}, []
+    for key, alert_input in inputs.items():
+        fingerprint = entry_fingerprint(alert_input, catalog_fingerprint,
+                                        vectors_version if mapper.needs_vector(alert_input) else None)
+        if previous.get(key, {}).get("fp") == fingerprint:
+            entries[key] = previous[key]
+        else:
+            stale.append((key, alert_input, fingerprint))
+
+    for start in range(0, len(stale), BUILD_BATCH_SIZE):
+        batch = stale[start:start + BUILD_BATCH_SIZE]
+        results = mapper.map_alerts([alert_input for _, alert_input, _ in batch])
+        for (key, _, fingerprint), hits in zip(batch, results):
+            entries[key] = {
+                "fp": fingerprint,
+                "controls": [[h['payload']['id'], round(h['score'], 4), h.get('match', 'vector')] for h in hits]
+            }
+
+    write_table(path, {
+        "built_at": datetime.now().isoformat(),
+        "catalog_fingerprint": catalog_fingerprint,
+        "vectors_version": vectors_version,
+        "entries": dict(sorted(entries.items()))
+    })
+    return {"entries": len(entries), "recomputed": len(stale), "reused": len(entries) - len(stale),
+            "dropped": len(set(previous) - set(entries))}
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "build":
+        stats = build_mapping_table(CatalogMapper(), DEFAULT_TABLE_PATH, SeenRuleStore(DEFAULT_SEEN_RULES_DB),
+                                    force="--force" in sys.argv)
+        print(f"✅ Tabla {DEFAULT_TABLE_PATH}: {stats['entries']} entradas "
+              f"({stats['recomputed']} recalculadas, {stats['reused']} reutilizadas, {stats['dropped']} eliminadas)")
+    else:
+        print(__doc__)
@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""
+GRC Metrics - Tiempos por etapa (Server-Timing) y métricas en formato Prometheus
+"""
+
+import contextvars
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Optional, Tuple
+
+# Buckets en segundos: desde búsquedas en memoria hasta generaciones LLM en CPU
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                   1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+_current_timings: contextvars.ContextVar = contextvars.ContextVar("grc_stage_timings", default=None)
+
+
+def _format_labels(labels: Tuple[Tuple[str, str], ...]) -> str:
+    if not labels:
+        return ""
+    inner = ",".join('%s="%s"' % (k, str(v).replace('\\', '\\\\').replace('"', '\\"')) for k, v in labels)
+    return "{" + inner + "}"
+
+
+class Histogram:
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.total = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.total += 1
+        self.sum += value
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+
+
+class MetricsRegistry:
+    """
+    Histogramas por ruta/etapa y contadores con etiquetas (exposición Prometheus).
+    Cada worker de gunicorn tiene su registro: todas las series llevan worker=<pid>
+    y se agregan en la consulta (sum without (worker))
+    """
+
+    def __init__(self, prefix: str = "grc"):
+        self.prefix = prefix
+        self._lock = threading.Lock()
+        self._histograms: Dict[Tuple[str, tuple], Histogram] = {}
+        self._counters: Dict[Tuple[str, tuple], float] = {}
+        self._help: Dict[str, Tuple[str, str]] = {}
+
+    def observe(self, name: str, value: float, help_text: str = "", **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._help.setdefault(name, ("histogram", help_text))
+            self._histograms.setdefault(key, Histogram()).observe(value)
+
+    def inc(self, name: str, amount: float = 1, help_text: str = "", **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._help.setdefault(name, ("counter", help_text))
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def render(self, extra_gauges: Optional[Dict[str, list]] = None,
+               extra_counters: Optional[Dict[str, list]] = None) -> str:
+        """
+        Texto Prometheus. extra_gauges / extra_counters: {nombre: [(valor, {labels}), ...]}
+        con valores tomados en el momento del scrape (colas, breaker, modelos...)
+        """
+        worker = (("worker", str(os.getpid())),)
+        lines = []
+        with self._lock:
+            for name, (kind, help_text) in sorted(self._help.items()):
+                full = f"{self.prefix}_{name}"
+                lines.append(f"# HELP {full} {help_text}")
+                lines.append(f"# TYPE {full} {kind}")
+                if kind == "counter":
+                    for (n, labels), value in sorted(self._counters.items()):
+                        if n == name:
+                            lines.append(f"{full}{_format_labels(labels + worker)} {value}")
+                    continue
+                for (n, labels), hist in sorted(self._histograms.items()):
+                    if n != name:
+                        continue
+                    cumulative = 0
+                    for bound, count in zip(hist.buckets, hist.counts):
+                        cumulative += count
+                        lines.append(f"{full}_bucket{_format_labels(labels + worker + (('le', bound),))} {cumulative}")
+                    lines.append(f"{full}_bucket{_format_labels(labels + worker + (('le', '+Inf'),))} {hist.total}")
+                    lines.append(f"{full}_sum{_format_labels(labels + worker)} {hist.sum:.6f}")
+                    lines.append(f"{full}_count{_format_labels(labels + worker)} {hist.total}")
+
+        for kind, extra in (("gauge", extra_gauges), ("counter", extra_counters)):
+            for name, samples in sorted((extra or {}).items()):
+                full = f"{self.prefix}_{name}"
+                lines.append(f"# TYPE {full} {kind}")
+                for value, labels in samples:
+                    lines.append(f"{full}{_format_labels(tuple(sorted(labels.items())) + worker)} {value}")
+        return "\n".join(lines) + "\n"
+
+
+def begin_request() -> contextvars.Token:
+    """Inicia la recolección de tiempos por etapa para la petición actual"""
+    return _current_timings.set({})
+
+
+def end_request(token: contextvars.Token) -> Dict[str, float]:
+    timings = _current_timings.get() or {}
+    _current_timings.reset(token)
+    return timings
+
+
+def current_timings() -> Optional[Dict[str, float]]:
+    return _current_timings.get()
+
+
+@contextmanager
+def stage(name: str):
+    """Mide una etapa (embed, search, llm...) y la acumula en la petición en curso"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings = _current_timings.get()
+        if timings is not None:
+            timings[name] = timings.get(name, 0.0) + (time.perf_counter() - start)
+
+
+def server_timing_header(timings: Dict[str, float], total: float) -> str:
+    """Cabecera Server-Timing en milisegundos: 'embed;dur=12.3, search;dur=4.0, total;dur=20.1'"""
+    parts = [f"{name};dur={seconds * 1000:.1f}" for name, seconds in timings.items()]
+    parts.append(f"total;dur={total * 1000:.1f}")
+    return ", ".join(parts)
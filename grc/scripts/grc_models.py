@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""
+GRC Models - Precarga y keep-alive de modelos Ollama
+Evita que la primera alerta tras un periodo inactivo pague la carga del modelo
+"""
+
+import threading
+import time
+from datetime import datetime
+from typing import Dict, Optional
+
+import requests
+
+
+def parse_active_hours(value: str) -> tuple:
+    """"8-20" → (8, 20); "0-24" mantiene los modelos residentes todo el día"""
+    start, end = value.split("-")
+    return int(start), int(end)
+
+
+class ModelWarmer:
+    """Precarga modelos, los mantiene residentes y registra métricas de carga"""
+
+    def __init__(self, ollama_url: str, embed_model: str, llm_model: str,
+                 keep_alive: str = "30m", heartbeat_interval: int = 240,
+                 active_hours: str = "0-24", cold_start_threshold_ms: float = 1000):
+        self.ollama_url = ollama_url
+        self.embed_model = embed_model
+        self.llm_model = llm_model
+        self.keep_alive = keep_alive
+        self.heartbeat_interval = heartbeat_interval
+        self.active_hours = parse_active_hours(active_hours)
+        self.cold_start_threshold_ms = cold_start_threshold_ms
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self.stats: Dict[str, Dict] = {model: self._new_stats() for model in (embed_model, llm_model)}
+
+    @staticmethod
+    def _new_stats() -> Dict:
+        return {
+            "loads": 0,
+            "load_time_ms_total": 0.0,
+            "last_load_time_ms": None,
+            "cold_starts": 0,
+            "warmups": 0,
+            "heartbeats": 0,
+            "errors": 0,
+            "last_seen": None
+        }
+
+    def is_active_hour(self, now: Optional[datetime] = None) -> bool:
+        start, end = self.active_hours
+        hour = (now or datetime.now()).hour
+        if start <= end:
+            return start <= hour < end
+        return hour >= start or hour < end
+
+    def record(self, model: str, response_json: dict, warmup: bool = False):
+        """
+        Registra load_duration (ns) devuelto por Ollama: toda carga suma a loads y al
+        tiempo total; sólo las que superan el umbral cuentan como cold start
+        """
+        load_ms = response_json.get("load_duration", 0) / 1e6
+        with self._lock:
+            stats = self.stats.setdefault(model, self._new_stats())
+            stats["last_seen"] = datetime.now().isoformat()
+            if load_ms <= 0:
+                return
+            stats["loads"] += 1
+            stats["load_time_ms_total"] += load_ms
+            stats["last_load_time_ms"] = round(load_ms, 2)
+            # Una carga lenta durante tráfico real es un cold start visible para el cliente
+            if load_ms >= self.cold_start_threshold_ms and not warmup:
+                stats["cold_starts"] += 1
+
+    def record_error(self, model: str):
+        with self._lock:
+            self.stats.setdefault(model, self._new_stats())["errors"] += 1
+
+    def ping(self, counter: str = "warmups") -> bool:
+        """Carga (o refresca) ambos modelos con keep_alive"""
+        ok = True
+        requests_by_model = (
+            (self.embed_model, "/api/embed", {"model": self.embed_model, "input": "warmup"}),
+            (self.llm_model, "/api/generate", {"model": self.llm_model, "prompt": "", "stream": False}),
+        )
+        for model, path, body in requests_by_model:
+            try:
+                response = requests.post(f"{self.ollama_url}{path}",
+                                         json={**body, "keep_alive": self.keep_alive}, timeout=300)
+                response.raise_for_status()
+                self.record(model, response.json(), warmup=True)
+                with self._lock:
+                    self.stats[model][counter] += 1
+            except Exception as e:
+                print(f"[ERROR] Warm-up {model}: {e}")
+                self.record_error(model)
+                ok = False
+        return ok
+
+    def start(self):
+        """Precarga inmediata + heartbeat en segundo plano durante las horas activas"""
+        if self._thread:
+            return
+        self._thread = threading.Thread(target=self._loop, name="grc-model-warmer", daemon=True)
+        self._thread.start()
+
+    def _loop(self):
+        self.ping("warmups")
+        while True:
+            time.sleep(self.heartbeat_interval)
+            if self.is_active_hour():
+                self.ping("heartbeats")
+
+    def status(self) -> dict:
+        with self._lock:
+            return {
+                "keep_alive": self.keep_alive,
+                "heartbeat_interval_s": self.heartbeat_interval,
+                "active_hours": "%d-%d" % self.active_hours,
+                "active_now": self.is_active_hour(),
+                "models": {model: dict(stats) for model, stats in self.stats.items()}
+            }
@@ -0,0 +1,315 @@
+#!/usr/bin/env python3
+"""
+GRC Notify - Despachador de notificaciones Telegram con límite por chat
+En tormentas de alertas, un mensaje por alerta choca con los límites de Telegram
+(~1 mensaje/s por chat, ~30/s por bot) y acaba en 429, retrasos y pérdidas. Aquí:
+  - token bucket por chat y otro global; un 429 pausa el chat durante retry_after
+  - las severidades altas salen primero (cola con prioridad por nivel)
+  - las severidades bajas se agrupan en un resumen periódico por chat
+  - latencia de envío (encolado → entregado) y descartes por motivo en métricas
+
+Los límites son por bot: el despachador corre en un solo proceso (ver grc_api, que lo
+alimenta desde un log en disco compartido por los workers).
+"""
+
+import heapq
+import html
+import itertools
+import re
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+
+import requests
+
+TELEGRAM_MAX_CHARS = 4096
+DIGEST_MAX_LINES = 20
+# Hueco para "…" y las etiquetas que haya que cerrar al truncar
+TRUNCATION_RESERVE = 32
+TAG_PATTERN = re.compile(r"<(/?)([a-zA-Z]+)[^<>]*>")
+
+
+def truncate_html(text: str, limit: int = TELEGRAM_MAX_CHARS) -> str:
+    """Recorta un mensaje HTML sin dejar etiquetas ni entidades a medias y cierra las abiertas"""
+    if len(text) <= limit:
+        return text
+    cut = text[:limit - TRUNCATION_RESERVE]
+    if cut.rfind("<") > cut.rfind(">"):
+        cut = cut[:cut.rfind("<")]
+    if cut.rfind("&") > cut.rfind(";"):
+        cut = cut[:cut.rfind("&")]
+    open_tags = []
+    for closing, name in TAG_PATTERN.findall(cut):
+        if not closing:
+            open_tags.append(name.lower())
+        elif open_tags and open_tags[-1] == name.lower():
+            open_tags.pop()
+    return cut + "…" + "".join(f"</{name}>" for name in reversed(open_tags))
+
+
+class TokenBucket:
+    """rate tokens/s con capacidad burst; pause() bloquea el bucket hasta un instante"""
+
+    def __init__(self, rate: float, burst: float, now: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = now
+        self.paused_until = 0.0
+
+    def wait_time(self, now: float) -> float:
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if now < self.paused_until:
+            return self.paused_until - now
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self):
+        self.tokens -= 1
+
+    def pause(self, until: float):
+        self.paused_until = max(self.paused_until, until)
+
+
+class TelegramClient:
+    """Bot API sendMessage; devuelve {"ok", "retry_after", "error"} sin lanzar"""
+
+    def __init__(self, api_url: str, token: str, timeout: float = 10):
+        self.url = f"{api_url.rstrip('/')}/bot{token}/sendMessage"
+        self.timeout = timeout
+        self.session = requests.Session()
+
+    def send_message(self, chat_id: str, text: str) -> Dict:
+        try:
+            response = self.session.post(
+                self.url,
+                json={"chat_id": chat_id, "text": text, "parse_mode": "HTML", "disable_web_page_preview": True},
+                timeout=self.timeout
+            )
+            body = response.json()
+        except (requests.RequestException, ValueError) as e:
+            return {"ok": False, "retry_after": None, "error": str(e)}
+        if body.get("ok"):
+            return {"ok": True, "retry_after": None, "error": None}
+        return {"ok": False, "retry_after": body.get("parameters", {}).get("retry_after"),
+                "error": body.get("description", f"HTTP {response.status_code}")}
+
+
+class TelegramDispatcher:
+    """
+    notify() no bloquea: encola (nivel >= digest_below_level) o añade al resumen del chat.
+    Un hilo de envío saca el mensaje de mayor prioridad entre los chats con token.
+    """
+
+    def __init__(self, client, default_chat_id: str, rate_per_chat: float = 1.0, burst: float = 1,
+                 global_rate: float = 25.0, high_level: int = 12, digest_below_level: int = 10,
+                 digest_seconds: float = 60, max_queue: int = 500, max_age_seconds: float = 600,
+                 max_retries: int = 3, metrics=None, clock: Callable[[], float] = time.monotonic):
+        self.client = client
+        self.default_chat_id = default_chat_id
+        self.rate_per_chat = rate_per_chat
+        self.burst = burst
+        self.high_level = high_level
+        self.digest_below_level = digest_below_level
+        self.digest_seconds = digest_seconds
+        self.max_queue = max_queue
+        self.max_age_seconds = max_age_seconds
+        self.max_retries = max_retries
+        self.metrics = metrics
+        self.clock = clock
+        self._queues: Dict[str, List] = {}
+        self._buckets: Dict[str, TokenBucket] = {}
+        self._global = TokenBucket(global_rate, global_rate, clock())
+        self._digests: Dict[str, Dict] = {}
+        self._seq = itertools.count()
+        self._cv = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+        self.stats = {"queued": 0, "sent": 0, "digests": 0, "digested_alerts": 0, "rate_limited": 0,
+                      "retries": 0, "latency_ms_total": 0.0, "latency_ms_max": 0.0}
+        self.dropped: Dict[str, int] = {}
+
+    def notify(self, text: str, level: int, chat_id: Optional[str] = None,
+               digest_line: Optional[str] = None) -> str:
+        """Devuelve 'queued', 'digested' o 'dropped'"""
+        chat_id = str(chat_id or self.default_chat_id)
+        now = self.clock()
+        with self._cv:
+            if level < self.digest_below_level:
+                digest = self._digests.setdefault(chat_id, {"started": now, "lines": [], "count": 0, "level": 0})
+                digest["count"] += 1
+                digest["level"] = max(digest["level"], level)
+                if len(digest["lines"]) < DIGEST_MAX_LINES:
+                    digest["lines"].append(digest_line or text)
+                return "digested"
+            status = self._enqueue(chat_id, text, level, now, "high" if level >= self.high_level else "normal")
+            self._cv.notify()
+            return status
+
+    def _enqueue(self, chat_id: str, text: str, level: int, now: float, kind: str) -> str:
+        queue = self._queues.setdefault(chat_id, [])
+        # enqueued mide la latencia de extremo a extremo; queued_at, la caducidad (se renueva al reintentar)
+        item = [-level, next(self._seq), {"text": truncate_html(text), "enqueued": now, "queued_at": now,
+                                          "kind": kind, "attempts": 0}]
+        if len(queue) >= self.max_queue:
+            # Cola llena: se descarta el de menor prioridad (el nuevo si es él)
+            worst = max(queue)
+            if item[:2] > worst[:2]:
+                self._drop("queue_full", kind)
+                return "dropped"
+            queue.remove(worst)
+            heapq.heapify(queue)
+            self._drop("queue_full", worst[2]["kind"])
+        heapq.heappush(queue, item)
+        self.stats["queued"] += 1
+        return "queued"
+
+    def _drop(self, reason: str, kind: str):
+        self.dropped[reason] = self.dropped.get(reason, 0) + 1
+        if self.metrics is not None:
+            self.metrics.inc("notify_dropped_total", help_text="Notificaciones descartadas",
+                             reason=reason, kind=kind)
+
+    def _flush_digests(self, now: float):
+        for chat_id in [c for c, d in self._digests.items() if now - d["started"] >= self.digest_seconds]:
+            digest = self._digests.pop(chat_id)
+            lines = "\n".join(digest["lines"])
+            more = digest["count"] - len(digest["lines"])
+            text = (f"📬 <b>Resumen: {digest['count']} alertas de severidad baja</b>\n{lines}"
+                    + (f"\n… y {more} más" if more > 0 else ""))
+            self.stats["digests"] += 1
+            self.stats["digested_alerts"] += digest["count"]
+            self._enqueue(chat_id, text, digest["level"], digest["started"], "digest")
+
+    def _bucket(self, chat_id: str, now: float) -> TokenBucket:
+        bucket = self._buckets.get(chat_id)
+        if bucket is None:
+            bucket = self._buckets[chat_id] = TokenBucket(self.rate_per_chat, self.burst, now)
+        return bucket
+
+    def _expire(self, queue: List, now: float):
+        """Descarta los mensajes caducados de toda la cola (el heap ordena por prioridad, no por edad)"""
+        expired = [item for item in queue if now - item[2]["queued_at"] > self.max_age_seconds]
+        if not expired:
+            return
+        queue[:] = [item for item in queue if now - item[2]["queued_at"] <= self.max_age_seconds]
+        heapq.heapify(queue)
+        for item in expired:
+            self._drop("expired", item[2]["kind"])
+
+    def _next_ready(self, now: float):
+        """(chat, item) de mayor prioridad con token disponible, o (None, espera)"""
+        best, wait = None, 1.0
+        global_wait = self._global.wait_time(now)
+        for chat_id, queue in self._queues.items():
+            self._expire(queue, now)
+            if not queue:
+                continue
+            chat_wait = max(self._bucket(chat_id, now).wait_time(now), global_wait)
+            if chat_wait > 0:
+                wait = min(wait, chat_wait)
+            elif best is None or queue[0][:2] < self._queues[best][0][:2]:
+                best = chat_id
+        if best is None:
+            return None, wait
+        self._bucket(best, now).take()
+        self._global.take()
+        return best, heapq.heappop(self._queues[best])
+
+    def start(self):
+        if self._thread:
+            return
+        self._thread = threading.Thread(target=self._loop, name="grc-notify", daemon=True)
+        self._thread.start()
+
+    def _loop(self):
+        while True:
+            with self._cv:
+                now = self.clock()
+                self._flush_digests(now)
+                chat_id, item = self._next_ready(now)
+                if chat_id is None:
+                    self._cv.wait(timeout=item)
+                    continue
+            self._send(chat_id, item)
+
+    def _send(self, chat_id: str, item: List):
+        message = item[2]
+        result = self.client.send_message(chat_id, message["text"])
+        now = self.clock()
+        with self._cv:
+            if result["ok"]:
+                latency_ms = (now - message["enqueued"]) * 1000
+                self.stats["sent"] += 1
+                self.stats["latency_ms_total"] += latency_ms
+                self.stats["latency_ms_max"] = max(self.stats["latency_ms_max"], latency_ms)
+                if self.metrics is not None:
+                    self.metrics.observe("notify_latency_seconds", latency_ms / 1000,
+                                         help_text="Latencia encolado → entregado en Telegram",
+                                         kind=message["kind"])
+                return
+
+            message["attempts"] += 1
+            if result["retry_after"] is not None:
+                # 429: el chat queda en pausa lo que indique Telegram
+                self.stats["rate_limited"] += 1
+                resume = now + float(result["retry_after"])
+            else:
+                print(f"[ERROR] Telegram chat {chat_id}: {result['error']}")
+                resume = now + 2 ** message["attempts"]
+            self._bucket(chat_id, now).pause(resume)
+            if message["attempts"] > self.max_retries:
+                self._drop("rate_limited" if result["retry_after"] is not None else "send_failed",
+                           message["kind"])
+                return
+            self.stats["retries"] += 1
+            # La caducidad cuenta desde que el chat vuelve a poder enviar
+            message["queued_at"] = resume
+            heapq.heappush(self._queues.setdefault(chat_id, []), item)
+
+    def status(self) -> Dict:
+        with self._cv:
+            sent = self.stats["sent"]
+            return {
+                "queue_depth": sum(len(q) for q in self._queues.values()),
+                "digest_pending": sum(d["count"] for d in self._digests.values()),
+                "dropped": dict(self.dropped),
+                "latency_ms_avg": round(self.stats["latency_ms_total"] / sent, 1) if sent else None,
+                **{k: v for k, v in self.stats.items() if k != "latency_ms_total"}
+            }
+
+
+def format_alert_message(response: dict) -> str:
+    """Mensaje HTML (mismo contenido que el nodo Telegram de n8n) desde la respuesta SOAR"""
+    alert = response.get("alert", {})
+    analysis = response.get("soc_analysis") or {}
+    mapping = response.get("compliance_mapping") or {}
+    incident = response.get("incident")
+
+    def e(value) -> str:
+        return html.escape(str(value if value is not None else "N/A"))
+
+    lines = [
+        "🚨 <b>ALERTA DE SEGURIDAD</b>",
+        f"📋 <b>Regla:</b> {e(alert.get('description'))}",
+        f"⚠️ <b>Nivel:</b> {e(alert.get('level'))}  🖥️ <b>Agente:</b> {e(alert.get('agent_name'))}"
+    ]
+    if incident and incident.get("count", 1) > 1:
+        lines.append(f"🔁 <b>Eventos:</b> {incident['count']} ({e(incident['first_seen'])} → {e(incident['last_seen'])})")
+    lines.append(f"🤖 <b>Análisis IA:</b> {e(analysis.get('severity'))} | {e(analysis.get('mitre_technique'))}")
+    if analysis.get("description"):
+        lines.append(e(str(analysis["description"])[:500]))
+    if analysis.get("iocs"):
+        lines.append(f"<b>IOCs:</b> {e(', '.join(map(str, analysis['iocs'][:10])))}")
+    for framework, title in (("iso_27001", "🏛️ <b>Controles ISO 27001:</b>"), ("nist_800_53", "📊 <b>Controles NIST:</b>")):
+        controls = mapping.get(framework) or []
+        if controls:
+            lines.append(title)
+            lines.extend(f"• {e(c['id'])}: {e(c['name'])}" for c in controls[:5])
+    return "\n".join(lines)
+
+
+def format_digest_line(response: dict) -> str:
+    alert = response.get("alert", {})
+    count = (response.get("incident") or {}).get("count", 1)
+    return (f"• [{html.escape(str(alert.get('level')))}] {html.escape(str(alert.get('description')))} "
+            f"({html.escape(str(alert.get('agent_name')))})" + (f" ×{count}" if count > 1 else ""))
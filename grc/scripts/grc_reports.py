@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+"""
+GRC Reports - Construcción de reportes de cumplimiento
+- Prompt compacto para el LLM (prefijo estático reutilizable + controles podados)
+- Reporte determinista (sin LLM) desde los campos del catálogo
+"""
+
+from typing import Dict, List
+
+# Prefijo idéntico en todas las peticiones: Ollama reutiliza su KV cache entre reportes.
+# Todo lo variable (alerta y controles) va al final del prompt.
+STATIC_PROMPT_PREFIX = """Eres experto GRC. Con la alerta y controles dados, responde conciso en español:
+1. Impacto en Cumplimiento (frameworks)
+2. Controles Relevantes (top 3)
+3. Riesgo de No-Cumplimiento
+4. Acciones Recomendadas
+5. Evidencia Requerida
+"""
+
+
+def parse_num_predict(value: str) -> List[tuple]:
+    """"12:512,7:320,0:192" → [(12, 512), (7, 320), (0, 192)] (nivel mínimo → tokens)"""
+    caps = []
+    for part in value.split(","):
+        level, tokens = part.split(":")
+        caps.append((int(level), int(tokens)))
+    return sorted(caps, reverse=True)
+
+
+def num_predict_for(level: int, caps: List[tuple]) -> int:
+    """Límite de tokens generados según la severidad de la alerta"""
+    for min_level, tokens in caps:
+        if level >= min_level:
+            return tokens
+    return caps[-1][1]
+
+
+def select_prompt_controls(controls: List[Dict], min_score: float = 0.35,
+                           max_controls: int = 4) -> List[Dict]:
+    """
+    Poda controles para el prompt: descarta los de baja relevancia y los redundantes
+    (un control ya cubierto por el mapeo cruzado ISO↔NIST de otro control incluido)
+    """
+    selected = []
+    covered = set()
+    for hit in sorted(controls, key=lambda c: -c['score']):
+        if hit['score'] < min_score and selected:
+            break
+        payload = hit['payload']
+        short_id = payload['id'].split('-', 1)[1]
+        if short_id in covered:
+            continue
+        selected.append(hit)
+        covered.update(payload.get('nist_mapping', []))
+        covered.update(payload.get('iso_mapping', []))
+        if len(selected) >= max_controls:
+            break
+    return selected
+
+
+def build_report_prompt(alert_data: dict, controls: List[Dict]) -> str:
+    """Prompt compacto: prefijo estático + alerta + controles seleccionados"""
+    lines = []
+    for c in controls:
+        payload = c['payload']
+        equivalents = payload.get('nist_mapping') or payload.get('iso_mapping') or []
+        suffix = f" (≈{', '.join(equivalents)})" if equivalents else ""
+        lines.append(f"- {payload['id']}: {payload['name']}{suffix}")
+    controls_text = "\n".join(lines)
+    return (
+        f"{STATIC_PROMPT_PREFIX}\n"
+        f"ALERTA: {alert_data.get('rule_description', 'N/A')} | Nivel {alert_data.get('rule_level', 'N/A')} | "
+        f"Agente {alert_data.get('agent_name', 'N/A')} | MITRE {mitre_label(alert_data.get('mitre_id')) or 'N/A'}\n"
+        f"CONTROLES:\n{controls_text}\n"
+    )
+
+
+def mitre_label(value) -> str:
+    """mitre.id de Wazuh ("T1110" o ["T1110", "T1110.001"]) como texto para prompts y reportes"""
+    if isinstance(value, (list, tuple)):
+        value = ", ".join(str(v) for v in value if v)
+    return str(value) if value else ""
+
+
+def _risk_statement(level: int) -> str:
+    if level >= 12:
+        return ("ALTO - Alerta crítica: posible incumplimiento material de los controles listados. "
+                "Requiere respuesta inmediata y registro como incidente de seguridad.")
+    if level >= 7:
+        return ("MEDIO - Indica debilidad en la operación de los controles. "
+                "Puede derivar en no conformidades en auditoría si se repite.")
+    return ("BAJO - Evento informativo. Mantener evidencia de monitoreo para "
+            "demostrar la operación continua de los controles.")
+
+
+def _dedupe(items: List[str]) -> List[str]:
+    return list(dict.fromkeys(i for i in items if i))
+
+
+def build_template_report(alert_data: dict, controls: List[Dict], level: int = 0) -> str:
+    """Reporte estructurado con las mismas secciones que el prompt LLM, a partir del catálogo"""
+    payloads = [c['payload'] for c in controls]
+    top = payloads[:3]
+
+    frameworks = _dedupe([p.get('framework', '') for p in payloads])
+    cross_refs = _dedupe(
+        [f"NIST {m}" for p in payloads for m in p.get('nist_mapping', [])] +
+        [f"ISO {m}" for p in payloads for m in p.get('iso_mapping', [])]
+    )
+    evidence = _dedupe(
+        [e for p in top for e in p.get('evidence_required', [])] +
+        [a for p in top for a in p.get('assessment_procedures', [])]
+    )
+
+    lines = [
+        f"Alerta: {alert_data.get('rule_description', 'N/A')} "
+        f"(Nivel {alert_data.get('rule_level', 'N/A')}, Agente {alert_data.get('agent_name', 'N/A')}, "
+        f"MITRE {mitre_label(alert_data.get('mitre_id')) or 'N/A'})",
+        "",
+        "1. **Impacto en Cumplimiento**: " + (", ".join(frameworks) or "Sin controles relacionados"),
+    ]
+    if cross_refs:
+        lines.append("   Controles equivalentes: " + ", ".join(cross_refs[:8]))
+
+    lines.append("2. **Controles Relevantes**:")
+    lines.extend(f"   - {p['id']}: {p['name']}" for p in top)
+
+    lines.append("3. **Riesgo de No-Cumplimiento**: " + _risk_statement(level))
+
+    lines.append("4. **Acciones Recomendadas**:")
+    lines.extend(f"   - {p['id']}: {p.get('implementation_guidance', '')}" for p in top)
+
+    lines.append("5. **Evidencia Requerida**:")
+    lines.extend(f"   - {e}" for e in evidence[:8])
+
+    return "\n".join(lines)
@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+"""
+GRC Retrieval - Mapeo alerta → controles sin estado de proceso
+Consulta de la alerta, coincidencia MITRE exacta y relleno por framework con la
+búsqueda vectorial inyectada. La usan la API y el build de la tabla de mapeos; importar
+este módulo no abre bases de datos ni arranca hilos.
+"""
+
+from typing import Callable, Dict, Iterable, List
+
+from grc_catalog import MitreIndex, fill_by_framework, frameworks_short
+from grc_reports import mitre_label
+
+
+def build_alert_query(alert_data: dict) -> str:
+    """Construye la consulta de búsqueda a partir de la alerta"""
+    return f"""
+    {alert_data.get('rule_description', '')}
+    {mitre_label(alert_data.get('mitre_id'))}
+    {alert_data.get('mitre_tactic', '')}
+    """
+
+
+def framework_search_request(embeddings: list, per_framework: int, frameworks: list) -> dict:
+    """Cuerpo search/batch: una búsqueda por (embedding, framework) con filtro de payload"""
+    return {
+        "searches": [
+            {
+                "vector": embedding,
+                "limit": per_framework,
+                "with_payload": True,
+                "filter": {"must": [{"key": "framework", "match": {"value": framework}}]}
+            }
+            for embedding in embeddings
+            for framework in frameworks
+        ]
+    }
+
+
+def group_framework_results(results: list, count: int, frameworks: list) -> list:
+    """Une las listas por framework de cada embedding, ordenadas por score"""
+    n = len(frameworks)
+    return [
+        sorted((hit for hits in results[i * n:(i + 1) * n] for hit in hits), key=lambda h: -h['score'])
+        for i in range(count)
+    ]
+
+
+def map_alerts(alerts: List[dict], mitre_index: MitreIndex, frameworks: Iterable[str],
+               search_batch: Callable[[List[str]], List[List[Dict]]], per_framework: int) -> List[List[Dict]]:
+    """
+    Coincidencia MITRE exacta por alerta; las que dejan algún framework por debajo de
+    per_framework se rellenan con search_batch(consultas) en una sola llamada
+    """
+    results, pending = [], []
+    for i, alert_data in enumerate(alerts):
+        exact = mitre_index.search(alert_data.get('mitre_id'))
+        results.append(exact)
+        if frameworks_short(exact, frameworks, per_framework):
+            pending.append(i)
+
+    vector_results = search_batch([build_alert_query(alerts[i]) for i in pending]) if pending else []
+    for i, vector in zip(pending, vector_results):
+        results[i] = fill_by_framework(results[i], vector, per_framework)
+    return results
@@ -0,0 +1,235 @@
+#!/usr/bin/env python3
+"""
+GRC Snapshot - Catálogo de controles + matriz de vectores en un archivo mapeado en memoria
+Todos los workers mapean el mismo archivo (page cache compartida) en lugar de
+mantener copias privadas. Un reindexado escribe un archivo nuevo y lo sustituye
+con os.replace(); los workers detectan el cambio y vuelven a mapearlo.
+
+Formato:
+    b"GRCSNAP1" | uint32 longitud header | header JSON | payloads JSON | padding | float32[count * dim]
+    (el header indica count, dim y payload_bytes)
+
+Lo compartido es la matriz de vectores. Los payloads (~80 controles, ~50 KB de
+JSON) sí se decodifican en cada worker: los índices MITRE, léxico, de
+crosswalk y de gaps se construyen recorriendo el catálogo completo, así que una
+lectura perezosa desde el mmap no evitaría decodificarlos.
+
+Uso:
+    python grc_snapshot.py export      # exporta grc_controls desde Qdrant al snapshot
+"""
+
+import json
+import math
+import mmap
+import os
+import struct
+import sys
+import threading
+import time
+from array import array
+from datetime import datetime
+from typing import Dict, List, Optional
+
+try:
+    import numpy as np
+except ImportError:  # numpy es opcional: sin él se usa producto escalar en Python
+    np = None
+
+MAGIC = b"GRCSNAP1"
+DEFAULT_SNAPSHOT_PATH = os.getenv('GRC_SNAPSHOT_PATH', 'grc_catalog.snap')
+
+
+def _normalize(vector: List[float]) -> List[float]:
+    norm = math.sqrt(sum(x * x for x in vector)) or 1.0
+    return [x / norm for x in vector]
+
+
+def write_snapshot(path: str, controls: List[Dict], vectors: List[List[float]],
+                   embed_model: str = "") -> str:
+    """Escribe el snapshot en un archivo temporal y lo publica atómicamente"""
+    if len(controls) != len(vectors):
+        raise ValueError("controls y vectors deben tener la misma longitud")
+    dim = len(vectors[0]) if vectors else 0
+
+    payloads = json.dumps(controls).encode()
+    header = {
+        "count": len(controls),
+        "dim": dim,
+        "payload_bytes": len(payloads),
+        "embed_model": embed_model,
+        "created_at": datetime.now().isoformat()
+    }
+    header_bytes = json.dumps(header).encode()
+    prefix_len = len(MAGIC) + 4 + len(header_bytes) + len(payloads)
+    padding = (-prefix_len) % 4
+
+    matrix = array('f')
+    for vector in vectors:
+        if len(vector) != dim:
+            raise ValueError("todos los vectores deben tener la misma dimensión")
+        matrix.extend(_normalize(vector))
+
+    tmp_path = f"{path}.tmp-{os.getpid()}"
+    with open(tmp_path, "wb") as f:
+        f.write(MAGIC)
+        f.write(struct.pack("<I", len(header_bytes)))
+        f.write(header_bytes)
+        f.write(payloads)
+        f.write(b"\0" * padding)
+        f.write(matrix.tobytes())
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    return path
+
+
+class CatalogSnapshot:
+    """Vista de sólo lectura sobre un snapshot mapeado en memoria"""
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as f:
+            stat = os.fstat(f.fileno())
+            self.identity = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        if self._mm[:len(MAGIC)] != MAGIC:
+            raise ValueError(f"{path} no es un snapshot GRC")
+        (header_len,) = struct.unpack_from("<I", self._mm, len(MAGIC))
+        offset = len(MAGIC) + 4
+        self.header = json.loads(self._mm[offset:offset + header_len])
+        offset += header_len
+
+        self.count = self.header["count"]
+        self.dim = self.header["dim"]
+        payload_end = offset + self.header["payload_bytes"]
+        # Copia privada por worker (ver docstring del módulo): la necesitan los índices en memoria
+        self.controls: List[Dict] = json.loads(self._mm[offset:payload_end])
+        self.rows_by_framework: Dict[str, List[int]] = {}
+        for i, control in enumerate(self.controls):
+            self.rows_by_framework.setdefault(control['framework'], []).append(i)
+        matrix_offset = payload_end + (-payload_end) % 4
+
+        # Sin copia: la matriz se lee directamente de las páginas mapeadas
+        if np is not None:
+            self._matrix = np.frombuffer(self._mm, dtype=np.float32, count=self.count * self.dim,
+                                         offset=matrix_offset).reshape(self.count, self.dim)
+        else:
+            self._matrix = memoryview(self._mm)[matrix_offset:matrix_offset + self.count * self.dim * 4].cast('f')
+
+    def _scores(self, query: List[float]) -> List[float]:
+        query = _normalize(query)
+        if np is not None:
+            return (self._matrix @ np.asarray(query, dtype=np.float32)).tolist()
+        dim = self.dim
+        matrix = self._matrix
+        return [
+            sum(a * b for a, b in zip(matrix[i * dim:(i + 1) * dim], query))
+            for i in range(self.count)
+        ]
+
+    def search(self, query: List[float], limit: int = 5, framework: Optional[str] = None) -> List[Dict]:
+        """Top-k por coseno; devuelve hits con el formato de Qdrant"""
+        scores = self._scores(query)
+        candidates = self.rows_by_framework.get(framework, []) if framework else range(self.count)
+        top = sorted(candidates, key=lambda i: -scores[i])[:limit]
+        return [{"id": self.controls[i]['id'], "score": scores[i], "payload": self.controls[i]} for i in top]
+
+    def search_by_framework(self, query: List[float], limit: int = 5) -> List[Dict]:
+        """limit resultados de cada framework con un único cálculo de scores"""
+        scores = self._scores(query)
+        hits = []
+        for rows in self.rows_by_framework.values():
+            for i in sorted(rows, key=lambda i: -scores[i])[:limit]:
+                hits.append({"id": self.controls[i]['id'], "score": scores[i], "payload": self.controls[i]})
+        return hits
+
+    def search_batch(self, queries: List[List[float]], limit: int = 5) -> List[List[Dict]]:
+        if np is None or not queries:
+            return [self.search(q, limit) for q in queries]
+        # Un único producto matricial para todo el lote
+        batch = np.asarray([_normalize(q) for q in queries], dtype=np.float32)
+        scores = batch @ self._matrix.T
+        results = []
+        for row in scores:
+            top = np.argsort(-row)[:limit]
+            results.append([
+                {"id": self.controls[i]['id'], "score": float(row[i]), "payload": self.controls[i]}
+                for i in top
+            ])
+        return results
+
+
+class SnapshotHolder:
+    """Mantiene el snapshot vigente y lo vuelve a mapear cuando el archivo es sustituido"""
+
+    def __init__(self, path: str, check_interval: float = 5.0, on_reload=None):
+        self.path = path
+        self.check_interval = check_interval
+        self.on_reload = on_reload
+        self.snapshot: Optional[CatalogSnapshot] = None
+        self._last_check = 0.0
+        self._lock = threading.Lock()
+        self.reloads = 0
+
+    def get(self) -> Optional[CatalogSnapshot]:
+        now = time.monotonic()
+        if now - self._last_check >= self.check_interval:
+            self._last_check = now
+            self._maybe_reload()
+        return self.snapshot
+
+    def _maybe_reload(self):
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return
+        identity = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+        if self.snapshot and self.snapshot.identity == identity:
+            return
+        with self._lock:
+            if self.snapshot and self.snapshot.identity == identity:
+                return
+            try:
+                snapshot = CatalogSnapshot(self.path)
+            except (OSError, ValueError) as e:
+                print(f"[ERROR] Cargando snapshot {self.path}: {e}")
+                return
+            # El mapeo anterior se libera cuando ninguna petición en curso lo referencia
+            self.snapshot = snapshot
+            self.reloads += 1
+            print(f"[INFO] Snapshot GRC cargado: {snapshot.count} controles, dim={snapshot.dim}")
+            if self.on_reload:
+                self.on_reload(snapshot)
+
+
+def export_from_qdrant(qdrant_url: str, collection: str, path: str, embed_model: str = "") -> int:
+    """Exporta payloads + vectores de una colección Qdrant a un snapshot"""
+    import requests
+
+    controls, vectors = [], []
+    offset = None
+    while True:
+        body = {"limit": 256, "with_payload": True, "with_vector": True}
+        if offset is not None:
+            body["offset"] = offset
+        response = requests.post(f"{qdrant_url}/collections/{collection}/points/scroll", json=body)
+        result = response.json().get("result", {})
+        for point in result.get("points", []):
+            controls.append(point["payload"])
+            vectors.append(point["vector"])
+        offset = result.get("next_page_offset")
+        if offset is None:
+            break
+
+    write_snapshot(path, controls, vectors, embed_model)
+    return len(controls)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "export":
+        qdrant = os.getenv('QDRANT_URL', "http://localhost:6333")
+        total = export_from_qdrant(qdrant, "grc_controls", DEFAULT_SNAPSHOT_PATH, "nomic-embed-text")
+        print(f"✅ Snapshot {DEFAULT_SNAPSHOT_PATH}: {total} controles")
+    else:
+        print(__doc__)
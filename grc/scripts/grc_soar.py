@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""
+GRC SOAR - Análisis SOC + reporte de cumplimiento en una sola generación
+Recibe el webhook crudo de Wazuh (el mismo cuerpo que el flujo n8n) y pide al LLM
+una única respuesta JSON con ambas partes, en lugar de dos generaciones separadas.
+"""
+
+import json
+from typing import Dict, List
+
+from grc_reports import build_template_report, mitre_label
+
+# Prefijo estático (reutiliza la KV cache de Ollama); lo variable va al final
+SOAR_PROMPT_PREFIX = """Eres analista SOC y experto GRC. Con la alerta, el contexto MITRE ATT&CK y los
+controles dados, responde SOLO con un objeto JSON en español con esta forma:
+{"soc_analysis": {"severity": "Alta|Media|Baja", "mitre_technique": "ID y nombre",
+  "description": "explicación del ataque", "iocs": ["..."], "recommendations": ["..."]},
+ "compliance_report": "impacto en cumplimiento, controles relevantes, riesgo, acciones y evidencia"}
+"""
+
+SOC_FIELDS = ("severity", "mitre_technique", "description", "iocs", "recommendations")
+
+
+def _first(value):
+    if isinstance(value, (list, tuple)):
+        return value[0] if value else None
+    return value
+
+
+def parse_wazuh_alert(body: dict) -> Dict:
+    """
+    Normaliza el webhook de Wazuh ({"alert": {...}} o la alerta directa) al formato
+    plano de map-alert, conservando IP/usuario de origen para el análisis SOC
+    """
+    alert = body.get('alert', body) if isinstance(body, dict) else {}
+    rule = alert.get('rule', {}) or {}
+    mitre = rule.get('mitre', {}) or {}
+    data = alert.get('data', {}) or {}
+    source = alert.get('source', {}) or {}
+    vulnerability = data.get('vulnerability', {}) or {}
+    return {
+        "rule_id": rule.get('id'),
+        "rule_description": rule.get('description', ''),
+        "rule_level": rule.get('level', 0),
+        "agent_name": (alert.get('agent', {}) or {}).get('name'),
+        "mitre_id": mitre_label(mitre.get('id')) or None,
+        "mitre_tactic": ", ".join(mitre.get('tactic', [])) if isinstance(mitre.get('tactic'), list) else mitre.get('tactic'),
+        "mitre_technique": _first(mitre.get('technique')),
+        "srcip": data.get('srcip') or data.get('src_ip') or source.get('ip'),
+        "srcuser": data.get('srcuser') or data.get('dstuser'),
+        "cve_id": vulnerability.get('cve') if isinstance(vulnerability, dict) else None,
+        "timestamp": alert.get('timestamp')
+    }
+
+
+def incident_line(alert_data: dict) -> str:
+    """Contexto del incidente agregado (varios eventos de la misma regla/agente/técnica)"""
+    count = alert_data.get('event_count', 1)
+    if count <= 1:
+        return ""
+    sources = ", ".join(alert_data.get('sources', [])[:10]) or 'N/A'
+    return (f"INCIDENTE: {count} eventos entre {alert_data.get('first_seen')} y "
+            f"{alert_data.get('last_seen')} | Orígenes: {sources}\n")
+
+
+def build_soar_prompt(alert_data: dict, controls: List[Dict], techniques: List[Dict]) -> str:
+    """Prefijo estático + alerta + técnicas ATT&CK (de threat_intelligence) + controles"""
+    technique_lines = [f"- {t.get('title')}: {(t.get('content') or '')[:300]}" for t in techniques[:3]]
+    control_lines = [f"- {c['payload']['id']}: {c['payload']['name']}" for c in controls]
+    return (
+        f"{SOAR_PROMPT_PREFIX}\n"
+        f"ALERTA: {alert_data.get('rule_description', 'N/A')} | Nivel {alert_data.get('rule_level', 'N/A')} | "
+        f"Agente {alert_data.get('agent_name', 'N/A')} | MITRE {mitre_label(alert_data.get('mitre_id')) or 'N/A'} | "
+        f"IP origen {alert_data.get('srcip') or 'N/A'} | Usuario {alert_data.get('srcuser') or 'N/A'}\n"
+        f"{incident_line(alert_data)}"
+        f"MITRE ATT&CK:\n{chr(10).join(technique_lines) or '- Sin contexto'}\n"
+        f"CONTROLES:\n{chr(10).join(control_lines)}\n"
+    )
+
+
+def parse_soar_response(text: str) -> Dict:
+    """
+    JSON del LLM → {"soc_analysis": {...}, "compliance_report": str | None}.
+    Si la respuesta no es JSON válido se conserva como resumen del análisis.
+    """
+    try:
+        result = json.loads(text)
+    except (TypeError, ValueError):
+        return {"soc_analysis": {"description": text}, "compliance_report": None, "structured": False}
+    if not isinstance(result, dict):
+        return {"soc_analysis": {"description": str(result)}, "compliance_report": None, "structured": False}
+
+    analysis = result.get('soc_analysis')
+    if not isinstance(analysis, dict):
+        analysis = {"description": analysis}
+    report = result.get('compliance_report')
+    if report is not None and not isinstance(report, str):
+        report = json.dumps(report, ensure_ascii=False)
+    return {"soc_analysis": {k: analysis.get(k) for k in SOC_FIELDS if analysis.get(k) is not None},
+            "compliance_report": report, "structured": True}
+
+
+def _severity(level: int) -> str:
+    if level >= 12:
+        return "Alta"
+    if level >= 7:
+        return "Media"
+    return "Baja"
+
+
+def build_template_soc_analysis(alert_data: dict, controls: List[Dict], techniques: List[Dict],
+                                level: int = 0) -> Dict:
+    """Análisis SOC determinista (breaker abierto, descarte o error del LLM)"""
+    technique = techniques[0].get('title') if techniques else None
+    return {
+        "severity": _severity(level),
+        "mitre_technique": technique or alert_data.get('mitre_technique') or mitre_label(alert_data.get('mitre_id')) or None,
+        "description": alert_data.get('rule_description'),
+        "iocs": list(dict.fromkeys(
+            i for i in (alert_data.get('srcip'), *alert_data.get('sources', []), alert_data.get('srcuser')) if i
+        )),
+        "recommendations": [
+            f"{c['payload']['id']}: {c['payload'].get('implementation_guidance', '')}" for c in controls[:3]
+        ]
+    }
+
+
+def build_template_soar(alert_data: dict, controls: List[Dict], techniques: List[Dict], level: int = 0) -> Dict:
+    return {
+        "soc_analysis": build_template_soc_analysis(alert_data, controls, techniques, level),
+        "compliance_report": build_template_report(alert_data, controls, level)
+    }
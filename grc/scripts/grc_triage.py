@@ -0,0 +1,293 @@
+#!/usr/bin/env python3
+"""
+GRC Triage - Decide antes del LLM qué alertas necesitan una generación nueva
+Rutas:
+  llm           alerta crítica, regla marcada o sin precedentes parecidos
+  cached        una alerta casi idéntica ya se analizó (kNN sobre embeddings): se reutiliza
+  mapping_only  ruido conocido (nivel bajo o reglas marcadas): sólo mapeo de controles
+
+Las reglas no necesitan embedding; el kNN compara con los análisis LLM previos del
+mismo catálogo y antigüedad acotada. Un análisis reutilizado se re-renderiza con el
+agente, IP y usuario de la alerta actual. Cada decisión se registra en JSONL (rotado
+por tamaño) para ajustar umbrales y listas de reglas.
+"""
+
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+
+try:
+    import numpy as np
+except ImportError:  # numpy es opcional: sin él se usa producto escalar en Python
+    np = None
+
+from grc_admission import alert_priority
+
+ROUTE_LLM = "llm"
+ROUTE_CACHED = "cached"
+ROUTE_MAPPING_ONLY = "mapping_only"
+KNN_CANDIDATES = 5
+
+# Campos propios de cada alerta que el LLM suele citar en el análisis
+ALERT_FIELDS = ("agent_name", "srcip", "srcuser")
+
+
+def parse_rule_ids(value: str) -> frozenset:
+    """"5710,5712" → {"5710", "5712"}"""
+    return frozenset(v.strip() for v in (value or "").split(",") if v.strip())
+
+
+def _normalize(vector) -> List[float]:
+    norm = sum(v * v for v in vector) ** 0.5 or 1.0
+    return [v / norm for v in vector]
+
+
+def alert_fields(alert_data: dict) -> Dict[str, str]:
+    return {f: str(alert_data[f]) for f in ALERT_FIELDS if alert_data.get(f)}
+
+
+def render_for_alert(result, previous: Dict[str, str], alert_data: dict):
+    """Sustituye en un análisis reutilizado el agente/IP/usuario de la alerta original por los actuales"""
+    current = alert_fields(alert_data)
+    replacements = [(re.compile(rf"(?<![\w.-]){re.escape(value)}(?![\w-]|\.\w)"), current.get(field, "N/A"))
+                    for field, value in previous.items() if value != current.get(field)]
+    if not replacements:
+        return result
+
+    def render(value):
+        if isinstance(value, str):
+            for pattern, replacement in replacements:
+                value = pattern.sub(lambda _: replacement, value)
+            return value
+        if isinstance(value, list):
+            return [render(v) for v in value]
+        if isinstance(value, dict):
+            return {k: render(v) for k, v in value.items()}
+        return value
+
+    return render(result)
+
+
+class AnalysisMemory:
+    """
+    Análisis LLM previos por tipo ("report", "soar"): embedding normalizado + resultado.
+    SQLite para sobrevivir reinicios; los últimos max_entries se consultan en memoria,
+    en un buffer circular cuyas filas coinciden con las de la matriz numpy (se actualiza
+    la fila al recordar, sin reconstruir la matriz).
+    """
+
+    def __init__(self, path: str, max_entries: int = 5000):
+        self.path = path
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.row_factory = sqlite3.Row
+        self._entries: Dict[str, List[Dict]] = {}
+        self._next_slot: Dict[str, int] = {}
+        self._matrices: Dict[str, object] = {}
+        with self._lock, self._conn:
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS analysed_alerts (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    kind TEXT NOT NULL,
+                    catalog_fingerprint TEXT NOT NULL,
+                    embedding TEXT NOT NULL,
+                    result TEXT NOT NULL,
+                    alert TEXT NOT NULL DEFAULT '{}',
+                    created_at REAL NOT NULL
+                )
+            """)
+            columns = {row["name"] for row in self._conn.execute("PRAGMA table_info(analysed_alerts)")}
+            if "alert" not in columns:
+                # Bases creadas antes de guardar los campos de la alerta analizada
+                self._conn.execute("ALTER TABLE analysed_alerts ADD COLUMN alert TEXT NOT NULL DEFAULT '{}'")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_analysed_kind ON analysed_alerts (kind, id)")
+            # Los últimos max_entries de cada tipo (igual que los buffers en memoria)
+            rows = []
+            for (kind,) in self._conn.execute("SELECT DISTINCT kind FROM analysed_alerts").fetchall():
+                rows.extend(self._conn.execute(
+                    "SELECT * FROM analysed_alerts WHERE kind = ? ORDER BY id DESC LIMIT ?", (kind, max_entries)
+                ).fetchall())
+        for row in sorted(rows, key=lambda r: r["id"]):
+            self._add(row["id"], row["kind"], row["catalog_fingerprint"], json.loads(row["embedding"]),
+                      json.loads(row["result"]), json.loads(row["alert"]), row["created_at"])
+
+    def _add(self, entry_id: int, kind: str, fingerprint: str, embedding: List[float], result,
+             alert: Dict[str, str], created_at: float):
+        entries = self._entries.setdefault(kind, [])
+        entry = {"id": entry_id, "fingerprint": fingerprint, "embedding": embedding,
+                 "result": result, "alert": alert, "created_at": created_at}
+        slot = self._next_slot.get(kind, 0)
+        if slot < len(entries):
+            entries[slot] = entry
+        else:
+            entries.append(entry)
+        self._next_slot[kind] = (slot + 1) % self.max_entries
+
+        matrix = self._matrices.get(kind)
+        if matrix is None:
+            return
+        if matrix.shape[1] != len(embedding):
+            # Cambio de modelo de embedding: se reconstruye en la próxima consulta
+            self._matrices.pop(kind)
+            return
+        if slot >= matrix.shape[0]:
+            grown = np.zeros((min(max(2 * matrix.shape[0], slot + 1), self.max_entries), matrix.shape[1]),
+                             dtype=np.float32)
+            grown[:matrix.shape[0]] = matrix
+            matrix = self._matrices[kind] = grown
+        matrix[slot] = embedding
+
+    def remember(self, kind: str, embedding: List[float], result, fingerprint: str,
+                 alert_data: Optional[dict] = None):
+        embedding = _normalize(embedding)
+        alert = alert_fields(alert_data or {})
+        now = time.time()
+        with self._lock, self._conn:
+            cursor = self._conn.execute(
+                "INSERT INTO analysed_alerts (kind, catalog_fingerprint, embedding, result, alert, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (kind, fingerprint, json.dumps(embedding), json.dumps(result), json.dumps(alert), now)
+            )
+            # Poda por tipo: el id global mezcla tipos (un "soar" no debe borrar un "report")
+            self._conn.execute(
+                "DELETE FROM analysed_alerts WHERE kind = ? AND id < (SELECT id FROM analysed_alerts "
+                "WHERE kind = ? ORDER BY id DESC LIMIT 1 OFFSET ?)", (kind, kind, self.max_entries - 1)
+            )
+            self._add(cursor.lastrowid, kind, fingerprint, embedding, result, alert, now)
+
+    def nearest(self, kind: str, embedding: List[float], fingerprint: str,
+                max_age_seconds: float) -> Optional[Dict]:
+        """Vecino más similar del mismo catálogo y no caducado → {"id", "similarity", "result", "alert"}"""
+        query = _normalize(embedding)
+        with self._lock:
+            entries = list(self._entries.get(kind, []))
+            if entries and np is not None:
+                matrix = self._matrices.get(kind)
+                if matrix is None:
+                    matrix = self._matrices[kind] = np.asarray([e["embedding"] for e in entries], dtype=np.float32)
+                # Bajo el lock: remember() actualiza filas de la matriz en su sitio
+                scores = matrix[:len(entries)] @ np.asarray(query, dtype=np.float32)
+        if not entries:
+            return None
+
+        if np is not None:
+            candidates = np.argsort(-scores)[:KNN_CANDIDATES].tolist()
+            scores = scores.tolist()
+        else:
+            scores = [sum(a * b for a, b in zip(e["embedding"], query)) for e in entries]
+            candidates = sorted(range(len(entries)), key=lambda i: -scores[i])[:KNN_CANDIDATES]
+
+        oldest = time.time() - max_age_seconds
+        for i in candidates:
+            entry = entries[i]
+            if entry["fingerprint"] == fingerprint and entry["created_at"] >= oldest:
+                return {"id": entry["id"], "similarity": scores[i], "result": entry["result"],
+                        "alert": entry["alert"]}
+        return None
+
+    def size(self) -> Dict[str, int]:
+        with self._lock:
+            return {kind: len(entries) for kind, entries in self._entries.items()}
+
+
+class TriageClassifier:
+    """Reglas (sin coste) y, si no deciden, kNN sobre análisis previos"""
+
+    def __init__(self, memory: AnalysisMemory, llm_level: int = 12, min_level: int = 5,
+                 always_llm_rules: frozenset = frozenset(), mapping_only_rules: frozenset = frozenset(),
+                 reuse_similarity: float = 0.95, max_age_seconds: float = 86400,
+                 log_path: Optional[str] = None, log_max_bytes: int = 50 * 1024 * 1024):
+        self.memory = memory
+        self.llm_level = llm_level
+        self.min_level = min_level
+        self.always_llm_rules = always_llm_rules
+        self.mapping_only_rules = mapping_only_rules
+        self.reuse_similarity = reuse_similarity
+        self.max_age_seconds = max_age_seconds
+        self.log_path = log_path
+        self.log_max_bytes = log_max_bytes
+        self._log_lock = threading.Lock()
+        self._log_file = None
+
+    def rule_decision(self, alert_data: dict) -> Optional[Dict]:
+        rule_id = str(alert_data.get('rule_id') or '')
+        level = alert_priority(alert_data)
+        if rule_id in self.always_llm_rules:
+            return {"route": ROUTE_LLM, "reason": "rule_always_llm"}
+        if level >= self.llm_level:
+            return {"route": ROUTE_LLM, "reason": "level_critical"}
+        if rule_id in self.mapping_only_rules:
+            return {"route": ROUTE_MAPPING_ONLY, "reason": "rule_mapping_only"}
+        if level < self.min_level:
+            return {"route": ROUTE_MAPPING_ONLY, "reason": "level_low"}
+        return None
+
+    def knn_decision(self, kind: str, embedding: List[float], fingerprint: str,
+                     alert_data: Optional[dict] = None) -> Dict:
+        """kNN sobre la memoria; el análisis reutilizado se adapta a alert_data"""
+        neighbor = self.memory.nearest(kind, embedding, fingerprint, self.max_age_seconds)
+        decision = {"route": ROUTE_LLM, "reason": "novel", "embedding": embedding}
+        if neighbor is None:
+            return decision
+        decision["similarity"] = round(neighbor["similarity"], 4)
+        decision["neighbor_id"] = neighbor["id"]
+        if neighbor["similarity"] >= self.reuse_similarity:
+            result = render_for_alert(neighbor["result"], neighbor["alert"], alert_data or {})
+            decision.update(route=ROUTE_CACHED, reason="knn_similar", result=result)
+        return decision
+
+    def classify(self, alert_data: dict, kind: str, fingerprint: str,
+                 embed: Callable[[], List[float]]) -> Dict:
+        """Decisión completa; embed sólo se llama si las reglas no deciden"""
+        decision = self.rule_decision(alert_data) or self.knn_decision(kind, embed(), fingerprint, alert_data)
+        self.log(alert_data, kind, decision)
+        return decision
+
+    def _log_handle(self):
+        """Abre el JSONL al primer uso y lo rota a .1 al superar log_max_bytes (llamado con _log_lock)"""
+        try:
+            current = os.stat(self.log_path)
+        except FileNotFoundError:
+            current = None
+        if self._log_file is not None and (current is None or
+                                           os.fstat(self._log_file.fileno()).st_ino != current.st_ino):
+            # Otro worker ya lo rotó
+            self._log_file.close()
+            self._log_file = None
+        elif current is not None and current.st_size >= self.log_max_bytes:
+            os.replace(self.log_path, f"{self.log_path}.1")
+            if self._log_file is not None:
+                self._log_file.close()
+                self._log_file = None
+        if self._log_file is None:
+            self._log_file = open(self.log_path, "a", buffering=1)
+        return self._log_file
+
+    def log(self, alert_data: dict, kind: str, decision: Dict):
+        if not self.log_path:
+            return
+        line = json.dumps({
+            "ts": datetime.now().isoformat(),
+            "kind": kind,
+            "rule_id": alert_data.get('rule_id'),
+            "rule_level": alert_data.get('rule_level'),
+            "mitre_id": alert_data.get('mitre_id'),
+            "agent_name": alert_data.get('agent_name'),
+            "route": decision["route"],
+            "reason": decision["reason"],
+            "similarity": decision.get("similarity"),
+            "neighbor_id": decision.get("neighbor_id")
+        })
+        with self._log_lock:
+            self._log_handle().write(line + "\n")
+
+
+def public_decision(decision: Dict) -> Dict:
+    """Campos expuestos en la respuesta de la API"""
+    return {k: decision[k] for k in ("route", "reason", "similarity") if k in decision}
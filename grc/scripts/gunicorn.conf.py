@@ -0,0 +1,38 @@
+"""
+Gunicorn - Entry point de producción para la GRC API
+
+    cd grc/scripts && gunicorn -c gunicorn.conf.py grc_api:app
+
+Cada worker mapea el mismo snapshot del catálogo (GRC_SNAPSHOT_PATH); un reindexado
+que sustituye el archivo se recoge sin reiniciar. La cola LLM es por worker: la
+concurrencia total hacia Ollama es GRC_WORKERS × GRC_LLM_MAX_CONCURRENCY.
+/metrics también es por worker: cada serie lleva worker=<pid> y Prometheus agrega
+con sum without (worker) sobre los scrapes de todos los workers.
+"""
+
+import multiprocessing
+import os
+
+bind = os.getenv('GRC_BIND', '0.0.0.0:5000')
+workers = int(os.getenv('GRC_WORKERS', multiprocessing.cpu_count()))
+worker_class = 'gthread'
+threads = int(os.getenv('GRC_THREADS', 8))
+timeout = int(os.getenv('GRC_WORKER_TIMEOUT', 180))
+graceful_timeout = 30
+keepalive = 5
+# Sin preload: los hilos de fondo (cola LLM, keep-alive) deben crearse dentro de cada worker
+preload_app = False
+accesslog = '-'
+
+
+def on_starting(server):
+    """Una sola vez en el master: devuelve a la cola los jobs interrumpidos"""
+    from grc_jobs import JobStore
+    requeued = JobStore(os.getenv('GRC_JOBS_DB', 'grc_jobs.db')).requeue_interrupted()
+    if requeued:
+        server.log.info("%d jobs de reporte reencolados", requeued)
+
+
+def post_worker_init(worker):
+    import grc_api
+    grc_api.start_background_services(requeue_interrupted=False)
@@ -4,14 +4,19 @@ GRC Controls Indexer - ISO 27001:2022 & NIST 800-53 Rev5
 Indexa controles de cumplimiento en Qdrant para RAG
 """
 
+import os
 import requests
 import json
 from datetime import datetime
+from typing import Optional
+
+from grc_snapshot import write_snapshot
 
 QDRANT_URL = "http://localhost:6333"
 OLLAMA_URL = "http://localhost:11434"
 COLLECTION_NAME = "grc_controls"
 EMBED_MODEL = "nomic-embed-text"
+SNAPSHOT_PATH = os.getenv('GRC_SNAPSHOT_PATH', 'grc_catalog.snap')
 
 # ═══════════════════════════════════════════════════════════════
 # ISO 27001:2022 - 93 Controles (4 categorías)
@@ -1017,10 +1022,17 @@ def create_collection():
         }
     )
     print(f"✅ Colección {COLLECTION_NAME} creada")
+    
+    # Índice de payload: búsquedas top-k filtradas por framework sin recorrer toda la colección
+    requests.put(
+        f"{QDRANT_URL}/collections/{COLLECTION_NAME}/index",
+        json={"field_name": "framework", "field_schema": "keyword"}
+    )
+    print("✅ Índice de payload 'framework' creado")
 
 
-def index_controls(controls: list, framework: str):
-    """Indexa controles en Qdrant"""
+def index_controls(controls: list, framework: str) -> Optional[list]:
+    """Indexa controles en Qdrant y devuelve los puntos (para el snapshot local); None si el upsert falla"""
     points = []
     
     for i, control in enumerate(controls):
@@ -1068,10 +1080,11 @@ def index_controls(controls: list, framework: str):
         json={"points": points}
     )
     
-    if response.status_code == 200:
-        print(f"✅ {len(points)} controles {framework} indexados")
-    else:
+    if response.status_code != 200:
         print(f"❌ Error indexando: {response.text}")
+        return None
+    print(f"✅ {len(points)} controles {framework} indexados")
+    return points
 
 
 def search_controls(query: str, limit: int = 5) -> list:
@@ -1154,12 +1167,22 @@ def main():
     
     # Indexar ISO 27001
     print(f"📋 Indexando {len(ISO_27001_CONTROLS)} controles ISO 27001:2022...")
-    index_controls(ISO_27001_CONTROLS, "ISO")
+    iso_points = index_controls(ISO_27001_CONTROLS, "ISO")
     print()
     
     # Indexar NIST 800-53
     print(f"📋 Indexando {len(NIST_800_53_CONTROLS)} controles NIST 800-53...")
-    index_controls(NIST_800_53_CONTROLS, "NIST")
+    nist_points = index_controls(NIST_800_53_CONTROLS, "NIST")
+    print()
+    
+    # Snapshot mapeado en memoria para los workers de la API (sustitución atómica).
+    # Sólo tras un upsert completo: si no, los workers seguirían con vectores que Qdrant no tiene
+    if iso_points is None or nist_points is None:
+        print(f"⚠️  Upsert incompleto: no se publica el snapshot ({SNAPSHOT_PATH} sigue vigente)")
+    else:
+        points = iso_points + nist_points
+        write_snapshot(SNAPSHOT_PATH, [p["payload"] for p in points], [p["vector"] for p in points], EMBED_MODEL)
+        print(f"💾 Snapshot del catálogo publicado en {SNAPSHOT_PATH}")
     print()
     
     # Test de búsqueda
@@ -0,0 +1,9 @@
+"""Los módulos de grc/scripts y cti_fetcher se importan como planos (igual que en producción)"""
+
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for path in (os.path.join(ROOT, "grc", "scripts"), os.path.join(ROOT, "cti_fetcher")):
+    if path not in sys.path:
+        sys.path.insert(0, path)
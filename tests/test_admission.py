@@ -0,0 +1,45 @@
+import threading
+
+import pytest
+
+from grc_admission import LLMOverloadedError, LLMWorkQueue
+
+
+def blocked_queue(**kwargs):
+    """Cola con su único worker ocupado hasta release.set()"""
+    queue = LLMWorkQueue(max_concurrency=1, **kwargs)
+    release, started = threading.Event(), threading.Event()
+    queue.submit(15, lambda: (started.set(), release.wait()), sheddable=False)
+    started.wait(5)
+    return queue, release
+
+
+def test_background_work_does_not_shed_sync_alerts():
+    queue, release = blocked_queue(max_queue=4, shed_depth=2, shed_below_level=12)
+    try:
+        for _ in range(10):
+            queue.submit(5, lambda: None, sheddable=False)
+        # Ninguna alerta síncrona en cola: una de nivel bajo entra
+        queue.submit(3, lambda: None)
+        queue.submit(3, lambda: None)
+        with pytest.raises(LLMOverloadedError):
+            queue.submit(3, lambda: None)
+        # Una severa sigue entrando hasta max_queue descartables
+        queue.submit(13, lambda: None)
+        queue.submit(13, lambda: None)
+        assert queue.status()["shed"] == 1
+    finally:
+        release.set()
+
+
+def test_full_queue_evicts_least_severe_sheddable():
+    queue, release = blocked_queue(max_queue=2, shed_depth=10)
+    try:
+        low = queue.submit(3, lambda: None)
+        queue.submit(8, lambda: None)
+        queue.submit(10, lambda: None)
+        with pytest.raises(LLMOverloadedError):
+            low.result(timeout=1)
+        assert queue.status()["evicted"] == 1
+    finally:
+        release.set()
@@ -0,0 +1,78 @@
+from grc_aggregation import AlertAggregator
+from grc_incidents import IncidentStore
+
+
+def alert(rule_id="5710", agent="web-01", level=5, srcip="10.0.0.1"):
+    return {"rule_id": rule_id, "agent_name": agent, "rule_level": level, "srcip": srcip,
+            "rule_description": "sshd: authentication failed", "mitre_id": ["T1110"]}
+
+
+def test_group_closes_after_window_on_event_time():
+    aggregator = AlertAggregator(window_seconds=60, max_open_seconds=600)
+    for i, at in enumerate((1000, 1030, 1080)):
+        aggregator.add(alert(srcip=f"10.0.0.{i}"), at=at, offset=i * 10)
+    assert aggregator.flush_due(now=1139) == []
+
+    [incident] = aggregator.flush_due(now=1140)
+    assert incident["count"] == 3
+    assert incident["flush_reason"] == "window"
+    assert incident["sources"] == ["10.0.0.0", "10.0.0.1", "10.0.0.2"]
+    assert incident["offset"] == 0
+    assert aggregator.groups == {}
+
+
+def test_continuous_campaign_closes_at_max_age():
+    aggregator = AlertAggregator(window_seconds=60, max_open_seconds=300)
+    for at in range(1000, 1301, 30):
+        aggregator.add(alert(), at=at)
+    [incident] = aggregator.flush_due(now=1310)
+    assert incident["flush_reason"] == "max_age"
+    assert incident["count"] == 11
+
+
+def test_non_numeric_level_does_not_break_grouping():
+    aggregator = AlertAggregator()
+    aggregator.add(alert(level="high"), at=0)
+    aggregator.add(alert(level="12"), at=1)
+    [incident] = aggregator.flush_all()
+    assert incident["count"] == 2
+    assert incident["alert"]["rule_level"] == 12
+
+
+def test_low_watermark_holds_until_incident_done():
+    aggregator = AlertAggregator(window_seconds=60)
+    aggregator.add(alert(agent="a"), at=0, offset=100)
+    aggregator.add(alert(agent="b"), at=50, offset=200)
+    assert aggregator.low_watermark() == 100
+
+    [incident] = aggregator.flush_due(now=61)
+    assert aggregator.low_watermark() == 100
+    aggregator.done(incident["incident_id"])
+    assert aggregator.low_watermark() == 200
+    aggregator.done(aggregator.flush_all()[0]["incident_id"])
+    assert aggregator.low_watermark() is None
+
+
+def test_capacity_eviction_is_delivered_on_next_flush():
+    aggregator = AlertAggregator(max_groups=1)
+    aggregator.add(alert(agent="a"), at=0)
+    aggregator.add(alert(agent="b"), at=1)
+    [incident] = aggregator.flush_due(now=2)
+    assert incident["flush_reason"] == "capacity"
+    assert incident["key"]["agent_name"] == "a"
+
+
+def test_incident_store_keeps_history_and_snapshots(tmp_path):
+    path = str(tmp_path / "incidents.db")
+    store = IncidentStore(path, history=3)
+    for i in range(5):
+        store.add({"incident": {"incident_id": f"i{i}"}})
+    # Otro worker lee lo mismo desde su propia conexión
+    reader = IncidentStore(path, history=3)
+    assert [r["incident"]["incident_id"] for r in reader.recent(10)] == ["i4", "i3", "i2"]
+    assert reader.snapshot("aggregation") is None
+
+    store.publish("aggregation", {"open_groups": [{"count": 2}]})
+    snapshot = reader.snapshot("aggregation")
+    assert snapshot["open_groups"] == [{"count": 2}]
+    assert "updated_at" in snapshot
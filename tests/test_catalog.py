@@ -0,0 +1,78 @@
+from grc_catalog import CROSSWALK_MAX_HOPS, CrosswalkIndex, GapIndex, load_controls
+
+
+def control(control_id, nist=(), iso=(), mitre=(), family="Access Control"):
+    framework = "ISO 27001" if control_id.startswith("ISO-") else "NIST 800-53"
+    key = "category" if framework == "ISO 27001" else "family"
+    return {"id": control_id, "name": control_id, "framework": framework, key: family,
+            "nist_mapping": list(nist), "iso_mapping": list(iso), "mitre_mapping": list(mitre)}
+
+
+# Cadena ISO-A.1 ↔ NIST-X-1 ↔ ISO-A.2 ↔ NIST-X-2 ↔ ISO-A.3
+CHAIN = [
+    control("ISO-A.1", nist=["X-1"], mitre=["T1110"]),
+    control("NIST-X-1", iso=["A.2"]),
+    control("ISO-A.2", nist=["X-2"]),
+    control("NIST-X-2", iso=["A.3"], mitre=["t1078"]),
+    control("ISO-A.3", family="Other"),
+]
+
+
+def test_closure_is_capped_at_max_hops():
+    index = CrosswalkIndex(CHAIN, max_hops=2)
+    assert index.equivalent_ids("ISO-A.1") == ["NIST-X-1", "ISO-A.2"]
+    assert index.equivalent_ids("ISO-A.1", max_hops=1) == ["NIST-X-1"]
+    # Por distancia y luego por ID
+    assert index.equivalent_ids("ISO-A.2") == ["NIST-X-1", "NIST-X-2", "ISO-A.1", "ISO-A.3"]
+    assert index.equivalent_ids("NIST-UNKNOWN") == []
+
+
+def test_lookup_control_and_technique():
+    index = CrosswalkIndex(CHAIN)
+    result = index.lookup("a.1", max_hops=2)
+    assert result["type"] == "control"
+    assert [e["id"] for e in result["direct_equivalents"]] == ["NIST-X-1"]
+    assert [(e["id"], e["hops"]) for e in result["equivalents"]] == [("NIST-X-1", 1), ("ISO-A.2", 2)]
+    assert result["direct_techniques"] == ["T1110"]
+
+    technique = index.lookup("t1078")
+    assert technique["type"] == "technique"
+    assert [c["id"] for c in technique["controls"]] == ["NIST-X-2"]
+    assert {(c["id"], c["via"]) for c in technique["equivalent_controls"]} == {
+        ("ISO-A.2", "NIST-X-2"), ("ISO-A.3", "NIST-X-2")}
+    # Las técnicas no son equivalencias: ISO-A.1 y NIST-X-2 no se enlazan por ATT&CK
+    assert "NIST-X-2" not in index.equivalent_ids("ISO-A.1")
+    assert index.lookup("NIST-ZZ-9") is None
+
+
+def test_real_catalog_closure_stays_bounded():
+    stats = CrosswalkIndex(load_controls()).stats()
+    assert stats["max_hops"] == CROSSWALK_MAX_HOPS
+    assert stats["largest_closure"] == 12
+    assert stats["controls_in_catalog"] == len(load_controls())
+
+
+def test_gap_analysis_credits_direct_equivalents_only():
+    index = GapIndex(CHAIN, CrosswalkIndex(CHAIN))
+    implemented, unknown = index.mask_of(["ISO-A.1", "ISO-Z.9"])
+    assert unknown == ["ISO-Z.9"]
+
+    plain = index.analyze(implemented)
+    assert plain["summary"] == {"total_controls": 5, "implemented": 1, "credited": 0, "covered": 1,
+                                "gaps": 4, "compliance_percentage": 20.0}
+
+    credited = index.analyze(implemented, credit_equivalents=True)
+    # CREDIT_MAX_HOPS = 1: NIST-X-1 sí, ISO-A.2 (2 saltos) no
+    assert credited["credited_controls"] == ["NIST-X-1"]
+    assert credited["summary"]["covered"] == 2
+    assert credited["by_framework"]["NIST 800-53"]["credited"] == 1
+    assert credited["missing_controls"] == ["ISO-A.2", "NIST-X-2", "ISO-A.3"]
+
+
+def test_gap_masks_groups_and_pagination():
+    index = GapIndex(CHAIN)
+    mask, _ = index.mask_of(["ISO-A.3"])
+    result = index.analyze(mask, offset=1, limit=2)
+    assert result["missing_controls"] == ["NIST-X-1", "ISO-A.2"]
+    assert result["by_framework"]["ISO 27001"]["groups"]["Other"]["gaps"] == 0
+    assert index.ids_of(index.all_mask) == [c["id"] for c in CHAIN]
@@ -0,0 +1,131 @@
+import json
+import urllib.error
+import urllib.request
+from datetime import datetime, timedelta
+
+import pytest
+
+import cti_api
+import cti_fetcher
+from cve_store import CveStore
+
+
+def nvd_cve(i: int, published: str = "2024-01-01T00:00:00.000") -> dict:
+    return {"cve": {"id": f"CVE-2024-{i:05d}", "published": published, "lastModified": published,
+                    "descriptions": [{"lang": "en", "value": f"cve {i}"}], "metrics": {}}}
+
+
+class FakeNvd:
+    """nvd_get falso: catálogo paginado, falla a partir de fail_at (una vez)"""
+
+    def __init__(self, total: int, fail_at=None):
+        self.cves = [nvd_cve(i, f"2024-01-{1 + i % 28:02d}T00:00:00.000") for i in range(total)]
+        self.fail_at = fail_at
+        self.calls = []
+
+    def __call__(self, params):
+        self.calls.append(dict(params))
+        start, size = params['startIndex'], params['resultsPerPage']
+        if self.fail_at is not None and start >= self.fail_at:
+            self.fail_at = None
+            raise RuntimeError("NVD unavailable")
+        return {"totalResults": len(self.cves), "vulnerabilities": self.cves[start:start + size]}
+
+
+@pytest.fixture
+def nvd(monkeypatch):
+    monkeypatch.setattr(cti_fetcher, "NVD_PAGE_SIZE", 5)
+    monkeypatch.setattr(cti_fetcher, "NVD_PAGE_DELAY", 0)
+    monkeypatch.setattr(cti_fetcher, "NVD_EMBED_LIMIT", 3)
+
+    def install(fake):
+        monkeypatch.setattr(cti_fetcher, "nvd_get", fake)
+        return fake
+    return install
+
+
+def test_bootstrap_pages_full_catalog_and_resumes(tmp_path, nvd):
+    store = CveStore(str(tmp_path / "cves.db"))
+    fake = nvd(FakeNvd(23, fail_at=10))
+
+    cti_fetcher.fetch_nvd_cves(store)
+    assert store.get_watermark('nvd_last_modified') is None
+    assert json.loads(store.get_watermark('nvd_bootstrap'))["index"] == 10
+
+    fake.calls.clear()
+    docs = cti_fetcher.fetch_nvd_cves(store)
+    assert [c['startIndex'] for c in fake.calls] == [10, 15, 20]
+    assert not any('lastModStartDate' in c for c in fake.calls)
+    assert store.stats()["cves"] == 23
+    # Las incrementales empiezan donde empezó el bootstrap
+    started = json.loads(store.get_watermark('nvd_bootstrap'))["started"]
+    assert store.get_watermark('nvd_last_modified') == started
+    # Sólo los NVD_EMBED_LIMIT más recientes por published
+    assert len(docs) == 3
+    assert docs[0]['metadata']['cve_id'] == store.query(limit=1)["results"][0]["cve_id"]
+
+
+def test_incremental_sync_uses_contiguous_120_day_windows(tmp_path, nvd):
+    store = CveStore(str(tmp_path / "cves.db"))
+    start = datetime.utcnow() - timedelta(days=300)
+    store.set_watermark('nvd_last_modified', start.strftime(cti_fetcher.NVD_DATE_FORMAT))
+    fake = nvd(FakeNvd(2))
+
+    cti_fetcher.fetch_nvd_cves(store)
+    windows = [(c['lastModStartDate'], c['lastModEndDate']) for c in fake.calls]
+    assert len(windows) == 3
+    assert windows[0][0] == start.strftime(cti_fetcher.NVD_DATE_FORMAT)
+    for (_, end), (next_start, _) in zip(windows, windows[1:]):
+        assert end == next_start
+    fmt = cti_fetcher.NVD_DATE_FORMAT
+    assert all(datetime.strptime(e, fmt) - datetime.strptime(s, fmt) <= timedelta(days=120) for s, e in windows)
+    assert store.get_watermark('nvd_last_modified') == windows[-1][1]
+
+
+def test_failed_incremental_sync_keeps_watermark(tmp_path, nvd):
+    store = CveStore(str(tmp_path / "cves.db"))
+    store.set_watermark('nvd_last_modified', "2024-01-01T00:00:00.000")
+    nvd(FakeNvd(12, fail_at=5))
+    cti_fetcher.fetch_nvd_cves(store)
+    assert store.get_watermark('nvd_last_modified') == "2024-01-01T00:00:00.000"
+
+
+def test_newest_cves_keeps_latest_version_and_limit():
+    newest = cti_fetcher.NewestCves(2)
+    for i, published in enumerate(["2024-01-03", "2024-01-01", "2024-01-05", "2024-01-04"]):
+        newest.add({"cve_id": f"CVE-{i}", "published": published, "severity": "LOW", "score": 1,
+                    "description": "v1"})
+    newest.add({"cve_id": "CVE-2", "published": "2024-01-05", "severity": "HIGH", "score": 9, "description": "v2"})
+    assert [d['metadata']['cve_id'] for d in newest.documents()] == ["CVE-2", "CVE-3"]
+    assert newest.documents()[0]['metadata']['severity'] == "HIGH"
+    assert newest.seen == 5
+
+
+@pytest.fixture
+def cve_api(tmp_path, monkeypatch):
+    store = CveStore(str(tmp_path / "cves.db"))
+    from cve_store import parse_nvd_cve
+    store.upsert_many([parse_nvd_cve(nvd_cve(i)["cve"]) for i in range(3)])
+    monkeypatch.setattr(cti_api, "_cve_store", store)
+    server = cti_api.start_api_server(0, "127.0.0.1")
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+
+
+def get(url):
+    try:
+        with urllib.request.urlopen(url, timeout=5) as response:
+            return response.status, json.loads(response.read())
+    except urllib.error.HTTPError as e:
+        return e.code, json.loads(e.read())
+
+
+def test_cve_query_limit_zero_returns_only_total(cve_api):
+    status, body = get(f"{cve_api}/api/cve?limit=0")
+    assert status == 200
+    assert body == {"total": 3, "results": []}
+
+
+@pytest.mark.parametrize("query", ["limit=inf", "offset=1e400", "limit=abc"])
+def test_cve_query_rejects_invalid_numbers(cve_api, query):
+    assert get(f"{cve_api}/api/cve?{query}")[0] == 400
@@ -0,0 +1,151 @@
+import json
+
+from grc_aggregation import AlertAggregator, aggregation_key
+from grc_incidents import IncidentStore
+from grc_ingest_log import IngestLog, LogConsumer
+
+
+def event(agent: str, n: int = 0) -> bytes:
+    return json.dumps({"rule_id": "5710", "agent_name": agent, "rule_level": 5, "n": n}).encode()
+
+
+def test_segments_roll_over_with_contiguous_offsets(tmp_path):
+    log = IngestLog(str(tmp_path), segment_bytes=200, fsync_seconds=0)
+    offsets = [log.append(event("web-01", i), timestamp=1000 + i) for i in range(10)]
+    assert len(log.segments()) > 1
+    assert log.segments()[0] == 0
+    assert set(log.segments()[1:]) <= set(offsets)
+
+    records, end = log.read(0, max_records=100)
+    assert [r[0] for r in records] == offsets
+    assert [json.loads(r[2])["n"] for r in records] == list(range(10))
+    assert end == log.end_offset()
+    # Desde un offset intermedio, cruzando segmentos
+    assert [r[0] for r in log.read(offsets[3], max_records=100)[0]] == offsets[3:]
+
+
+def test_replay_by_time_range_and_retention(tmp_path):
+    log = IngestLog(str(tmp_path), segment_bytes=200, fsync_seconds=0)
+    for i in range(10):
+        log.append(event("web-01", i), timestamp=1000 + i)
+    assert [json.loads(p)["n"] for _, _, p in log.replay(1003, 1006)] == [3, 4, 5, 6]
+
+    first_segments = log.segments()
+    deleted = log.delete_before(first_segments[-1], older_than=2000)
+    assert deleted == len(first_segments) - 1
+    # Un offset ya borrado continúa en el segmento más antiguo que queda
+    records, _ = log.read(0)
+    assert records[0][0] == first_segments[-1]
+
+
+def test_torn_write_is_truncated_on_open(tmp_path):
+    log = IngestLog(str(tmp_path), fsync_seconds=0)
+    log.append(event("web-01"))
+    end = log.end_offset()
+    with open(tmp_path / "00000000000000000000.log", "ab") as f:
+        f.write(b"\x10\x00\x00")
+    assert IngestLog(str(tmp_path)).end_offset() == end
+
+
+def test_checkpoint_stops_at_low_watermark(tmp_path):
+    log = IngestLog(str(tmp_path), fsync_seconds=0)
+    offsets = [log.append(event(f"agent-{i}")) for i in range(5)]
+    held = {"offset": offsets[2]}
+    consumer = LogConsumer(log, "test", lambda *record: None, low_watermark=lambda: held["offset"])
+    assert consumer.poll() == 5
+    assert consumer.position == log.end_offset()
+    assert consumer.committed() == offsets[2]
+
+    held["offset"] = None
+    consumer.poll()
+    assert consumer.committed() == log.end_offset()
+
+
+class Pipeline:
+    """Misma conexión que grc_api: log → consumidor → agregador → análisis → IncidentStore"""
+
+    def __init__(self, tmp_path, analyze: bool = True):
+        self.log = IngestLog(str(tmp_path / "log"), fsync_seconds=0)
+        self.store = IncidentStore(str(tmp_path / "incidents.db"))
+        self.analyze = analyze
+        self.analyzed = []
+        self.aggregator = AlertAggregator(window_seconds=60, on_flush=self.analyze_incident,
+                                          clock=lambda: self.consumer.clock())
+        self.consumer = LogConsumer(self.log, "aggregator", self.consume,
+                                    low_watermark=self.aggregator.low_watermark)
+
+    def consume(self, offset, timestamp, payload):
+        alert_data = json.loads(payload)
+        if self.store.analyzed(list(aggregation_key(alert_data)), offset):
+            return
+        self.aggregator.add(alert_data, at=timestamp, offset=offset)
+
+    def analyze_incident(self, incident):
+        if not self.analyze:
+            return
+        self.analyzed.append(incident)
+        self.store.mark_analyzed(list(aggregation_key(incident["alert"])), incident["offset"],
+                                 incident["last_offset"])
+        self.aggregator.done(incident["incident_id"])
+
+    def flush(self):
+        for incident in self.aggregator.flush_due():
+            self.aggregator._emit(incident)
+
+
+def test_restart_rebuilds_pending_incidents_without_reanalyzing_closed_ones(tmp_path):
+    first = Pipeline(tmp_path)
+    for i in range(3):
+        first.log.append(event("closed", i), timestamp=1000 + i)
+    for i in range(2):
+        first.log.append(event("open", i), timestamp=1100 + i)
+    first.consumer.poll()
+    # Cierra "closed" por el tiempo de los eventos (el consumidor va al día a tiempo real)
+    for incident in first.aggregator.flush_due(now=1070):
+        first.aggregator._emit(incident)
+    first.consumer.checkpoint()
+    assert [i["key"]["agent_name"] for i in first.analyzed] == ["closed"]
+    closed_id = first.analyzed[0]["incident_id"]
+    # El checkpoint no pasa del primer evento del grupo abierto
+    assert first.consumer.committed() == first.aggregator.low_watermark()
+
+    # Caída: otro proceso relee desde el checkpoint
+    second = Pipeline(tmp_path)
+    second.consumer.poll()
+    assert list(second.aggregator.groups) == [aggregation_key(json.loads(event("open")))]
+    second.flush()
+    [incident] = second.analyzed
+    assert incident["key"]["agent_name"] == "open"
+    assert incident["count"] == 2
+    assert incident["first_seen"] == first.aggregator.open_groups()[0]["first_seen"]
+    assert incident["incident_id"] != closed_id
+
+
+def test_restart_before_analysis_finishes_reanalyzes(tmp_path):
+    first = Pipeline(tmp_path, analyze=False)
+    for i in range(3):
+        first.log.append(event("web-01", i), timestamp=1000 + i)
+    first.consumer.poll()
+    first.aggregator.flush_due(now=1100)
+    first.consumer.checkpoint()
+    assert first.consumer.committed() == 0
+
+    second = Pipeline(tmp_path)
+    second.consumer.poll()
+    second.flush()
+    assert [i["count"] for i in second.analyzed] == [3]
+
+
+def test_lagging_consumer_closes_windows_on_event_time(tmp_path):
+    pipeline = Pipeline(tmp_path)
+    pipeline.consumer.batch_size = 2
+    for i in range(4):
+        # Eventos separados 30 s: dentro de la ventana de 60 s, un solo incidente
+        pipeline.log.append(event("web-01", i), timestamp=1000 + 30 * i)
+    pipeline.consumer.poll()
+    assert pipeline.consumer.lagging
+    pipeline.flush()
+    pipeline.consumer.poll()
+    assert not pipeline.consumer.lagging
+    pipeline.flush()
+    assert [i["count"] for i in pipeline.analyzed] == [4]
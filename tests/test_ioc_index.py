@@ -0,0 +1,72 @@
+import hashlib
+import os
+
+from ioc_index import IocIndex, IocIndexHolder, parse_sha256, update_index, write_index
+
+
+def sha(i: int) -> str:
+    return hashlib.sha256(str(i).encode()).hexdigest()
+
+
+def test_parse_sha256():
+    assert parse_sha256(" " + sha(1).upper() + " ") == bytes.fromhex(sha(1))
+    assert parse_sha256("abc") is None
+    assert parse_sha256(None) is None
+
+
+def test_lookup_is_exact_and_bloom_rejects_most_misses(tmp_path):
+    path = str(tmp_path / "ioc.idx")
+    write_index(path, {parse_sha256(sha(i)): f"Family{i % 3}" for i in range(2000)})
+    index = IocIndex(path)
+    assert index.count == 2000
+    assert all(index.lookup(parse_sha256(sha(i))) == (True, f"Family{i % 3}") for i in range(0, 2000, 7))
+
+    misses = [parse_sha256(sha(i)) for i in range(2000, 12000)]
+    assert not any(index.lookup(d)[0] for d in misses)
+    # ~1% con 10 bits por entrada: el mmap de registros sólo se toca en los falsos positivos
+    false_positives = sum(index._maybe_contains(d) for d in misses)
+    assert false_positives < 300
+
+
+def test_empty_index(tmp_path):
+    path = str(tmp_path / "ioc.idx")
+    write_index(path, {})
+    assert IocIndex(path).lookup(parse_sha256(sha(1))) == (False, None)
+
+
+def test_update_merges_and_keeps_known_signatures(tmp_path):
+    path = str(tmp_path / "ioc.idx")
+    assert update_index(path, [(sha(1), "Emotet"), (sha(2), None), ("not-a-hash", "X")]) == (2, 2)
+    assert update_index(path, [(sha(1), None), (sha(3), "Qakbot")]) == (3, 1)
+    index = IocIndex(path)
+    assert index.lookup(parse_sha256(sha(1))) == (True, "Emotet")
+    assert index.lookup(parse_sha256(sha(2))) == (True, None)
+    assert index.lookup(parse_sha256(sha(3))) == (True, "Qakbot")
+
+
+def test_atomic_rewrite_and_holder_reload(tmp_path):
+    path = str(tmp_path / "ioc.idx")
+    holder = IocIndexHolder(path, check_interval=0)
+    assert holder.get() is None
+    update_index(path, [(sha(1), "Emotet")])
+    old = holder.get()
+    assert old.lookup(parse_sha256(sha(1)))[0]
+
+    update_index(path, [(sha(2), "Qakbot")])
+    assert os.listdir(tmp_path) == ["ioc.idx"]
+    new = holder.get()
+    assert new is not old and new.count == 2
+    # Quien aún tenga el índice anterior sigue leyendo su mmap (rename, no sobrescritura)
+    assert old.lookup(parse_sha256(sha(1))) == (True, "Emotet")
+    assert not old.lookup(parse_sha256(sha(2)))[0]
+
+
+def test_holder_keeps_current_index_when_new_file_is_invalid(tmp_path):
+    path = str(tmp_path / "ioc.idx")
+    update_index(path, [(sha(1), "Emotet")])
+    holder = IocIndexHolder(path, check_interval=0)
+    current = holder.get()
+    with open(path + ".new", "wb") as f:
+        f.write(b"garbage" * 20)
+    os.replace(path + ".new", path)
+    assert holder.get() is current
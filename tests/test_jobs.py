@@ -0,0 +1,38 @@
+import sqlite3
+import time
+
+from grc_jobs import JobStore, ReportJobQueue, job_to_response
+
+
+def wait_done(store, job_id, timeout=5):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        job = store.get(job_id)
+        if job["status"] in ("completed", "failed"):
+            return job
+        time.sleep(0.01)
+    raise AssertionError(f"job {job_id} sin terminar")
+
+
+def test_job_records_template_fallback_source(tmp_path):
+    store = JobStore(str(tmp_path / "jobs.db"))
+    queue = ReportJobQueue(store, lambda alert, controls: {"report": "plantilla", "source": "template",
+                                                           "status": "circuit_open"})
+    job = wait_done(store, queue.submit({"rule_description": "x"}, [], {}))
+    response = job_to_response(job)
+    assert response["status"] == "completed"
+    assert response["report_source"] == "template"
+    assert response["report_status"] == "circuit_open"
+
+
+def test_existing_jobs_table_is_migrated(tmp_path):
+    path = str(tmp_path / "jobs.db")
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE jobs (id TEXT PRIMARY KEY, status TEXT NOT NULL, alert TEXT NOT NULL, "
+                 "controls TEXT NOT NULL, compliance_mapping TEXT NOT NULL, callback_url TEXT, report TEXT, "
+                 "error TEXT, callback_status TEXT, created_at TEXT NOT NULL, updated_at TEXT NOT NULL)")
+    conn.commit()
+    conn.close()
+    store = JobStore(path)
+    queue = ReportJobQueue(store, lambda alert, controls: {"report": "r", "source": "llm", "status": "generated"})
+    assert wait_done(store, queue.submit({}, [], {}))["report_source"] == "llm"
@@ -0,0 +1,134 @@
+import html
+
+from grc_notify import TELEGRAM_MAX_CHARS, TelegramDispatcher, truncate_html
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class FakeClient:
+    """Respuestas programadas de sendMessage (ok por defecto)"""
+
+    def __init__(self, *results):
+        self.results = list(results)
+        self.sent = []
+
+    def send_message(self, chat_id, text):
+        self.sent.append((chat_id, text))
+        return self.results.pop(0) if self.results else {"ok": True, "retry_after": None, "error": None}
+
+
+def dispatcher(client, clock, **kwargs):
+    return TelegramDispatcher(client, "chat", rate_per_chat=1, burst=1, global_rate=30,
+                              digest_below_level=10, clock=clock, **kwargs)
+
+
+def step(notifier: TelegramDispatcher) -> bool:
+    """Una iteración del hilo de envío, sin hilo ni esperas"""
+    now = notifier.clock()
+    notifier._flush_digests(now)
+    chat_id, item = notifier._next_ready(now)
+    if chat_id is None:
+        return False
+    notifier._send(chat_id, item)
+    return True
+
+
+def test_high_severity_first_and_rate_limited_per_chat():
+    clock, client = FakeClock(), FakeClient()
+    notifier = dispatcher(client, clock)
+    notifier.notify("medio", 10)
+    notifier.notify("crítico", 14)
+    assert step(notifier) and not step(notifier)
+    clock.now += 1
+    assert step(notifier)
+    assert [text for _, text in client.sent] == ["crítico", "medio"]
+    assert notifier.status()["latency_ms_max"] == 1000.0
+
+
+def test_429_pauses_chat_and_retries_until_max_retries():
+    clock = FakeClock()
+    limited = {"ok": False, "retry_after": 5, "error": "Too Many Requests"}
+    client = FakeClient(limited, limited)
+    notifier = dispatcher(client, clock, max_retries=1)
+    notifier.notify("alerta", 12)
+    assert step(notifier)
+    clock.now += 4
+    assert not step(notifier)
+    clock.now += 1
+    assert step(notifier)
+    status = notifier.status()
+    assert (status["rate_limited"], status["retries"], status["dropped"]) == (2, 1, {"rate_limited": 1})
+    assert status["queue_depth"] == 0
+
+
+def test_retry_waiting_on_pause_does_not_expire_early():
+    clock = FakeClock()
+    client = FakeClient({"ok": False, "retry_after": 50, "error": "Too Many Requests"})
+    notifier = dispatcher(client, clock, max_age_seconds=60)
+    notifier.notify("alerta", 12)
+    clock.now += 55
+    assert step(notifier)
+    # Caducidad contada desde el fin de la pausa (1105), no desde el encolado
+    clock.now += 50
+    assert step(notifier)
+    assert client.sent[-1][1] == "alerta"
+    assert notifier.status()["sent"] == 1
+
+
+def test_expiry_sweeps_whole_queue():
+    clock, client = FakeClock(), FakeClient()
+    notifier = dispatcher(client, clock, max_age_seconds=60)
+    notifier.notify("vieja", 10)
+    clock.now += 30
+    notifier.notify("crítica reciente", 14)
+    clock.now += 31
+    # La vieja está al fondo del heap (menor prioridad) y caduca igualmente
+    assert step(notifier)
+    assert notifier.status()["queue_depth"] == 0
+    assert notifier.dropped == {"expired": 1}
+
+
+def test_low_severity_goes_to_periodic_digest():
+    clock, client = FakeClock(), FakeClient()
+    notifier = dispatcher(client, clock, digest_seconds=60)
+    for i in range(3):
+        assert notifier.notify(f"detalle {i}", 5, digest_line=f"línea {i}") == "digested"
+    assert not step(notifier)
+    clock.now += 60
+    assert step(notifier)
+    [(_, text)] = client.sent
+    assert "3 alertas" in text and "línea 2" in text and "detalle" not in text
+
+
+def test_full_queue_drops_lowest_priority():
+    clock, client = FakeClock(), FakeClient()
+    notifier = dispatcher(client, clock, max_queue=2)
+    notifier.notify("a", 10)
+    notifier.notify("b", 11)
+    assert notifier.notify("c", 10) == "dropped"
+    assert notifier.notify("d", 14) == "queued"
+    assert notifier.dropped == {"queue_full": 2}
+
+
+def test_truncate_html_keeps_markup_valid():
+    text = "<b>" + html.escape("a&b<c> " * 2000) + "</b>"
+    cut = truncate_html(text)
+    assert len(cut) <= TELEGRAM_MAX_CHARS
+    assert cut.endswith("…</b>")
+    body = cut[len("<b>"):-len("…</b>")]
+    # Sin entidades a medias
+    assert body.rsplit("&", 1)[-1].split(";")[0] in ("amp", "lt", "gt")
+    assert truncate_html("<i>corto</i>") == "<i>corto</i>"
+
+
+def test_truncate_html_drops_partial_tag():
+    text = "x" * (TELEGRAM_MAX_CHARS - 34) + "<a href='https://example.com'>enlace</a>" + "y" * 100
+    cut = truncate_html(text)
+    assert "<a" not in cut
+    assert cut.endswith("…")
@@ -0,0 +1,87 @@
+import sqlite3
+
+from grc_triage import (
+    ROUTE_CACHED, ROUTE_LLM, ROUTE_MAPPING_ONLY, AnalysisMemory, TriageClassifier, render_for_alert
+)
+
+
+def unit(i: int, dims: int = 4):
+    vector = [0.0] * dims
+    vector[i % dims] = 1.0
+    return vector
+
+
+def test_ring_buffer_keeps_max_entries_per_kind(tmp_path):
+    path = str(tmp_path / "triage.db")
+    memory = AnalysisMemory(path, max_entries=3)
+    for i in range(5):
+        memory.remember("report", unit(i), {"n": i}, "fp")
+    memory.remember("soar", unit(0), {"soar": 0}, "fp")
+    for i in range(3):
+        memory.remember("report", unit(i), {"n": 5 + i}, "fp")
+    assert memory.size() == {"report": 3, "soar": 1}
+
+    # La poda es por tipo: los "report" recientes no borran el único "soar"
+    with sqlite3.connect(path) as conn:
+        counts = dict(conn.execute("SELECT kind, COUNT(*) FROM analysed_alerts GROUP BY kind").fetchall())
+    assert counts == {"report": 3, "soar": 1}
+
+    reloaded = AnalysisMemory(path, max_entries=3)
+    assert reloaded.size() == {"report": 3, "soar": 1}
+    assert reloaded.nearest("soar", unit(0), "fp", 3600)["result"] == {"soar": 0}
+    assert reloaded.nearest("report", unit(1), "fp", 3600)["result"] == {"n": 6}
+
+
+def test_nearest_overwrites_ring_slots_and_filters_catalog(tmp_path):
+    memory = AnalysisMemory(str(tmp_path / "triage.db"), max_entries=2)
+    memory.remember("report", unit(0), "old", "fp")
+    # Primera consulta: construye la matriz; las siguientes la actualizan en su sitio
+    assert memory.nearest("report", unit(0), "fp", 3600)["result"] == "old"
+    memory.remember("report", unit(1), "b", "fp")
+    memory.remember("report", unit(0), "new", "fp")
+    assert memory.nearest("report", unit(0), "fp", 3600)["result"] == "new"
+    assert memory.nearest("report", unit(1), "fp", 3600)["similarity"] > 0.99
+    assert memory.nearest("report", unit(1), "other-catalog", 3600) is None
+    assert memory.nearest("report", unit(1), "fp", -1) is None
+
+
+def test_classifier_rules_then_knn_with_rendering(tmp_path):
+    memory = AnalysisMemory(str(tmp_path / "triage.db"))
+    classifier = TriageClassifier(memory, llm_level=12, min_level=5, mapping_only_rules=frozenset({"100"}),
+                                  reuse_similarity=0.95, log_path=str(tmp_path / "triage.jsonl"))
+    embed_calls = []
+
+    def embed():
+        embed_calls.append(1)
+        return unit(0)
+
+    assert classifier.classify({"rule_level": 13}, "soar", "fp", embed)["reason"] == "level_critical"
+    assert classifier.classify({"rule_level": "high"}, "soar", "fp", embed)["route"] == ROUTE_MAPPING_ONLY
+    assert classifier.classify({"rule_level": 8, "rule_id": "100"}, "soar", "fp", embed)["route"] == ROUTE_MAPPING_ONLY
+    assert embed_calls == []
+
+    assert classifier.classify({"rule_level": 8}, "soar", "fp", embed)["route"] == ROUTE_LLM
+    memory.remember("soar", unit(0), {"summary": "Brute force desde 10.0.0.1 contra web-01"}, "fp",
+                    {"agent_name": "web-01", "srcip": "10.0.0.1"})
+    decision = classifier.classify({"rule_level": 8, "agent_name": "db-02", "srcip": "10.0.0.9"},
+                                   "soar", "fp", embed)
+    assert decision["route"] == ROUTE_CACHED
+    assert decision["result"] == {"summary": "Brute force desde 10.0.0.9 contra db-02"}
+    assert len((tmp_path / "triage.jsonl").read_text().splitlines()) == 5
+
+
+def test_render_for_alert_replaces_whole_tokens_only():
+    previous = {"srcip": "10.0.0.1", "agent_name": "web"}
+    current = {"srcip": "10.0.0.2", "agent_name": "db"}
+    rendered = render_for_alert(["10.0.0.1 y 10.0.0.10 en web (web-01)"], previous, current)
+    assert rendered == ["10.0.0.2 y 10.0.0.10 en db (web-01)"]
+
+
+def test_log_rotates_at_max_bytes(tmp_path):
+    log_path = tmp_path / "triage.jsonl"
+    classifier = TriageClassifier(AnalysisMemory(str(tmp_path / "triage.db")),
+                                  log_path=str(log_path), log_max_bytes=300)
+    for _ in range(5):
+        classifier.classify({"rule_level": 1}, "soar", "fp", lambda: unit(0))
+    assert (tmp_path / "triage.jsonl.1").exists()
+    assert log_path.stat().st_size < 300